@@ -9,7 +9,7 @@
 
 
 import sys
-from collections import defaultdict
+from collections import defaultdict, Counter
 import logging
 log = logging.getLogger("zen.ApplyDataMap")
 
@@ -53,11 +53,37 @@ def isSameData(x, y):
     return x == y
 
 
+_classIdentities = {}
+
+def classIdentity(obj):
+    """
+    Return the module and class name of obj, to compare with the modname and
+    classname of an ObjectMap. Only the class of obj is looked at, so a ZODB
+    ghost is not loaded.
+    """
+    klass = aq_base(obj).__class__
+    identity = _classIdentities.get(klass)
+    if identity is None:
+        identity = _classIdentities[klass] = (klass.__module__, klass.__name__)
+    return identity
+
+
+# operations of a relationship diff
+UPDATE = 'update'
+RECREATE = 'recreate'
+CREATE = 'create'
+LINK = 'link'
+
+
 class ApplyDataMap(object):
 
     def __init__(self, datacollector=None):
         self.datacollector = datacollector
         self.num_obj_changed=0
+        # what the relationship maps applied by this instance changed
+        self.changeCounts = Counter()
+        # objects to index when the current relationship map is applied
+        self._pendingIndex = None
         self._dmd = None
         if datacollector:
             self._dmd = getattr(datacollector, 'dmd', None)
@@ -201,20 +227,18 @@ class ApplyDataMap(object):
         return changed
 
 
-    def _updateRelationship(self, device, relmap):
-        """Add/Update/Remote objects to the target relationship.
+    def _diffRelationship(self, rel, relmap):
         """
-        changed = False
-        rname = relmap.relname
-        rel = getattr(device, rname, None)
-        if not rel:
-            log.warn("no relationship:%s found on:%s (%s %s)",
-                          relmap.relname, device.id, device.__class__, device.zPythonClass)
-            return changed
+        Compare a relationship map with the objects of the relationship.
+        Return the operations needed to apply the map, in map order, and the
+        ids of the objects the map does not mention.
+        """
+        from Products.ZenModel.ZenModelRM import ZenModelRM
         relids = set(rel.objectIdsAll())
+        remaining = set(relids)
         seenids = defaultdict(int)
+        ops = []
         for objmap in relmap:
-            from Products.ZenModel.ZenModelRM import ZenModelRM
             if hasattr(objmap, 'modname') and hasattr(objmap, 'id'):
                 objmap_id = objmap.id
                 seenids[objmap_id] += 1
@@ -222,68 +246,104 @@ class ApplyDataMap(object):
                     objmap_id = objmap.id = "%s_%s" % (objmap_id, seenids[objmap_id])
                 if objmap_id in relids:
                     obj = rel._getOb(objmap_id)
-
                     # Handle the possibility of objects changing class by
                     # recreating them. Ticket #5598.
-                    existing_modname = ''
-                    existing_classname = ''
-                    try:
-                        import inspect
-                        existing_modname = inspect.getmodule(obj).__name__
-                        existing_classname = obj.__class__.__name__
-                    except Exception:
-                        pass
-
+                    existing_modname, existing_classname = classIdentity(obj)
                     if objmap.modname == existing_modname and \
                         objmap.classname in ('', existing_classname):
-
-                        changed |= self._updateObject(obj, objmap)
+                        ops.append((UPDATE, objmap, obj))
                     else:
-                        rel._delObject(objmap_id)
-                        objchange, obj = self._createRelObject(device, objmap, rname)
-                        if obj:
-                            relids.discard(obj.id)
-                        changed |= objchange
+                        ops.append((RECREATE, objmap, None))
+                    remaining.discard(objmap_id)
+                else:
+                    ops.append((CREATE, objmap, None))
+            elif isinstance(objmap, ZenModelRM):
+                ops.append((LINK, objmap, None))
+            else:
+                ops.append((CREATE, objmap, None))
+        return ops, remaining
+
+    def _updateRelationship(self, device, relmap):
+        """Add/Update/Remote objects to the target relationship.
 
-                    relids.discard(objmap_id)
+        The whole map is compared with the relationship first. Then the
+        changes are applied, and the changed objects are indexed once each
+        when the relationship is done.
+        """
+        changed = False
+        rname = relmap.relname
+        rel = getattr(device, rname, None)
+        if not rel:
+            log.warn("no relationship:%s found on:%s (%s %s)",
+                          relmap.relname, device.id, device.__class__, device.zPythonClass)
+            return changed
+        ops, relids = self._diffRelationship(rel, relmap)
+        counts = Counter()
+        self._pendingIndex = {}
+        try:
+            for op, objmap, obj in ops:
+                if op == UPDATE:
+                    objchange = self._updateObject(obj, objmap)
+                    counts['updated' if objchange else 'unchanged'] += 1
+                elif op == LINK:
+                    self.logChange(device, objmap.id, Change_Add,
+                                "linking object %s to device %s relation %s" % (
+                                objmap.id, device.id, rname))
+                    device.addRelation(rname, objmap)
+                    objchange = True
+                    counts['linked'] += 1
                 else:
+                    if op == RECREATE:
+                        rel._delObject(objmap.id)
                     objchange, obj = self._createRelObject(device, objmap, rname)
-                    changed |= objchange
                     if obj:
                         relids.discard(obj.id)
-            elif isinstance(objmap, ZenModelRM):
-                self.logChange(device, objmap.id, Change_Add,
-                            "linking object %s to device %s relation %s" % (
-                            objmap.id, device.id, rname))
-                device.addRelation(rname, objmap)
-                changed = True
-            else:
-                objchange, obj = self._createRelObject(device, objmap, rname)
+                    if objchange:
+                        counts['recreated' if op == RECREATE else 'added'] += 1
                 changed |= objchange
-                if obj:
-                    relids.discard(obj.id)
 
-        for id in relids:
-            obj = rel._getOb(id)
-            if isinstance(obj, Lockable) and obj.isLockedFromDeletion():
-                objname = obj.id
-                try: objname = obj.name()
-                except Exception: pass
-                msg = "Deletion Blocked: %s '%s' on %s" % (
-                        obj.meta_type, objname,obj.device().id)
-                log.warn(msg)
-                if obj.sendEventWhenBlocked():
-                    self.logEvent(device, obj, Change_Remove_Blocked,
-                                    msg, Event.Warning)
-                continue
-            self.logChange(device, obj, Change_Remove,
-                    "removing object %s from rel %s on device %s" % (
-                    id, rname, device.id))
-            rel._delObject(id)
-            changed = True
-        
+            for id in relids:
+                obj = rel._getOb(id)
+                if isinstance(obj, Lockable) and obj.isLockedFromDeletion():
+                    objname = obj.id
+                    try: objname = obj.name()
+                    except Exception: pass
+                    msg = "Deletion Blocked: %s '%s' on %s" % (
+                            obj.meta_type, objname,obj.device().id)
+                    log.warn(msg)
+                    if obj.sendEventWhenBlocked():
+                        self.logEvent(device, obj, Change_Remove_Blocked,
+                                        msg, Event.Warning)
+                    counts['blocked'] += 1
+                    continue
+                self.logChange(device, obj, Change_Remove,
+                        "removing object %s from rel %s on device %s" % (
+                        id, rname, device.id))
+                self._pendingIndex.pop(id, None)
+                rel._delObject(id)
+                counts['removed'] += 1
+                changed = True
+
+            for obj in self._pendingIndex.itervalues():
+                self._indexObject(obj)
+        finally:
+            self._pendingIndex = None
+
+        if counts:
+            self.changeCounts.update(counts)
+            log.debug("Relationship %s on %s: %d added, %d updated, "
+                      "%d recreated, %d removed, %d linked, %d blocked, "
+                      "%d unchanged", rname, device.id, counts['added'],
+                      counts['updated'], counts['recreated'], counts['removed'],
+                      counts['linked'], counts['blocked'], counts['unchanged'])
         return changed
 
+    def _indexObject(self, obj):
+        if getattr(aq_base(obj), "index_object", False):
+            log.debug("indexing object %s", obj.id)
+            obj.index_object()
+        notify(IndexingEvent(obj))
+
 
     def _updateObject(self, obj, objmap):
         """Update an object using a objmap.
@@ -384,10 +444,10 @@ class ApplyDataMap(object):
         if not changed:
             changed = getattr(obj, '_p_changed', False)
         if changed:
-            if getattr(aq_base(obj), "index_object", False):
-                log.debug("indexing object %s", obj.id)
-                obj.index_object()
-            notify(IndexingEvent(obj))
+            if self._pendingIndex is not None:
+                self._pendingIndex[obj.id] = obj
+            else:
+                self._indexObject(obj)
         else:
             obj._p_deactivate()
         self.num_obj_changed += 1 if changed else 0
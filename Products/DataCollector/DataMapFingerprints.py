@@ -0,0 +1,124 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """DataMapFingerprints
+
+Fingerprints of the datamaps returned by modeler plugins. zenmodeler keeps
+the fingerprint of the maps it last applied for each device and plugin, so
+that maps which have not changed since then are not sent to zenhub again.
+"""
+
+import logging
+from hashlib import md5
+
+from Products.ZenUtils.FileCache import FileCache
+
+log = logging.getLogger("zen.DataMapFingerprints")
+
+
+def _canonical(value):
+    """
+    Return a representation of value whose repr does not depend on the
+    order of dictionary keys, set members or the objects in a
+    RelationshipMap.
+    """
+    if isinstance(value, dict):
+        return ('dict', sorted((_canonical(k), _canonical(v))
+                               for k, v in value.iteritems()))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, [_canonical(v) for v in value])
+    if isinstance(value, (set, frozenset)):
+        return ('set', sorted(_canonical(v) for v in value))
+    if isinstance(value, float):
+        return repr(value)
+    if hasattr(value, '__dict__'):
+        attrs = []
+        for name, attr in sorted(value.__dict__.iteritems()):
+            if name == '_attrs':
+                continue
+            attr = _canonical(attr)
+            if name == 'maps' and isinstance(attr, tuple):
+                # the order of the maps in a RelationshipMap does not matter
+                attr = sorted(attr[1])
+            attrs.append((name, attr))
+        return (value.__class__.__name__, attrs)
+    return value
+
+
+def fingerprintDataMaps(datamaps):
+    """
+    Return a fingerprint of a list of ObjectMaps and RelationshipMaps.
+    """
+    return md5(repr(_canonical(list(datamaps)))).hexdigest()
+
+
+class DataMapFingerprintStore(object):
+    """
+    Saves the fingerprint of the datamaps last applied for each device and
+    plugin, and how many times in a row unchanged maps were skipped since.
+    Unchanged maps are applied anyway after fullApplyRuns skipped runs, so
+    that changes made to the model by other means are corrected in time.
+    A fullApplyRuns of 0 means maps are never skipped.
+
+    The fingerprints of a device are kept together with the time the device
+    was created, so that a device that is deleted and added again has its
+    maps applied.
+    """
+
+    def __init__(self, path, fullApplyRuns):
+        self._cache = FileCache(path)
+        self.fullApplyRuns = fullApplyRuns
+
+    def _load(self, deviceId, created):
+        try:
+            state = self._cache.get(deviceId, None)
+        except Exception as e:
+            log.warn("Unable to read datamap fingerprints of %s: %s",
+                     deviceId, e)
+            state = None
+        if state is None or state[0] != created:
+            return {}
+        return state[1]
+
+    def _save(self, deviceId, created, fingerprints):
+        try:
+            self._cache[deviceId] = (created, fingerprints)
+        except Exception as e:
+            log.warn("Unable to save datamap fingerprints of %s: %s",
+                     deviceId, e)
+
+    def skip(self, deviceId, created, pluginName, fingerprint):
+        """
+        Return True if the maps of a plugin are unchanged since they were
+        last applied to the device and need not be applied this time. A
+        skip is recorded towards the next full apply.
+        """
+        if self.fullApplyRuns <= 0:
+            return False
+        state = self._load(deviceId, created)
+        last, skipped = state.get(pluginName, (None, 0))
+        if last != fingerprint or skipped >= self.fullApplyRuns:
+            return False
+        state[pluginName] = (last, skipped + 1)
+        self._save(deviceId, created, state)
+        return True
+
+    def applied(self, deviceId, created, fingerprints):
+        """
+        Record the fingerprints of plugin maps that were applied.
+
+        @param fingerprints: plugin name -> fingerprint
+        @type fingerprints: dictionary
+        """
+        if self.fullApplyRuns <= 0 or not fingerprints:
+            return
+        state = self._load(deviceId, created)
+        for pluginName, fingerprint in fingerprints.iteritems():
+            state[pluginName] = (fingerprint, 0)
+        self._save(deviceId, created, state)
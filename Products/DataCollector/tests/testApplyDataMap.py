@@ -147,6 +147,28 @@ class ApplyDataMapTest(BaseTestCase):
 
         self.assertEquals(1, len(device.os.interfaces))
 
+    def testRelationshipChangeCounts(self):
+        device = self.dmd.Devices.createInstance('testDevice')
+        device.os.addIpInterface('eth0', False)
+        device.os.addIpInterface('eth1', False)
+        device.os.addIpInterface('eth2', False)
+
+        relmap = RelationshipMap("interfaces", "os",
+                                 "Products.ZenModel.IpInterface",
+                                 [{'id': 'eth0', 'speed': 1000},
+                                  {'id': 'eth1'},
+                                  {'id': 'eth3'}])
+        self.assertTrue(self.adm._applyDataMap(device, relmap))
+
+        self.assertEquals(['eth0', 'eth1', 'eth3'],
+                          sorted(device.os.interfaces.objectIds()))
+        self.assertEquals(1000, device.os.interfaces.eth0.speed)
+        counts = self.adm.changeCounts
+        self.assertEquals(1, counts['added'])
+        self.assertEquals(2, counts['updated'] + counts['unchanged'])
+        self.assertEquals(1, counts['removed'])
+        self.assertEquals(0, counts['recreated'])
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
@@ -0,0 +1,83 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import shutil
+import tempfile
+
+from Products.DataCollector.DataMapFingerprints import (
+    DataMapFingerprintStore, fingerprintDataMaps)
+from Products.DataCollector.plugins.DataMaps import (
+    ObjectMap, RelationshipMap)
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+def _relmap(*ids):
+    return RelationshipMap(relname='interfaces', modname='IpInterface',
+                           objmaps=[{'id': id, 'speed': 1e9} for id in ids])
+
+
+class DataMapFingerprintsTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(DataMapFingerprintsTest, self).afterSetUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = DataMapFingerprintStore(self.tmpdir, 2)
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(DataMapFingerprintsTest, self).beforeTearDown()
+
+    def testFingerprintIgnoresOrder(self):
+        first = ObjectMap()
+        first.a = 1
+        first.b = {'x': [1, 2], 'y': set([3, 4])}
+        second = ObjectMap()
+        second.b = {'y': set([4, 3]), 'x': [1, 2]}
+        second.a = 1
+        self.assertEquals(fingerprintDataMaps([first, _relmap('eth0', 'eth1')]),
+                          fingerprintDataMaps([second, _relmap('eth1', 'eth0')]))
+
+    def testFingerprintChangesWithValues(self):
+        changed = _relmap('eth0', 'eth1')
+        changed.maps[0].speed = 1e8
+        self.assertNotEquals(fingerprintDataMaps([_relmap('eth0', 'eth1')]),
+                             fingerprintDataMaps([changed]))
+        self.assertNotEquals(fingerprintDataMaps([_relmap('eth0', 'eth1')]),
+                             fingerprintDataMaps([_relmap('eth0')]))
+
+    def testUnchangedMapsAreSkippedUntilFullApply(self):
+        self.assertFalse(self.store.skip('dev', 'now', 'plugin', 'abc'))
+        self.store.applied('dev', 'now', {'plugin': 'abc'})
+        self.assertTrue(self.store.skip('dev', 'now', 'plugin', 'abc'))
+        self.assertTrue(self.store.skip('dev', 'now', 'plugin', 'abc'))
+        self.assertFalse(self.store.skip('dev', 'now', 'plugin', 'abc'))
+        self.store.applied('dev', 'now', {'plugin': 'abc'})
+        self.assertTrue(self.store.skip('dev', 'now', 'plugin', 'abc'))
+
+    def testChangedMapsAreApplied(self):
+        self.store.applied('dev', 'now', {'plugin': 'abc'})
+        self.assertFalse(self.store.skip('dev', 'now', 'plugin', 'def'))
+        self.assertFalse(self.store.skip('dev', 'now', 'other', 'abc'))
+        self.assertFalse(self.store.skip('other', 'now', 'plugin', 'abc'))
+
+    def testRecreatedDeviceIsApplied(self):
+        self.store.applied('dev', 'then', {'plugin': 'abc'})
+        self.assertFalse(self.store.skip('dev', 'now', 'plugin', 'abc'))
+
+    def testDisabled(self):
+        store = DataMapFingerprintStore(self.tmpdir, 0)
+        store.applied('dev', 'now', {'plugin': 'abc'})
+        self.assertFalse(store.skip('dev', 'now', 'plugin', 'abc'))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(DataMapFingerprintsTest))
+    return suite
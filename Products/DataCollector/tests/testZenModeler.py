@@ -0,0 +1,202 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import collections
+import logging
+
+from twisted.internet import defer
+from twisted.python.failure import Failure
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.DataCollector import zenmodeler
+from Products.DataCollector.zenmodeler import ZenModeler
+
+
+class MockOptions(object):
+    parallel = 3
+    configBufferSize = 1
+    configBatchSize = 2
+    checkStatus = False
+    cycle = True
+
+
+class MockClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class MockDevice(object):
+    skipModelMsg = ''
+
+    def __init__(self, id):
+        self.id = id
+
+
+class MockDriver(object):
+    """
+    Runs a driven generator without the reactor. The deferreds it yields
+    must have fired already.
+    """
+
+    def run(self, generator):
+        try:
+            for d in generator:
+                d.addBoth(self.setResult)
+        except Exception as e:
+            return e
+
+    def setResult(self, result):
+        self.result = result
+
+    def next(self):
+        if isinstance(self.result, Failure):
+            self.result.raiseException()
+        return self.result
+
+
+class MockConfigService(object):
+    """
+    Returns the configs of the requested devices after two seconds, except
+    for missing devices, or fails the next failures calls.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.batches = []
+        self.missing = set()
+        self.failures = 0
+
+    def callRemote(self, method, batch, checkStatus):
+        self.batches.append(list(batch))
+        self.clock.now += 2
+        if self.failures:
+            self.failures -= 1
+            return defer.fail(Exception('getDeviceConfig failed'))
+        return defer.succeed([MockDevice(name) for name in batch
+                              if name not in self.missing])
+
+
+class ZenModelerConfigTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(ZenModelerConfigTest, self).afterSetUp()
+        self.clock = MockClock()
+        self._time = zenmodeler.time
+        zenmodeler.time = self.clock
+        self.service = MockConfigService(self.clock)
+        self.modeler = ZenModeler.__new__(ZenModeler)
+        self.modeler.log = logging.getLogger('zen.ZenModeler')
+        self.modeler.options = MockOptions()
+        self.modeler.start = None
+        self.modeler.pendingNewClients = False
+        self.modeler.clients = []
+        self.modeler.devicegen = None
+        self.modeler.readyConfigs = collections.deque()
+        self.modeler.configRetries = set()
+        self.modeler.phaseTimes = collections.Counter()
+        self.modeler.config = lambda: self.service
+        self.modeler.collectDevice = self.modeler.clients.append
+
+    def beforeTearDown(self):
+        zenmodeler.time = self._time
+        super(ZenModelerConfigTest, self).beforeTearDown()
+
+    def fill(self, names=None):
+        if names is not None:
+            self.modeler.devicegen = iter(names)
+        driver = MockDriver()
+        return driver.run(self.modeler.fillCollectionSlots(driver))
+
+    def testConfigBufferSize(self):
+        self.assertEquals(4, self.modeler._configBufferSize())
+        self.modeler.options.configBufferSize = -1
+        self.assertEquals(3, self.modeler._configBufferSize())
+
+        self.modeler.devicegen = iter(['dev%d' % i for i in range(5)])
+        self.assertEquals(['dev0', 'dev1'], self.modeler._nextDeviceBatch())
+        self.modeler.clients.extend(['client1', 'client2'])
+        self.modeler.readyConfigs.append((MockDevice('dev1'), 0))
+        # the buffer is full
+        self.assertEquals([], self.modeler._nextDeviceBatch())
+        self.modeler.readyConfigs.clear()
+        self.assertEquals(['dev2'], self.modeler._nextDeviceBatch())
+        self.modeler.clients[:] = []
+        self.assertEquals(['dev3', 'dev4'], self.modeler._nextDeviceBatch())
+        self.assertEquals([], self.modeler._nextDeviceBatch())
+        self.assertEquals(None, self.modeler.devicegen)
+
+    def testEveryFreeSlotIsStarted(self):
+        self.fill(['dev%d' % i for i in range(10)])
+        self.assertEquals([['dev0', 'dev1'], ['dev2', 'dev3']],
+                          self.service.batches)
+        self.assertEquals(['dev0', 'dev1', 'dev2'],
+                          [device.id for device in self.modeler.clients])
+        self.assertEquals(['dev3'], [device.id for device, readyAt
+                                     in self.modeler.readyConfigs])
+        self.assertFalse(self.modeler.pendingNewClients)
+
+        # a finished client frees a slot for the buffered config
+        self.modeler.clients.pop(0)
+        self.fill()
+        self.assertEquals(['dev1', 'dev2', 'dev3'],
+                          [device.id for device in self.modeler.clients])
+        self.assertEquals(['dev4'], self.service.batches[-1])
+
+    def testPhaseTimes(self):
+        self.service.missing.add('dev1')
+        self.fill(['dev0', 'dev1', 'dev2', 'dev3'])
+        self.assertEquals(4, self.modeler.phaseTimes['config'])
+        self.assertEquals(['dev0', 'dev2', 'dev3'],
+                          [device.id for device in self.modeler.clients])
+        self.assertEquals([2, 2, 2], [device._configTime
+                                      for device in self.modeler.clients])
+        self.assertEquals([0, 0, 0], [device._configWait
+                                      for device in self.modeler.clients])
+
+        # a buffered config waits for a free slot
+        self.modeler.options.parallel = 1
+        self.modeler.clients[:] = []
+        self.fill(['dev4', 'dev5'])
+        self.clock.now += 5
+        self.modeler.clients[:] = []
+        self.fill()
+        device, = self.modeler.clients
+        self.assertEquals('dev5', device.id)
+        self.assertEquals(5, device._configWait)
+        self.assertEquals(6, self.modeler.phaseTimes['config'])
+
+    def testFailedBatchIsRetried(self):
+        self.service.failures = 1
+        self.assertTrue(isinstance(self.fill(['dev0', 'dev1', 'dev2']),
+                                   Exception))
+        self.assertFalse(self.modeler.pendingNewClients)
+        self.assertEquals([], self.modeler.clients)
+        self.fill()
+        self.assertEquals([['dev0', 'dev1'], ['dev0', 'dev1'], ['dev2']],
+                          self.service.batches)
+        self.assertEquals(['dev0', 'dev1', 'dev2'],
+                          [device.id for device in self.modeler.clients])
+
+    def testBatchFailingTwiceIsSkipped(self):
+        self.service.failures = 2
+        self.fill(['dev0', 'dev1', 'dev2'])
+        self.fill()
+        self.assertEquals(['dev2'], list(self.modeler.devicegen))
+        self.assertEquals(set(['dev0', 'dev1']), self.modeler.configRetries)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(ZenModelerConfigTest))
+    return suite
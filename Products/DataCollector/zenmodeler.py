@@ -37,6 +37,8 @@ from Products.ZenEvents.ZenEventClasses import Heartbeat, Error
 from Products.Zuul.utils import safe_hasattr as hasattr
 from Products.ZenUtils.metricwriter import ThresholdNotifier
 from Products.DataCollector import Classifier
+from Products.DataCollector.DataMapFingerprints import (
+    DataMapFingerprintStore, fingerprintDataMaps)
 from Products.ZenCollector.interfaces import IEventService
 from Products.ZenCollector.daemon import parseWorkerOptions, addWorkerOptions
 
@@ -64,6 +66,8 @@ from itertools import chain
 
 defaultPortScanTimeout = 5
 defaultParallel = 1
+defaultConfigBatchSize = 20
+defaultFullApplyRuns = 10
 defaultProtocol = "ssh"
 defaultPort = 22
 
@@ -111,8 +115,15 @@ class ZenModeler(PBDaemon):
         self.clients = []
         self.finished = []
         self.devicegen = None
+        # device configs fetched ahead of the collection slots
+        self.readyConfigs = collections.deque()
+        # devices whose config batch failed once during this cycle
+        self.configRetries = set()
+        # seconds spent in each modeling phase during this cycle
+        self.phaseTimes = collections.Counter()
         self.counters = collections.Counter()
         self.configFilter = None
+        self._fingerprints = None
 
         # Make sendEvent() available to plugins
         zope.component.provideUtility(self, IEventService)
@@ -297,6 +308,7 @@ class ZenModeler(PBDaemon):
         @type device: string
         """
         clientTimeout = getattr(device, 'zCollectorClientTimeout', 180)
+        device._collectStart = time.time()
         ip = device.manageIp
         timeout = clientTimeout + time.time()
         if USE_WMI:
@@ -597,6 +609,10 @@ class ZenModeler(PBDaemon):
         """
         device = collectorClient.device
         self.log.debug("Client for %s finished collecting", device.id)
+        timings = dict(config=getattr(device, '_configTime', 0.0),
+                       configWait=getattr(device, '_configWait', 0.0),
+                       collect=time.time() - getattr(device, '_collectStart', time.time()),
+                       process=0.0, apply=0.0)
 
         def processClient(driver):
             try:
@@ -615,8 +631,17 @@ class ZenModeler(PBDaemon):
 
                 pluginStats = {}
                 self.log.debug("Processing data for device %s", device.id)
+                processStart = time.time()
                 devchanged = False
                 maps = []
+                fingerprints = {}
+                skippedPlugins = False
+                fingerprintStore = self.fingerprintStore()
+                created = getattr(device, 'createdTime', None)
+                if created is None:
+                    # configs from an older zenhub cannot tell a new device
+                    # from a deleted one with the same id
+                    fingerprintStore = None
                 for plugin, results in collectorClient.getResults():
                     if plugin is None: continue
                     self.log.debug("Processing plugin %s on device %s ...",
@@ -672,17 +697,38 @@ class ZenModeler(PBDaemon):
                         newmaps = [m for m in datamaps if m]
                         if self.options.save_processed_results:
                             self.savePluginData(device.id, plugin.name(), 'processed', newmaps)
+                        if fingerprintStore is not None and newmaps:
+                            fingerprint = fingerprintDataMaps(newmaps)
+                            if fingerprintStore.skip(device.id, created,
+                                                     plugin.name(), fingerprint):
+                                self.log.debug("Maps of plugin %s on device %s "
+                                               "are unchanged, not applying",
+                                               plugin.name(), device.id)
+                                self.counters['skippedDataMaps'] += len(newmaps)
+                                skippedPlugins = True
+                                continue
+                            fingerprints[plugin.name()] = fingerprint
                         maps += newmaps
 
+                timings['process'] = time.time() - processStart
                 if maps:
                     deviceClass = Classifier.classifyDevice(pluginStats,
                                                 self.classCollectorPlugins)
+                    applyStart = time.time()
                     yield self.config().callRemote(
                                                 'applyDataMaps', device.id,
                                                 maps, deviceClass, True)
 
+                    timings['apply'] = time.time() - applyStart
                     if driver.next():
                         devchanged = True
+                    if fingerprintStore is not None:
+                        fingerprintStore.applied(device.id, created,
+                                                 fingerprints)
+                elif skippedPlugins:
+                    yield self.config().callRemote('setSnmpLastCollection',
+                                                   device.id)
+                    driver.next()
                 if devchanged:
                     self.log.info("Changes in configuration applied")
                 else:
@@ -706,6 +752,7 @@ class ZenModeler(PBDaemon):
                                (device.id, result))
             else:
                 self.log.debug("Client %s finished" % device.id)
+            self.logTimings(device.id, collectorClient, timings)
 
             try:
                 self.clients.remove(collectorClient)
@@ -720,6 +767,36 @@ class ZenModeler(PBDaemon):
         d = drive(processClient)
         d.addBoth(processClientFinished)
 
+    def fingerprintStore(self):
+        """
+        Return the store of applied datamap fingerprints, or None if
+        unchanged datamaps should always be applied. They are always applied
+        when modeling a single device.
+        """
+        if self.single or self.options.fullApplyRuns <= 0:
+            return None
+        if self._fingerprints is None:
+            self._fingerprints = DataMapFingerprintStore(
+                zenPath('var', self.name, self.options.monitor,
+                        'fingerprints'),
+                self.options.fullApplyRuns)
+        return self._fingerprints
+
+    def logTimings(self, deviceName, collectorClient, timings):
+        """
+        Log how long each phase of modeling a device took with one client.
+        The config phase is shared by all clients of a device, so it is
+        only added to the cycle totals once.
+        """
+        for phase in ('collect', 'process', 'apply'):
+            self.phaseTimes[phase] += timings[phase]
+        self.log.info("Timings for %s (%s): config %.2fs (waited %.2fs "
+                      "in buffer), collect %.2fs, process %.2fs, "
+                      "apply %.2fs", deviceName,
+                      collectorClient.__class__.__name__, timings['config'],
+                      timings['configWait'], timings['collect'],
+                      timings['process'], timings['apply'])
+
     def savePluginData(self, deviceName, pluginName, dataType, data):
         filename = "/tmp/%s.%s.%s.pickle.gz" % (deviceName, pluginName, dataType)
         try:
@@ -784,6 +861,9 @@ class ZenModeler(PBDaemon):
         # save running count
         self.rrdStats.gauge('modeledDevicesCount', self.counters['modeledDevicesCount'])
 
+        # save rate of datamaps not sent because they were unchanged
+        self.rrdStats.derive('skippedDataMaps', self.counters['skippedDataMaps'])
+
         # persist counters values
         self.saveCounters()
 
@@ -828,12 +908,20 @@ class ZenModeler(PBDaemon):
         @type unused: string
         """
         if self.pendingNewClients or self.clients: return
-        if self._devicegen_has_items: return
+        if self.readyConfigs or self._devicegen_has_items: return
 
         if self.start:
             runTime = time.time() - self.start
             self.start = None
             self.log.info("Scan time: %0.2f seconds", runTime)
+            self.log.info("Time spent fetching configs: %0.2f seconds, "
+                          "collecting: %0.2f seconds, processing: %0.2f "
+                          "seconds, applying: %0.2f seconds",
+                          self.phaseTimes['config'],
+                          self.phaseTimes['collect'],
+                          self.phaseTimes['process'],
+                          self.phaseTimes['apply'])
+            self.phaseTimes.clear()
             devices = len(self.finished)
             timedOut = len([c for c in self.finished if c.timedOut])
             self.rrdStats.gauge('cycleTime', runTime)
@@ -843,36 +931,102 @@ class ZenModeler(PBDaemon):
                 self.stop()
             self.finished = []
 
+    def _configBufferSize(self):
+        """
+        The number of device configs to keep, including the ones of the
+        devices being collected.
+        """
+        return self.options.parallel + max(self.options.configBufferSize, 0)
+
+    def _nextDeviceBatch(self):
+        """
+        Return the next devices whose configs should be fetched, or an
+        empty list if the buffer is full or every device has been handed out.
+        """
+        room = (self._configBufferSize() - len(self.clients)
+                - len(self.readyConfigs))
+        size = min(room, max(self.options.configBatchSize, 1))
+        batch = []
+        if self.devicegen is not None:
+            while len(batch) < size:
+                try:
+                    batch.append(self.devicegen.next())
+                except StopIteration:
+                    self.devicegen = None
+                    break
+        return batch
+
+    def _configBatchFailed(self, batch):
+        """
+        Put the devices of a failed getDeviceConfig batch back in front of
+        the device list to be fetched again. Devices that already failed once
+        during this cycle are dropped.
+        """
+        retry = [name for name in batch if name not in self.configRetries]
+        dropped = [name for name in batch if name in self.configRetries]
+        if retry:
+            self.log.warn("Unable to fetch device configs, will retry: %s",
+                          ", ".join(retry))
+            self.configRetries.update(retry)
+            self.devicegen = chain(retry, self.devicegen or ())
+        if dropped:
+            self.log.error("Unable to fetch device configs, skipping: %s",
+                           ", ".join(dropped))
+
+    def _startClients(self):
+        """
+        Start collecting from buffered configs until every slot is in use.
+        """
+        while self.readyConfigs and len(self.clients) < self.options.parallel:
+            device, readyAt = self.readyConfigs.popleft()
+            device._configWait = time.time() - readyAt
+            if device.skipModelMsg:
+                self.log.info(device.skipModelMsg)
+            else:
+                self.collectDevice(device)
+
     def fillCollectionSlots(self, driver):
         """
-        An iterator which either returns a device to collect or
-        calls checkStop()
+        An iterator which fills every free collection slot with buffered
+        device configs, fetches more configs in batches until the buffer is
+        full and then calls checkStop()
         @param driver: driver object
         @type driver: driver object
         """
         count = len(self.clients)
-        while count < self.options.parallel and self._devicegen_has_items \
-            and not self.pendingNewClients:
+        self._startClients()
+        if not self.pendingNewClients:
             self.pendingNewClients = True
             try:
-                device = self.devicegen.next()
-                yield self.config().callRemote('getDeviceConfig', [device],
-                                            self.options.checkStatus)
-                # just collect one device, and let the timer add more
-                devices = driver.next()
-                if devices:
-                    d = devices[0]
-                    if d.skipModelMsg:
-                        self.log.info(d.skipModelMsg)
-                    else:
-                        self.collectDevice(d)
-                else:
-                    self.log.info("Device %s not returned is it down?", device)
-            except StopIteration:
-                self.devicegen = None
+                batch = self._nextDeviceBatch()
+                while batch:
+                    start = time.time()
+                    yield self.config().callRemote('getDeviceConfig', batch,
+                                                self.options.checkStatus)
+                    try:
+                        devices = driver.next()
+                    except Exception:
+                        self._configBatchFailed(batch)
+                        raise
+                    now = time.time()
+                    elapsed = now - start
+                    self.phaseTimes['config'] += elapsed
+                    self.log.debug("Fetched %d of %d device configs in "
+                                   "%.2f seconds", len(devices), len(batch),
+                                   elapsed)
+                    returned = set()
+                    for device in devices:
+                        returned.add(device.id)
+                        device._configTime = elapsed
+                        self.readyConfigs.append((device, now))
+                    for name in batch:
+                        if name not in returned:
+                            self.log.info("Device %s not returned is it down?",
+                                          name)
+                    self._startClients()
+                    batch = self._nextDeviceBatch()
             finally:
                 self.pendingNewClients = False
-            break
         update = len(self.clients)
         if update != count and update != 1:
             self.log.info('Running %d clients', update)
@@ -932,6 +1086,21 @@ class ZenModeler(PBDaemon):
         self.parser.add_option('--parallel', dest='parallel',
                 type='int', default=defaultParallel,
                 help="Number of devices to collect from in parallel")
+        self.parser.add_option('--configbatchsize', dest='configBatchSize',
+                type='int', default=defaultConfigBatchSize,
+                help="Number of device configs to request from zenhub "
+                     "at once (default: %default)")
+        self.parser.add_option('--configbuffer', dest='configBufferSize',
+                type='int', default=None,
+                help="Number of device configs to fetch ahead of the "
+                     "--parallel collection slots (default: same as "
+                     "--parallel)")
+        self.parser.add_option('--fullapplyruns', dest='fullApplyRuns',
+                type='int', default=defaultFullApplyRuns,
+                help="Datamaps that are unchanged since they were last "
+                     "applied are not sent to zenhub, except after this "
+                     "many skipped runs. 0 always sends them "
+                     "(default: %default)")
         self.parser.add_option('--cycletime',
                 dest='cycletime', type='int',
                 help="Run collection every x minutes")
@@ -992,6 +1161,8 @@ class ZenModeler(PBDaemon):
         """
         if not self.options.path and not self.options.device:
             self.options.path = "/Devices"
+        if self.options.configBufferSize is None:
+            self.options.configBufferSize = self.options.parallel
         if self.options.ignorePlugins and self.options.collectPlugins:
             raise SystemExit( "Only one of --ignore or --collect"
                              " can be used at a time")
@@ -1119,6 +1290,7 @@ class ZenModeler(PBDaemon):
         self.log.debug("getDeviceList returned %s devices", len(deviceList))
         self.log.debug("getDeviceList returned %s devices", deviceList)
         self.devicegen = iter(deviceList)
+        self.configRetries.clear()
         d = drive(self.fillCollectionSlots)
         d.addErrback(self.fillError)
         yield d
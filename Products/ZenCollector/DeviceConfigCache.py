@@ -1,26 +1,58 @@
 ##############################################################################
-# 
-# Copyright (C) Zenoss, Inc. 2011, all rights reserved.
-# 
+#
+# Copyright (C) Zenoss, Inc. 2011, 2016, all rights reserved.
+#
 # This content is made available according to terms specified in
 # License.zenoss under the directory where your Zenoss product is installed.
-# 
+#
 ##############################################################################
 
 
-from Products.ZenUtils.FileCache import FileCache
 import os
+import logging
+
+from Products.ZenUtils.FileCache import FileCache
+from Products.ZenUtils.LogFileCache import LogFileCache
+
+log = logging.getLogger("zen.collector.DeviceConfigCache")
+
+CACHE_FILENAME = 'configs.log'
+
 
 class DeviceConfigCache(object):
+    """
+    Keeps the device configs of each monitor in a LogFileCache under
+    basepath/<monitor>. Configs cached in a file per device by earlier
+    versions are moved into it the first time the monitor's cache is used.
+    """
+
     def __init__(self, basepath):
         self.basepath = basepath
+        self._caches = {}
 
     def _getFileCache(self, monitor):
-        return FileCache(os.path.join(self.basepath, monitor))
+        cache = self._caches.get(monitor)
+        if cache is None:
+            path = os.path.join(self.basepath, monitor)
+            cache = LogFileCache(os.path.join(path, CACHE_FILENAME))
+            self._migrate(path, cache)
+            self._caches[monitor] = cache
+        return cache
+
+    def _migrate(self, path, cache):
+        old = FileCache(path)
+        if not old:
+            return
+        configs = old.items()
+        log.info("Moving %d cached configs in %s to %s",
+                 len(configs), path, CACHE_FILENAME)
+        cache.update((key, value) for key, value in configs
+                     if key not in cache)
+        old.clear()
 
     def cacheConfigProxies(self, prefs, configs):
-        for cfg in configs:
-            self.updateConfigProxy(prefs, cfg)
+        cache = self._getFileCache(prefs.options.monitor)
+        cache.update((cfg.configId, cfg) for cfg in configs)
 
     def updateConfigProxy(self, prefs, config):
         cache = self._getFileCache(prefs.options.monitor)
@@ -40,10 +72,15 @@ class DeviceConfigCache(object):
         if cfgids:
             ret = []
             for cfgid in cfgids:
-                if cfgid in cache:
-                    config = cache[cfgid]
-                    if config:
-                        ret.append(config)
+                config = cache.get(cfgid, None)
+                if config:
+                    ret.append(config)
             return ret
         else:
             return filter(None, cache.values())
+
+    def compact(self, prefs):
+        """
+        Rewrite the monitor's cache file without obsolete records.
+        """
+        self._getFileCache(prefs.options.monitor).compact()
@@ -89,9 +89,12 @@ class ConfigurationProxy(object):
         serviceProxy = self._collector.getRemoteConfigServiceProxy()
 
         log.debug("Fetching configurations")
+        # configs the collector already has are only sent if they changed
+        getConfigHashes = getattr(self._collector, 'getConfigHashes', None)
+        configHashes = getConfigHashes() if getConfigHashes else None
         #get options from prefs.options and send to remote
         d = serviceProxy.callRemote('getDeviceConfigs', ids,
-                options=prefs.options.__dict__)
+                options=prefs.options.__dict__, configHashes=configHashes)
         return d
 
     def deleteConfigProxy(self, prefs, id):
@@ -254,7 +257,9 @@ class ConfigurationLoaderTask(ObservableMixin):
     def _processConfig(self, configs, purgeOmitted=True):
         if self.options.device:
             configs = [cfg for cfg in configs \
-                            if self.options.device in (cfg.id, cfg.configId)]
+                            if self.options.device in (
+                                (cfg,) if isinstance(cfg, basestring)
+                                else (cfg.id, cfg.configId))]
             if not configs:
                 log.error("Configuration for %s unavailable -- " \
                                "is that the correct name?",
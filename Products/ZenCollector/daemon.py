@@ -215,6 +215,8 @@ class CollectorDaemon(RRDDaemon):
 
         self._deviceGuids = {}
         self._devices = set()
+        # config id -> hash of the config the tasks were built from
+        self._configHashes = {}
         self._unresponsiveDevices = set()
         self._rrd = None
         self._metric_writer = None
@@ -469,7 +471,7 @@ class CollectorDaemon(RRDDaemon):
         if self._updateConfig(config):
             self._configProxy.updateConfigProxy(self.preferences, config)
         else:
-            self.log.debug("Device %s config filtered", config.configId)
+            self.log.debug("Device %s config filtered or unchanged", config.configId)
 
     def remote_updateDeviceConfigs(self, configs):
         """
@@ -543,6 +545,11 @@ class CollectorDaemon(RRDDaemon):
             return False
 
         configId = cfg.configId
+        configHash = getattr(cfg, 'configHash', None)
+        if configHash and configId in self._devices \
+                and self._configHashes.get(configId) == configHash:
+            self.log.debug("Configuration for %s unchanged", configId)
+            return False
         self.log.debug("Processing configuration for %s", configId)
 
         nextExpectedRuns = {}
@@ -554,6 +561,7 @@ class CollectorDaemon(RRDDaemon):
         else:
             self._devices.add(configId)
             self._configListener.added(cfg)
+        self._configHashes[configId] = configHash
 
         newTasks = self._taskSplitter.splitConfiguration([cfg])
         self.log.debug("Tasks for config %s: %s", configId, newTasks)
@@ -597,13 +605,27 @@ class CollectorDaemon(RRDDaemon):
         """
         self.log.debug("updateDeviceConfigs: updatedConfigs=%s", (map(str, updatedConfigs)))
 
+        configIds = []
         for cfg in updatedConfigs:
+            # zenhub sends only the id of configs that have not changed
+            if isinstance(cfg, basestring):
+                configIds.append(cfg)
+                continue
+            configIds.append(cfg.configId)
             self._updateConfig(cfg)
             # yield time to reactor so other things can happen
             yield task.deferLater(reactor, 0, lambda: None)
 
         if purgeOmitted:
-            self._purgeOmittedDevices(cfg.configId for cfg in updatedConfigs)
+            self._purgeOmittedDevices(configIds)
+
+    def getConfigHashes(self):
+        """
+        Return the hashes of the device configs the collector's tasks were
+        built from, so that zenhub only sends configs that have changed.
+        """
+        return dict((configId, configHash) for configId, configHash
+                    in self._configHashes.iteritems() if configHash)
 
     def _purgeOmittedDevices(self, updatedDevices):
         """
@@ -621,6 +643,7 @@ class CollectorDaemon(RRDDaemon):
         self.log.debug("Device %s deleted" % deviceId)
 
         self._devices.discard(deviceId)
+        self._configHashes.pop(deviceId, None)
         self._configListener.deleted(deviceId)
         self._configProxy.deleteConfigProxy(self.preferences, deviceId)
         self._scheduler.removeTasksForConfig(deviceId)
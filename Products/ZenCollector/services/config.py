@@ -10,7 +10,9 @@
 
 from twisted.internet import defer
 from twisted.spread import pb
+import cPickle as pickle
 import logging
+from hashlib import md5
 
 from Acquisition import aq_parent
 from zope import component
@@ -51,6 +53,14 @@ class DeviceProxy(pb.Copyable, pb.RemoteCopy):
         retval = getattr(self, "_config_id", None)
         return retval if (retval is not None) else self.id
 
+    @property
+    def configHash(self):
+        """
+        Hash of the configuration content, set by the config service. Two
+        configurations with the same hash are identical.
+        """
+        return getattr(self, "_config_hash", None)
+
     @property
     def deviceGuid(self):
         """
@@ -67,6 +77,30 @@ class DeviceProxy(pb.Copyable, pb.RemoteCopy):
 pb.setUnjellyableForClass(DeviceProxy, DeviceProxy)
 
 
+def _configHash(proxy):
+    """
+    Return a hash of the content of a device proxy, or None if it cannot
+    be pickled.
+    """
+    state = sorted((k, v) for k, v in proxy.__dict__.iteritems()
+                   if k != '_config_hash')
+    try:
+        return md5(pickle.dumps(state, pickle.HIGHEST_PROTOCOL)).hexdigest()
+    except Exception:
+        return None
+
+
+def _templateSerial(template):
+    """
+    Return a value that changes whenever the template, one of its data
+    sources or one of their data points is changed, added or removed.
+    """
+    return (template._p_serial,
+            tuple((ds.id, ds._p_serial,
+                   tuple((dp.id, dp._p_serial) for dp in ds.datapoints()))
+                  for ds in template.datasources()))
+
+
 # TODO: doc me!
 BASE_ATTRIBUTES = ('id',
                    'manageIp',
@@ -100,9 +134,18 @@ class CollectorConfigService(HubService, ThresholdMixin):
         # bit to batch up operations.
         self._procrastinator = Procrastinate(self._pushConfig)
         self._reconfigProcrastinator = Procrastinate(self._pushReconfigure)
+        # device class path -> (device class, set of changed templates, or
+        # None if all devices in the class are affected)
+        self._pendingDeviceClasses = {}
+        self._deviceClassProcrastinator = Procrastinate(self._pushDeviceClass)
 
         self._notifier = component.getUtility(IBatchNotifier)
 
+        # (template path, key) -> (template serial, plan)
+        self._templatePlans = {}
+        # plans checked against their template for the current device
+        self._checkedPlans = set()
+
     def _wrapFunction(self, functor, *args, **kwargs):
         """
         Call the functor using the arguments, and trap any unhandled exceptions.
@@ -180,29 +223,7 @@ class CollectorConfigService(HubService, ThresholdMixin):
                     if isinstance(object, RRDTemplate):
                         template = object
                     if isinstance(object, DeviceClass):
-                        uid = (self.__class__.__name__, self.instance)
-                        devfilter = None
-                        if template:
-                            def hasTemplate(device):
-                                if issubclass(template.getTargetPythonClass(), Device):
-                                    result = template in device.getRRDTemplates()
-                                    if result:
-                                        self.log.debug("%s bound to template %s", device.getPrimaryId(), template.getPrimaryId())
-                                    else:
-                                        self.log.debug("%s not bound to template %s", device.getPrimaryId(), template.getPrimaryId())
-                                    return result
-                                else:
-                                    # check components, Too expensive?
-                                    for comp in device.getMonitoredComponents(type=template.getTargetPythonClass().meta_type):
-                                        result = template in comp.getRRDTemplates()
-                                        if result:
-                                            self.log.debug("%s bound to template %s", comp.getPrimaryId(), template.getPrimaryId())
-                                            return True
-                                        else:
-                                            self.log.debug("%s not bound to template %s", comp.getPrimaryId(), template.getPrimaryId())
-                                    return False
-                            devfilter = hasTemplate
-                        self._notifier.notify_subdevices(object, uid, self._notifyAll, devfilter)
+                        self._notifyDeviceClass(object, template)
                         break
 
                     if isinstance(object, Device):
@@ -250,7 +271,13 @@ class CollectorConfigService(HubService, ThresholdMixin):
         return devices
 
     @translateError
-    def remote_getDeviceConfigs(self, deviceNames=None, options=None):
+    def remote_getDeviceConfigs(self, deviceNames=None, options=None,
+                                configHashes=None):
+        """
+        Return the configs of the collector's devices. configHashes maps
+        the ids of the configs the collector already has to their hashes;
+        configs that have not changed are returned as their config id only.
+        """
         deviceFilter = self._getOptionsFilter(options)
         devices = self._getDevices(deviceNames, deviceFilter)
         devices = self._filterDevices(devices)
@@ -262,8 +289,22 @@ class CollectorConfigService(HubService, ThresholdMixin):
                 deviceConfigs.extend(proxies)
 
         self._wrapFunction(self._postCreateDeviceProxy, deviceConfigs)
+        self._setConfigHashes(deviceConfigs)
+        if configHashes:
+            unchanged = 0
+            for i, proxy in enumerate(deviceConfigs):
+                configHash = proxy.configHash
+                if configHash and configHashes.get(proxy.configId) == configHash:
+                    deviceConfigs[i] = proxy.configId
+                    unchanged += 1
+            self.log.debug("%d of %d device configs unchanged",
+                           unchanged, len(deviceConfigs))
         return deviceConfigs
 
+    def _setConfigHashes(self, proxies):
+        for proxy in proxies:
+            proxy._config_hash = _configHash(proxy)
+
     def _postCreateDeviceProxy(self, deviceConfigs):
         pass
 
@@ -284,6 +325,7 @@ class CollectorConfigService(HubService, ThresholdMixin):
         @rtype: DeviceProxy
         """
         proxy = proxy if (proxy is not None) else DeviceProxy()
+        self._checkedPlans.clear()
 
         # copy over all the attributes requested
         for attrName in self._deviceProxyAttributes:
@@ -296,6 +338,26 @@ class CollectorConfigService(HubService, ThresholdMixin):
                 setattr(proxy,'_device_guid', guid)
         return proxy
 
+    def _templatePlan(self, template, build, key=None):
+        """
+        Return build(template), the part of a configuration that depends on
+        the template alone, so that it is not rebuilt for every device and
+        component bound to the template. Workers do not see invalidations,
+        so a cached plan is checked against the template, its data sources
+        and data points once per device proxy and rebuilt if any of them
+        changed.
+
+        @param key: distinguishes plans built differently from one template
+        """
+        planKey = (template.getPrimaryId(), key)
+        if planKey not in self._checkedPlans:
+            serial = _templateSerial(template)
+            plan = self._templatePlans.get(planKey)
+            if plan is None or plan[0] != serial:
+                self._templatePlans[planKey] = (serial, build(template))
+            self._checkedPlans.add(planKey)
+        return self._templatePlans[planKey][1]
+
     def _filterDevice(self, device):
         """
         Determines if the specified device should be included for consideration
@@ -373,6 +435,71 @@ class CollectorConfigService(HubService, ThresholdMixin):
         # procrastinator schedules a call to _pushConfig
         self._procrastinator.doLater(object)
 
+    def _notifyDeviceClass(self, deviceClass, template=None):
+        """
+        Schedule a config push for the devices in a device class. Changes to
+        the same device class are coalesced, so that editing many objects
+        of one template walks the devices of the class only once.
+        """
+        path = deviceClass.getPrimaryId()
+        pending = self._pendingDeviceClasses.get(path)
+        if pending is None:
+            templates = set() if template is not None else None
+            pending = self._pendingDeviceClasses[path] = (deviceClass, templates)
+        if pending[1] is not None:
+            if template is None:
+                self._pendingDeviceClasses[path] = (deviceClass, None)
+            else:
+                pending[1].add(template.getPrimaryId())
+        self._deviceClassProcrastinator.doLater(path)
+
+    def _templateFilter(self, templates):
+        """
+        Return a device filter matching devices or components bound to
+        any of the templates with the given paths.
+        """
+        deviceTemplates = set()
+        componentTemplates = {}
+        for path in templates:
+            try:
+                template = self.dmd.unrestrictedTraverse(path)
+            except (AttributeError, KeyError):
+                continue
+            targetClass = template.getTargetPythonClass()
+            if issubclass(targetClass, Device):
+                deviceTemplates.add(path)
+            else:
+                componentTemplates.setdefault(targetClass.meta_type, set()).add(path)
+
+        def isBound(obj, paths):
+            return any(t.getPrimaryId() in paths for t in obj.getRRDTemplates())
+
+        def hasTemplate(device):
+            if deviceTemplates and isBound(device, deviceTemplates):
+                self.log.debug("%s bound to a changed template", device.getPrimaryId())
+                return True
+            # check components, Too expensive?
+            for meta_type, paths in componentTemplates.iteritems():
+                for comp in device.getMonitoredComponents(type=meta_type):
+                    if isBound(comp, paths):
+                        self.log.debug("%s bound to a changed template", comp.getPrimaryId())
+                        return True
+            self.log.debug("%s not bound to a changed template", device.getPrimaryId())
+            return False
+        return hasTemplate
+
+    def _pushDeviceClass(self, path):
+        """
+        Notify the devices of a device class with pending changes.
+        """
+        pending = self._pendingDeviceClasses.pop(path, None)
+        if pending is None:
+            return
+        deviceClass, templates = pending
+        uid = (self.__class__.__name__, self.instance)
+        devfilter = self._templateFilter(templates) if templates is not None else None
+        self._notifier.notify_subdevices(deviceClass, uid, self._notifyAll, devfilter)
+
     def _pushConfig(self, device):
         """
         push device config and deletes to relevent collectors/instances
@@ -383,6 +510,7 @@ class CollectorConfigService(HubService, ThresholdMixin):
             proxies = self._wrapFunction(self._createDeviceProxies, device)
             if proxies:
                 self._wrapFunction(self._postCreateDeviceProxy, proxies)
+                self._setConfigHashes(proxies)
         else:
             proxies = None
 
@@ -16,6 +16,7 @@ from twisted.internet import defer
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
 
 from Products.ZenCollector.config import ConfigurationProxy
+from Products.ZenCollector.services.config import DeviceProxy, _configHash
 from Products.ZenCollector.interfaces import ICollector, ICollectorPreferences
 
 
@@ -32,7 +33,9 @@ class MyCollector(object):
         def remote_getCollectorThresholds(self):
             return defer.succeed(['yabba dabba do', 'ho ho hum'])
 
-        def remote_getDeviceConfigs(self, devices=[]):
+        def remote_getDeviceConfigs(self, devices=[], options=None,
+                                    configHashes=None):
+            MyCollector.configHashesSent = configHashes
             return defer.succeed(['hmm', 'foo', 'bar'])
 
         def callRemote(self, methodName, *args, **kwargs):
@@ -43,11 +46,14 @@ class MyCollector(object):
             elif methodName is 'getCollectorThresholds':
                 return self.remote_getCollectorThresholds()
             elif methodName is 'getDeviceConfigs':
-                return self.remote_getDeviceConfigs(args)
+                return self.remote_getDeviceConfigs(args, **kwargs)
 
     def getRemoteConfigServiceProxy(self):
         return MyCollector.MyConfigServiceProxy()
 
+    def getConfigHashes(self):
+        return {'foo': 'abc123'}
+
     def configureRRD(self, rrdCreateCommand, thresholds):
         pass
 
@@ -116,8 +122,37 @@ class TestConfig(BaseTestCase):
         d.addBoth(validate)
         return d
 
+    def testConfigProxiesSendsConfigHashes(self):
+        cfgService = ConfigurationProxy()
+        cfgService.getConfigProxies(MyPrefs())
+        self.assertEquals({'foo': 'abc123'}, MyCollector.configHashesSent)
+
+
+class TestConfigHash(BaseTestCase):
+
+    def _proxy(self, **attrs):
+        proxy = DeviceProxy()
+        proxy.id = 'dev1'
+        proxy.__dict__.update(attrs)
+        return proxy
+
+    def testHashDependsOnContentOnly(self):
+        first = self._proxy(oids={'1.3.6': ['a']}, interval=300)
+        second = self._proxy(interval=300, oids={'1.3.6': ['a']})
+        self.assertEquals(_configHash(first), _configHash(second))
+        second._config_hash = _configHash(second)
+        self.assertEquals(_configHash(first), _configHash(second))
+        self.assertEquals(_configHash(first), second.configHash)
+
+    def testHashChangesWithContent(self):
+        first = self._proxy(oids={'1.3.6': ['a']})
+        second = self._proxy(oids={'1.3.6': ['b']})
+        self.assertNotEquals(_configHash(first), _configHash(second))
+
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
     suite.addTest(makeSuite(TestConfig))
+    suite.addTest(makeSuite(TestConfigHash))
     return suite
@@ -34,11 +34,12 @@ def workersBuildOptions(parser, default=1):
                       default=default,
                       help=optparse.SUPPRESS_HELP)
 
-def exec_worker(worker_id=None):
+def exec_worker(worker_id=None, extra_args=None):
     """
     used to create a worker for an existing zenoss daemon. Removes the
     "workers" and "daemon" sys args and replace the current process by
-    executing sys args
+    executing sys args. extra_args is a list of "--option=value" strings
+    that replace any value given for those options on the command line.
     """
 
     #Here we are just registering parents death signal as this childs terminal signal as well.
@@ -49,9 +50,12 @@ def exec_worker(worker_id=None):
 
     argv = [sys.executable]
     # Remove unwanted parameters from worker processes
-    argv.extend(remove_args(sys.argv[:], ['-D','--daemon','-c','--cycle'], ['--workerid']))
+    extra_args = list(extra_args or ())
+    overridden = ['--workerid'] + [arg.split('=', 1)[0] for arg in extra_args]
+    argv.extend(remove_args(sys.argv[:], ['-D','--daemon','-c','--cycle'], overridden))
     if worker_id is not None:
-        argv.append('--workerid=%d'%worker_id)
+        argv.append('--workerid=%s'%worker_id)
+    argv.extend(extra_args)
     # Tell the worker process to log to the log file and not just to console
     argv.append('--duallog')
     try:
@@ -195,6 +199,14 @@ class ProcessWorkers(object):
         finally:
             self._checking = False
     
+    def _workerKwargs(self, worker_id):
+        """
+        Returns the keyword arguments the worker target is called with.
+        """
+        if self._workerTarget is None:
+            return {"worker_id": worker_id}
+        return {}
+
     def _startWorker(self, worker_id):
         workerName = worker_id
         if self._workerName:
@@ -202,10 +214,9 @@ class ProcessWorkers(object):
         log.warning('Starting worker %s' % workerName)
         # if self._workerTarget is None, we just call exec_worker with _workerCount + 1 as worker_id
         target = self._workerTarget
-        target_kwargs= {}
         if self._workerTarget is None:
             target = exec_worker
-            target_kwargs= {"worker_id":worker_id} 
+        target_kwargs = self._workerKwargs(worker_id)
         p = multiprocessing.Process(
             target=target,
             name=workerName,
@@ -17,6 +17,7 @@ import logging
 log = logging.getLogger("zen.Events")
 
 import transaction
+from BTrees.Length import Length
 from zope.interface import implements
 from Globals import InitializeClass
 from AccessControl import ClassSecurityInfo
@@ -175,7 +176,7 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
         return insts
 
 
-    def lookup(self, evt, device):
+    def lookup(self, evt, device, find=None):
         """
         Given an event, return an event class organizer object
 
@@ -183,6 +184,9 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
         @type evt: dictionary
         @parameter device: device object
         @type device: DMD device
+        @parameter find: callable used in place of self.find to get the
+            ordered mappings for an eventClassKey
+        @type find: callable
         @return: an event class that matches the mapping
         @rtype: EventClassInst
         """
@@ -203,7 +207,7 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
 
         log.debug("No event class specified, searching for eventClassKey %s",
                   eventClassKey)
-        evtcls = self.find(eventClassKey)
+        evtcls = (find or self.find)(eventClassKey)
         log.debug("Found the following event classes that matched key %s: %s",
                   eventClassKey, evtcls)
 
@@ -222,6 +226,27 @@ class EventClass(EventClassPropertyMixin, Organizer, ManagedEntity, ZenPackable)
         return evtcl
 
 
+    def mappingsChanged(self):
+        """
+        Record that mappings were added, removed or re-keyed so that
+        in-memory mapping indexes built by zeneventd get rebuilt.
+        """
+        root = aq_base(self.getDmdRoot(self.dmdRootName))
+        counter = getattr(root, '_mappingsVersion', None)
+        if counter is None:
+            root._mappingsVersion = counter = Length()
+        counter.change(1)
+
+
+    def getMappingsVersion(self):
+        """
+        Return a number that changes whenever mappingsChanged is called.
+        """
+        root = aq_base(self.getDmdRoot(self.dmdRootName))
+        counter = getattr(root, '_mappingsVersion', None)
+        return counter() if counter is not None else 0
+
+
     def applyExtraction(self, evt):
         """Don't have extraction on event class.
         """
@@ -45,6 +45,7 @@ from Products import Zuul
 from Products.Zuul.interfaces import IInfo
 from Products.ZenUtils.Utils import zenPath
 from Products.ZenUtils.daemonconfig import IDaemonConfig
+from Products.ZenEvents.codecache import getCompiledCodeCache
 
 from zenoss.protocols.jsonformat import to_dict
 
@@ -159,18 +160,17 @@ class EventClassPropertyMixin(object):
         badLineNo = None
         badLineText = ''
         try:
-            if len(tb) == 2:
+            if isinstance(sys.exc_info()[1], SyntaxError):
                 # Compiletime error: with exceptionText in the form:
                 # '  File "<string>", line 4'
                 # We must extract the line number from the exceptionText
                 badLineNo = int(exceptionText.rsplit(None,1)[1])
                 exceptionText = "compile error on line %d" % badLineNo
             else:
-                # Runtime error: the transform code is in the third tuple
-                #1 (element 0) transformsavepoint yield
-                #2 (element 1) applyTransform exec
-                #3 (element 2) transform code
-                badLineNo = tb[2][1]
+                # Runtime error: the first frame executing the transform
+                # code is the one reporting the bad line
+                badLineNo = next(frame[1] for frame in tb
+                                 if frame[0] == "<string>")
         except Exception:
             pass
         
@@ -270,12 +270,15 @@ Transform:
             'log':log, 'component':component,
             'getFacade':Zuul.getFacade, 'IInfo':IInfo,
         }
+        codeCache = getCompiledCodeCache()
         for eventclass in transpath:
             if not eventclass.transform: continue
             startTime = time.time()
             errorCallback = partial(self.sendTransformException, eventclass, evt)
             with transformsavepoint(errorCallback):
-                exec(eventclass.transform, variables_and_funcs)
+                code = codeCache.getTransform(eventclass.getPrimaryId(),
+                                              eventclass.transform)
+                exec(code, variables_and_funcs)
             endTime = time.time()
 
             if endTime - startTime > MAX_TRANSFORM_TIME:
@@ -412,6 +415,29 @@ class EventClassInst(EventClassPropertyMixin, ZenModelRM, EventView,
         self.resolution = ""
 
 
+    def index_object(self, idxs=None):
+        """Index the mapping and flag the mapping set as changed.
+        """
+        ZenModelRM.index_object(self, idxs)
+        self._mappingsChanged()
+
+
+    def unindex_object(self):
+        """Unindex the mapping and flag the mapping set as changed.
+        """
+        ZenModelRM.unindex_object(self)
+        self._mappingsChanged()
+
+
+    def _mappingsChanged(self):
+        try:
+            events = self.getDmdRoot("Events")
+        except (AttributeError, KeyError):
+            # not yet (or no longer) part of a dmd
+            return
+        events.mappingsChanged()
+
+
     def getStatus(self, **kwargs):
         """Return the status number for this device of class statClass.
         """
@@ -438,7 +464,9 @@ class EventClassInst(EventClassPropertyMixin, ZenModelRM, EventView,
         Apply the event dict regex to extract additional values from the event.
         """
         if self.regex:
-            m = re.search(self.regex, evt.message)
+            regex = getCompiledCodeCache().getRegex(self.getPrimaryId(),
+                                                    self.regex)
+            m = regex.search(evt.message)
             if m: evt.updateFromDict(m.groupdict())
         return evt
 
@@ -475,17 +503,21 @@ class EventClassInst(EventClassPropertyMixin, ZenModelRM, EventView,
         """
         value = False
         log.debug("match on:%s", self.getPrimaryDmdId())
+        codeCache = getCompiledCodeCache()
         if self.rule:
             try:
                 log.debug("eval rule:%s", self.rule)
-                value = eval(self.rule, {'evt':evt, 'dev':device, 'device': device})
+                rule = codeCache.getRule(self.getPrimaryId(), self.rule)
+                value = eval(rule, {'evt':evt, 'dev':device, 'device': device})
             except Exception, e:
                 logging.warn("EventClassInst: %s rule failure: %s",
                             self.getDmdKey(), e)
         else:
             try:
                 log.debug("regex='%s' message='%s'", self.regex, evt.message)
-                value = re.search(self.regex, evt.message, re.I)
+                regex = codeCache.getRegex(self.getPrimaryId(), self.regex,
+                                           re.I)
+                value = regex.search(evt.message)
             except sre_constants.error: pass
         return value
 
@@ -13,6 +13,8 @@ Class for turning syslog events into Zenoss Events
 """
 
 import re
+import sre_parse
+import sre_constants
 import logging
 slog = logging.getLogger("zen.Syslog")
 import socket
@@ -95,6 +97,95 @@ for regex in parsers:
         pass
 
 
+def _flatten(subpattern, out):
+    """
+    Append the literal characters of a parsed regex that every match must
+    contain, in order, to out. None is appended wherever other text may
+    come between them.
+    """
+    for op, av in subpattern:
+        if op == sre_constants.LITERAL and 0 < av < 128:
+            out.append(chr(av))
+        elif op == sre_constants.SUBPATTERN:
+            _flatten(av[-1], out)
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) \
+                and av[0] >= 1:
+            out.append(None)
+            _flatten(av[2], out)
+            out.append(None)
+        else:
+            out.append(None)
+
+
+def requiredLiterals(compiled):
+    """
+    Return (prefix, literals) for a compiled regex: the string every match
+    starts the message with, and the strings every match contains. Both
+    are empty when nothing can be derived, e.g. for case insensitive
+    patterns.
+    """
+    if compiled.flags & (re.IGNORECASE | re.MULTILINE | re.VERBOSE):
+        return '', ()
+    try:
+        parsed = list(sre_parse.parse(compiled.pattern, compiled.flags))
+    except Exception:
+        return '', ()
+    anchored = parsed[:1] == [(sre_constants.AT, sre_constants.AT_BEGINNING)]
+    tokens = []
+    _flatten(parsed[1:] if anchored else parsed, tokens)
+    runs = ''.join(t if t is not None else '\0' for t in tokens).split('\0')
+    prefix = runs.pop(0) if anchored else ''
+    literals = []
+    for run in sorted(set(runs), key=len, reverse=True):
+        if run and not any(run in longer for longer in literals):
+            literals.append(run)
+    return prefix, tuple(literals)
+
+
+class ParserPrefilter(object):
+    """
+    Narrows down the parsers that have to be tried on a message. A parser
+    is only tried if the message starts with its literal prefix and
+    contains all of its required literal strings, which is much cheaper
+    than running a regex that cannot match. The parsers that remain are
+    tried in their original order, so the first matching parser is the
+    same as without the prefilter.
+    """
+
+    def __init__(self, parsers):
+        self.parsers = tuple(parsers)
+        self._plan = []
+        for parser, keepEntry in self.parsers:
+            prefix, literals = requiredLiterals(parser)
+            self._plan.append((parser, keepEntry, prefix, literals))
+
+    def candidates(self, msg):
+        """
+        Yield the (parser, keepEntry) pairs that may match msg, in order.
+        """
+        for parser, keepEntry, prefix, literals in self._plan:
+            if prefix and not msg.startswith(prefix):
+                continue
+            for literal in literals:
+                if literal not in msg:
+                    break
+            else:
+                yield parser, keepEntry
+
+
+_prefilter = None
+
+def parserPrefilter():
+    """
+    Return the prefilter for compiledParsers, rebuilt whenever parsers are
+    added to or removed from the list.
+    """
+    global _prefilter
+    if _prefilter is None or _prefilter.parsers != tuple(compiledParsers):
+        _prefilter = ParserPrefilter(compiledParsers)
+    return _prefilter
+
+
 class SyslogProcessor(object):
     """
     Class to process syslog messages and convert them into events viewable
@@ -263,7 +354,7 @@ class SyslogProcessor(object):
         @type: dictionary
         """
         slog.debug(msg)
-        for parser, keepEntry in compiledParsers:
+        for parser, keepEntry in parserPrefilter().candidates(msg):
             slog.debug("tag regex: %s", parser.pattern)
             m = parser.search(msg)
             if not m:
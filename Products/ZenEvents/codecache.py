@@ -0,0 +1,125 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """codecache
+
+Per-process cache of compiled event class transforms, mapping rules and
+mapping regexes.  Entries are keyed by the path of the object that owns the
+source text and are recompiled whenever that text changes.
+"""
+
+import re
+import time
+import logging
+
+log = logging.getLogger("zen.Events")
+
+TRANSFORM = 'transform'
+RULE = 'rule'
+REGEX = 'regex'
+
+
+def _compileTransform(source):
+    return compile(source, "<string>", "exec")
+
+
+def _compileRule(source):
+    return compile(source, "<string>", "eval")
+
+
+class CompiledCodeCache(object):
+    """
+    Caches code objects and regex patterns keyed by (path, kind).
+
+    A cached entry is only used if the source text it was compiled from is
+    identical to the current source text; otherwise the source is compiled
+    again and the entry replaced.  Compilation failures are cached as well
+    so that a broken rule or transform is not re-parsed for every event; the
+    original exception is raised again on every lookup.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.compileTime = 0.0
+
+    def _lookup(self, key, source, compiler):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == source:
+            self.hits += 1
+            compiled, error = entry[1], entry[2]
+        else:
+            self.misses += 1
+            compiled, error = None, None
+            start = time.time()
+            try:
+                compiled = compiler(source)
+            except Exception as e:
+                self.errors += 1
+                error = e
+            finally:
+                self.compileTime += time.time() - start
+            self._entries[key] = (source, compiled, error)
+        if error is not None:
+            raise error
+        return compiled
+
+    def getTransform(self, path, source):
+        """
+        Return the code object for the transform source owned by path.
+        """
+        return self._lookup((path, TRANSFORM), source, _compileTransform)
+
+    def getRule(self, path, source):
+        """
+        Return the code object for the mapping rule owned by path.
+        """
+        return self._lookup((path, RULE), source, _compileRule)
+
+    def getRegex(self, path, source, flags=0):
+        """
+        Return the compiled pattern for the mapping regex owned by path.
+        """
+        return self._lookup((path, REGEX, flags), source,
+                            lambda s: re.compile(s, flags))
+
+    def invalidate(self, path=None):
+        """
+        Drop the cached entries for path, or every entry if path is None.
+        """
+        if path is None:
+            self._entries.clear()
+            return
+        for key in [k for k in self._entries if k[0] == path]:
+            del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return dict(entries=len(self._entries), hits=self.hits,
+                    misses=self.misses, errors=self.errors,
+                    compileTime=self.compileTime)
+
+    def logStats(self):
+        log.info("Compiled code cache: %(entries)d entries, %(hits)d hits, "
+                 "%(misses)d misses, %(errors)d compile errors, "
+                 "%(compileTime).3f seconds compiling", self.stats())
+
+
+_cache = CompiledCodeCache()
+
+
+def getCompiledCodeCache():
+    """
+    Return the process wide CompiledCodeCache.
+    """
+    return _cache
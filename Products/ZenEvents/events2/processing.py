@@ -19,11 +19,15 @@ from Products.ZenUtils.guid.interfaces import IGUIDManager, IGlobalIdentifier
 from Products.ZenUtils.IpUtil import isip, ipToDecimal
 from Products.ZenUtils.FunctionCache import FunctionCache
 from Products.Zuul.interfaces import ICatalogTool
-from Products.AdvancedQuery import Eq, Or
+from Products.AdvancedQuery import Eq, In, Or
 from zope.component import getUtility, getUtilitiesFor
 from Acquisition import aq_chain
 from Products.ZenEvents import ZenEventClasses
+from Products.ZenEvents.codecache import getCompiledCodeCache
+from collections import defaultdict
+from contextlib import contextmanager
 from itertools import ifilterfalse
+from operator import attrgetter, itemgetter
 
 from zenoss.protocols.jsonformat import to_dict
 from zenoss.protocols.protobufs.model_pb2 import DEVICE, COMPONENT
@@ -33,6 +37,7 @@ from zenoss.protocols.protobufs.zep_pb2 import (
     STATUS_DROPPED,
     )
 
+import re
 import logging
 
 log = logging.getLogger("zen.eventd")
@@ -58,6 +63,62 @@ class EventLoggerAdapter(logging.LoggerAdapter):
                                             msg=msg)
         return msg, kwargs
 
+class EventClassMappingIndex(object):
+    """
+    In-memory index of event class mappings keyed by eventClassKey.
+
+    Replaces the catalog search and object loads done by EventClass.find.
+    The index is rebuilt whenever the mappings version kept on the Events
+    root changes, i.e. when a mapping is added, removed, moved or re-keyed.
+    Sequence numbers and rule/regex text are read from the mappings at
+    lookup time so edits to them are honoured without a rebuild.
+    """
+
+    DEFAULT_KEY = "defaultmapping"
+
+    _bySequence = staticmethod(attrgetter('sequence'))
+
+    def __init__(self, events):
+        self._events = events
+        self._version = None
+        self._mappings = {}
+
+    def _rebuild(self, version):
+        mappings = defaultdict(list)
+        codeCache = getCompiledCodeCache()
+        for inst in self._events.getInstances():
+            mappings[inst.eventClassKey].append(inst)
+            # Compile rules and regexes up front; failures are reported
+            # by EventClassInst.match when the mapping is used.
+            path = inst.getPrimaryId()
+            try:
+                if inst.rule:
+                    codeCache.getRule(path, inst.rule)
+                elif inst.regex:
+                    codeCache.getRegex(path, inst.regex, re.I)
+            except Exception:
+                pass
+        self._mappings = dict(mappings)
+        self._version = version
+        log.debug("Built event class mapping index with %d keys",
+                  len(self._mappings))
+
+    def find(self, evClassKey):
+        """
+        Return the mappings for evClassKey in sequence order followed by
+        the default mappings, like EventClass.find.
+        """
+        version = self._events.getMappingsVersion()
+        if version != self._version:
+            self._rebuild(version)
+        insts = sorted(self._mappings.get(evClassKey, ()),
+                       key=self._bySequence)
+        if evClassKey != self.DEFAULT_KEY:
+            insts.extend(sorted(self._mappings.get(self.DEFAULT_KEY, ()),
+                                key=self._bySequence))
+        return insts
+
+
 class Manager(object):
     """
     Provides lookup access to processing pipes and performs caching.
@@ -70,6 +131,7 @@ class Manager(object):
 
     def __init__(self, dmd):
         self.dmd = dmd
+        self._batchUuids = None
         self._initCatalogs()
 
     def _initCatalogs(self):
@@ -83,9 +145,23 @@ class Manager(object):
             DEVICE: self._devices,
         }
 
+        self._mappingIndex = EventClassMappingIndex(self._events)
+
     def reset(self):
         self._initCatalogs()
 
+    @contextmanager
+    def batch(self):
+        """
+        Remember element uuid lookups made while processing a batch of
+        events so each distinct identifier is only searched for once.
+        """
+        self._batchUuids = {}
+        try:
+            yield
+        finally:
+            self._batchUuids = None
+
     def getEventClassOrganizer(self, eventClassName):
         try:
             return self._events.getOrganizer(eventClassName)
@@ -98,7 +174,8 @@ class Manager(object):
         Find a Device's EventClass
         """
         return self._events.lookup(eventContext.eventProxy,
-                                   eventContext.deviceObject)
+                                   eventContext.deviceObject,
+                                   find=self._mappingIndex.find)
 
     def getElementByUuid(self, uuid):
         """
@@ -116,8 +193,23 @@ class Manager(object):
         uuid = brain.uuid
         return uuid if uuid else IGlobalIdentifier(brain.getObject()).getGUID()
 
-    @FunctionCache("getElementUuidById", cache_miss_marker=-1, default_timeout=300)
     def getElementUuidById(self, catalog, element_type_id, id):
+        """
+        Find element by ID but only cache UUID.
+        """
+        if self._batchUuids is None:
+            return self._getElementUuidById(catalog, element_type_id, id)
+        key = (catalog.getPrimaryId() if catalog else None,
+               element_type_id, id)
+        try:
+            return self._batchUuids[key]
+        except KeyError:
+            uuid = self._getElementUuidById(catalog, element_type_id, id)
+            self._batchUuids[key] = uuid
+            return uuid
+
+    @FunctionCache("getElementUuidById", cache_miss_marker=-1, default_timeout=300)
+    def _getElementUuidById(self, catalog, element_type_id, id):
         """
         Find element by ID but only cache UUID. This forces us to lookup elements
         each time by UUID (pretty fast) which gives us a chance to see if the element
@@ -151,6 +243,8 @@ class Manager(object):
             element = self.getElementByUuid(uuid)
             if not element:
                 # Lookup cache must be invalid, try looking up again
+                if self._batchUuids is not None:
+                    self._batchUuids.clear()
                 self.getElementUuidById.clear()
                 log.warning(
                         'Clearing ElementUuidById cache becase we could not find %s' % uuid)
@@ -162,6 +256,30 @@ class Manager(object):
         if obj:
             return IGlobalIdentifier(obj).getGUID()
 
+    def _getIpAddress(self, identifier, ipAddress):
+        """
+        Returns a tuple (ip address, decimal ip address) of the first of
+        ipAddress and identifier that is an IP address, or (None, None).
+        """
+        try:
+            ip_address = next(i for i in (ipAddress, identifier) if isip(i))
+            return ip_address, ipToDecimal(ip_address)
+        except Exception:
+            return None, None
+
+    def _isLoopback(self, ip_decimal):
+        # 127.x.x.x IPv4 addresses and the ::1 IPv6 address
+        return (ipToDecimal('126.255.255.255') < ip_decimal < ipToDecimal('128.0.0.0')
+                or ipToDecimal('::1') == ip_decimal)
+
+    def _findDevicesByInterfaceIp(self, ip_address, limit=None):
+        net_cat = ICatalogTool(self._networks)
+        results = net_cat.search(types=IpAddress,
+                                 query=(Eq('name', ip_address)),
+                                 limit = limit,
+                                 filterPermissions = False)
+        return [brain.getObject().device() for brain in results]
+
     def _findDevices(self, identifier, ipAddress, limit=None):
         """
         Returns a tuple ([device brains], [devices]) searching manage IP and
@@ -169,12 +287,7 @@ class Manager(object):
         """
         dev_cat = ICatalogTool(self._devices)
 
-        try:
-            ip_address = next(i for i in (ipAddress, identifier) if isip(i))
-            ip_decimal = ipToDecimal(ip_address)
-        except Exception:
-            ip_address = None
-            ip_decimal = None
+        ip_address, ip_decimal = self._getIpAddress(identifier, ipAddress)
 
         query_set = Or(Eq('id', identifier), Eq('name', identifier))
         if ip_decimal is not None:
@@ -187,26 +300,71 @@ class Manager(object):
         if device_brains:
             return device_brains, []
 
-        if ip_decimal is not None:
-            # don't search interfaces for 127.x.x.x IPv4 addresses
-            if ipToDecimal('126.255.255.255') < ip_decimal < ipToDecimal('128.0.0.0'):
-                ip_decimal = None
-            # don't search interfaces for the ::1 IPv6 address
-            elif ipToDecimal('::1') == ip_decimal:
-                ip_decimal = None
-        if ip_decimal is None:
+        # don't search interfaces for loopback addresses
+        if ip_decimal is None or self._isLoopback(ip_decimal):
             return [], []
 
-        net_cat = ICatalogTool(self._networks)
-        results = net_cat.search(types=IpAddress,
-                                 query=(Eq('name', ip_address)),
-                                 limit = limit,
-                                 filterPermissions = False)
-        devices = [brain.getObject().device() for brain in results]
+        return device_brains, self._findDevicesByInterfaceIp(ip_address, limit)
 
-        return device_brains, devices
+    def prefetchDeviceUuids(self, identifiers):
+        """
+        Resolve the device uuids for a batch of (identifier, ipAddress)
+        pairs.  Uuids cached by _findDeviceUuid are fetched in one round
+        trip; the remaining identifiers that are not IP addresses are
+        looked up with a single device search, and the rest are searched
+        for one by one like _findDeviceUuid does.  The results are written
+        back to the cache and used by findDeviceUuid for the rest of the
+        current batch.
+        """
+        if self._batchUuids is None:
+            return
+        pending = set(pair for pair in identifiers
+                      if (DEVICE,) + pair not in self._batchUuids)
+        if not pending:
+            return
+
+        cache = self._findDeviceUuid.cache
+        for args, uuid in cache.getMany([(self,) + key for key in pending]).iteritems():
+            pair = args[1:]
+            self._batchUuids[(DEVICE,) + pair] = uuid
+            pending.discard(pair)
+        if not pending:
+            return
+
+        found = {}
+        byName = [key for key in pending
+                  if self._getIpAddress(*key)[1] is None]
+        if byName:
+            names = list(set(identifier for identifier, ipAddress in byName))
+            dev_cat = ICatalogTool(self._devices)
+            brains = dev_cat.search(types=Device,
+                                    query=Or(In('id', names), In('name', names)),
+                                    filterPermissions=False)
+            # ids match exactly and names case-insensitively, as in
+            # _findDevices; the first matching brain wins like its limit=1
+            byId = {}
+            byTitle = {}
+            for position, brain in enumerate(brains):
+                byId.setdefault(brain.id, (position, brain))
+                byTitle.setdefault((brain.name or '').lower(), (position, brain))
+            for identifier, ipAddress in byName:
+                matches = filter(None, (byId.get(identifier),
+                                        byTitle.get(identifier.lower())))
+                uuid = None
+                if matches:
+                    uuid = self.uuidFromBrain(min(matches, key=itemgetter(0))[1])
+                found[(identifier, ipAddress)] = uuid
+
+        # identifiers with an IP address match manage and interface IPs as
+        # well, so they go through the regular search
+        for pair in pending.difference(byName):
+            found[pair] = self._searchDeviceUuid(*pair)
+
+        for pair, uuid in found.iteritems():
+            self._batchUuids[(DEVICE,) + pair] = uuid
+        cache.addMany(dict(((self,) + pair, uuid)
+                           for pair, uuid in found.iteritems()))
 
-    @FunctionCache("findDeviceUuid", cache_miss_marker=-1, default_timeout=300)
     def findDeviceUuid(self, identifier, ipAddress):
         """
         This will return the device's
@@ -215,6 +373,21 @@ class Manager(object):
         @type  ipaddress: string
         @param ipaddress: The known ipaddress of the device
         """
+        if self._batchUuids is None:
+            return self._findDeviceUuid(identifier, ipAddress)
+        key = (DEVICE, identifier, ipAddress)
+        try:
+            return self._batchUuids[key]
+        except KeyError:
+            uuid = self._findDeviceUuid(identifier, ipAddress)
+            self._batchUuids[key] = uuid
+            return uuid
+
+    @FunctionCache("findDeviceUuid", cache_miss_marker=-1, default_timeout=300)
+    def _findDeviceUuid(self, identifier, ipAddress):
+        return self._searchDeviceUuid(identifier, ipAddress)
+
+    def _searchDeviceUuid(self, identifier, ipAddress):
         device_brains, devices = self._findDevices(identifier, ipAddress, limit=1)
         if device_brains:
             return self.uuidFromBrain(device_brains[0])
@@ -0,0 +1,108 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """benchSyslogParsers
+
+Compare the time SyslogProcessor.parseTag spends per message with and
+without the parser prefilter.
+
+    python benchSyslogParsers.py [captured.log] [repeat]
+
+captured.log holds one raw syslog message per line, as received by
+zensyslog (e.g. the origsyslog.log written with --logorig --logformat=raw).
+Without it a set of sample messages is used.
+"""
+
+import sys
+import time
+
+import Globals
+from Products.ZenEvents.SyslogProcessing import SyslogProcessor, \
+    compiledParsers, parserPrefilter
+from Products.ZenUtils.Utils import unused
+unused(Globals)
+
+SAMPLES = (
+    "<13>Oct 11 22:14:15 mymachine su[1234]: 'su root' failed for lonvick on /dev/pts/8",
+    "<165>Aug 24 05:34:00 myhost myproc[10]: %% It's time to make the do-nuts. %%",
+    "<34>Oct 11 22:14:15 mymachine su: 'su root' failed for lonvick on /dev/pts/8",
+    "<189>Oct 11 22:14:15 router1 %SYS-5-CONFIG_I: Configured from console by vty0",
+    "<187>Oct 11 22:14:15 router1 %LINK-3-UPDOWN: Interface GigabitEthernet0/1, changed state to down",
+    "<134>Oct 11 22:14:15 fw date=2016-01-01 devname=blue log_id=987654321 type=traffic blah blah",
+    "<134>Oct 11 22:14:15 router2 Process 10532, Nbr 192.168.10.13 on GigabitEthernet2/15 from LOADING to FULL, Loading Done",
+    "<134>Oct 11 22:14:15 vpn 54884 05/25/2009 13:41:14.060 SEV=3 HTTP/42 RPT=4623 Error on socket accept.",
+    "<134>Oct 11 22:14:15 filer [deviceName: 10/100/1000/e1a:warning]: Client 10.0.0.101 is trying to access an unexported mount",
+    "<134>Oct 11 22:14:15 array 2626:48:VolExec:27-Aug-2009 13:15:58.072049:VE_VolSetWorker.hh:75:WARNING:43.3.2:Volume volumeName has reached 96 percent",
+    "<14>Oct 11 22:14:15 host1 this message does not match any parser at all",
+    "<14>Oct 11 22:14:15 host2 -- MARK --",
+)
+
+
+def sendEvent(evt):
+    pass
+
+
+def unfiltered(msg):
+    for parser, keepEntry in compiledParsers:
+        m = parser.search(msg)
+        if m:
+            return parser, keepEntry, m.groupdict()
+
+
+def filtered(msg):
+    for parser, keepEntry in parserPrefilter().candidates(msg):
+        m = parser.search(msg)
+        if m:
+            return parser, keepEntry, m.groupdict()
+
+
+def timeit(parse, messages, repeat):
+    start = time.time()
+    for i in xrange(repeat):
+        for msg in messages:
+            parse(msg)
+    return time.time() - start
+
+
+def main(args):
+    if args:
+        with open(args[0]) as f:
+            raw = [line.rstrip('\n') for line in f if line.strip()]
+    else:
+        raw = SAMPLES
+    repeat = int(args[1]) if len(args) > 1 else 1000
+
+    # parseTag sees the message without its PRI and HEADER
+    processor = SyslogProcessor(sendEvent, 6, True, 'localhost', 3)
+    messages = []
+    for msg in raw:
+        evt, msg = processor.parsePRI(dict(device='localhost'), msg)
+        evt, msg = processor.parseHEADER(evt, msg)
+        messages.append(msg)
+
+    mismatches = [message for message in messages
+                  if filtered(message) != unfiltered(message)]
+    if mismatches:
+        print "Parsers differ for %d messages:" % len(mismatches)
+        for message in mismatches:
+            print "  %s" % message
+        return 1
+
+    count = len(messages) * repeat
+    before = timeit(unfiltered, messages, repeat)
+    after = timeit(filtered, messages, repeat)
+    print "%d messages, %d parsers" % (len(messages), len(compiledParsers))
+    print "without prefilter: %.2f usec/message" % (before / count * 1e6)
+    print "with prefilter:    %.2f usec/message" % (after / count * 1e6)
+    print "speedup:           %.1fx" % (before / after)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,71 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import re
+import sre_constants
+
+from Products.ZenEvents.codecache import CompiledCodeCache
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+class CompiledCodeCacheTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(CompiledCodeCacheTest, self).afterSetUp()
+        self.cache = CompiledCodeCache()
+
+    def testTransformIsCompiledOnce(self):
+        first = self.cache.getTransform('/a', 'x = 1')
+        second = self.cache.getTransform('/a', 'x = 1')
+        self.assertIs(first, second)
+        self.assertEquals(1, self.cache.misses)
+        self.assertEquals(1, self.cache.hits)
+        env = {}
+        exec(first, env)
+        self.assertEquals(1, env['x'])
+
+    def testChangedSourceIsRecompiled(self):
+        first = self.cache.getRule('/a', 'evt == 1')
+        second = self.cache.getRule('/a', 'evt == 2')
+        self.assertIsNot(first, second)
+        self.assertEquals(2, self.cache.misses)
+        self.assertTrue(eval(second, {'evt': 2}))
+        self.assertEquals(1, len(self.cache))
+
+    def testRegexFlagsArePartOfTheKey(self):
+        plain = self.cache.getRegex('/a', 'abc')
+        nocase = self.cache.getRegex('/a', 'abc', re.I)
+        self.assertIsNone(plain.search('ABC'))
+        self.assertIsNotNone(nocase.search('ABC'))
+
+    def testCompileErrorsAreCached(self):
+        for i in range(2):
+            self.assertRaises(SyntaxError,
+                              self.cache.getTransform, '/a', 'if')
+            self.assertRaises(sre_constants.error,
+                              self.cache.getRegex, '/a', '(')
+        self.assertEquals(2, self.cache.misses)
+        self.assertEquals(2, self.cache.hits)
+        self.assertEquals(2, self.cache.errors)
+
+    def testInvalidate(self):
+        self.cache.getTransform('/a', 'x = 1')
+        self.cache.getRule('/a', 'True')
+        self.cache.getRule('/b', 'True')
+        self.cache.invalidate('/a')
+        self.assertEquals(1, len(self.cache))
+        self.cache.invalidate()
+        self.assertEquals(0, len(self.cache))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(CompiledCodeCacheTest))
+    return suite
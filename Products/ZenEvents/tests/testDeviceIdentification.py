@@ -36,6 +36,61 @@ class DeviceIdTest(BaseTestCase):
         test('dev', '10.10.10.3', "failed to find by interface's secondary IP")
         test('dev', '10.10.10.4', "failed missing IP test", None)
 
+    def testBatchPrefetch(self):
+        device = self.dmd.Devices.createInstance('mydevice')
+        device.setManageIp('10.10.10.1')
+        device.os.addIpInterface('eth0', False)
+        device.os.interfaces()[0].addIpAddress('10.10.10.2')
+
+        device_uuid = IGlobalIdentifier(device).getGUID()
+        manager = Manager(self.dmd)
+        pairs = [('mydevice', ''), ('10.10.10.1', ''), ('dev', '10.10.10.2'),
+                 ('dev', '10.10.10.4'), ('mydevice', '')]
+        with manager.batch():
+            manager.prefetchDeviceUuids(pairs)
+            # results come from the batch, not from new searches
+            manager._findDeviceUuid = None
+            for id, ip in pairs[:3]:
+                self.assertEquals(manager.findDeviceUuid(id, ip), device_uuid)
+            self.assertEquals(manager.findDeviceUuid('dev', '10.10.10.4'), None)
+        self.assertEquals(manager._batchUuids, None)
+
+    def testBatchPrefetchUsesCache(self):
+        device = self.dmd.Devices.createInstance('mydevice')
+        device.setTitle('My Device')
+        device_uuid = IGlobalIdentifier(device).getGUID()
+        manager = Manager(self.dmd)
+        cache = Manager._findDeviceUuid.cache
+        cached = {(manager, 'cached', ''): 'cached-uuid',
+                  (manager, 'missing', ''): None}
+        added = {}
+        cache.getMany = lambda argsList: dict(
+            (args, cached[args]) for args in argsList if args in cached)
+        cache.addMany = added.update
+        searches = []
+        search = manager._searchDeviceUuid
+        def countingSearch(*pair):
+            searches.append(pair)
+            return search(*pair)
+        manager._searchDeviceUuid = countingSearch
+        try:
+            pairs = [('cached', ''), ('missing', ''), ('mydevice', ''),
+                     ('my device', ''), ('MYDEVICE', ''), ('dev', '10.10.10.4')]
+            with manager.batch():
+                manager.prefetchDeviceUuids(pairs)
+                uuids = [manager.findDeviceUuid(*pair) for pair in pairs]
+        finally:
+            del cache.getMany
+            del cache.addMany
+        self.assertEquals(['cached-uuid', None, device_uuid, device_uuid,
+                           None, None], uuids)
+        # only the IP address goes through the per-identifier search
+        self.assertEquals([('dev', '10.10.10.4')], searches)
+        self.assertEquals({(manager, 'mydevice', ''): device_uuid,
+                           (manager, 'my device', ''): device_uuid,
+                           (manager, 'MYDEVICE', ''): None,
+                           (manager, 'dev', '10.10.10.4'): None}, added)
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     tests = []
@@ -0,0 +1,58 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from Products.ZenEvents.events2.processing import EventClassMappingIndex
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+class EventClassMappingIndexTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(EventClassMappingIndexTest, self).afterSetUp()
+        self.events = self.dmd.Events
+        self.index = EventClassMappingIndex(self.events)
+
+    def _addMapping(self, organizer, id, key):
+        inst = self.events.createOrganizer(organizer).createInstance(id)
+        inst.unindex_object()
+        inst.eventClassKey = key
+        inst.sequence = self.events.nextSequenceNumber(key)
+        inst.index_object()
+        return inst
+
+    def testMatchesCatalogFind(self):
+        self._addMapping('/App', 'first', 'mykey')
+        self._addMapping('/Perf', 'second', 'mykey')
+        self._addMapping('/App', 'fallback', 'defaultmapping')
+        self.assertEquals(self.events.find('mykey'),
+                          self.index.find('mykey'))
+        self.assertEquals(self.events.find('defaultmapping'),
+                          self.index.find('defaultmapping'))
+
+    def testRebuildsWhenMappingsChange(self):
+        first = self._addMapping('/App', 'first', 'mykey')
+        self.assertEquals([first], self.index.find('mykey'))
+        second = self._addMapping('/App', 'second', 'mykey')
+        self.assertEquals([first, second], self.index.find('mykey'))
+        self.events.App.removeInstances(['first'])
+        self.assertEquals([second], self.index.find('mykey'))
+
+    def testSequenceIsReadAtLookup(self):
+        first = self._addMapping('/App', 'first', 'mykey')
+        second = self._addMapping('/App', 'second', 'mykey')
+        self.index.find('mykey')
+        first.sequence, second.sequence = second.sequence, first.sequence
+        self.assertEquals([second, first], self.index.find('mykey'))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(EventClassMappingIndexTest))
+    return suite
@@ -0,0 +1,92 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from optparse import Values
+
+from Products.ZenEvents import zeneventd
+from Products.ZenEvents.zeneventdEvents import EventDWorkerPool
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+class MockQueueSchema(object):
+
+    def getQueue(self, name):
+        return name
+
+    def getExchange(self, name):
+        return name
+
+
+class MockQueueConsumer(object):
+
+    def __init__(self, task, dmd):
+        self.prefetch = None
+
+    def setPrefetch(self, prefetch):
+        self.prefetch = prefetch
+
+
+class EventDWorkerPoolTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(EventDWorkerPoolTest, self).afterSetUp()
+        self._getUtility = zeneventd.getUtility
+        self._QueueConsumer = zeneventd.QueueConsumer
+        zeneventd.getUtility = lambda iface: MockQueueSchema()
+        zeneventd.QueueConsumer = MockQueueConsumer
+
+    def beforeTearDown(self):
+        zeneventd.getUtility = self._getUtility
+        zeneventd.QueueConsumer = self._QueueConsumer
+        super(EventDWorkerPoolTest, self).beforeTearDown()
+
+    def _pool(self, workers, prefetch, messagesPerWorker=1):
+        return EventDWorkerPool(Values(dict(workers=workers,
+                                            prefetch=prefetch,
+                                            messagesPerWorker=messagesPerWorker)))
+
+    def testPrefetchIsSpreadAcrossWorkers(self):
+        pool = self._pool(3, 10)
+        shares = [pool.prefetchShare(str(i)) for i in range(1, 4)]
+        self.assertEquals([4, 3, 3], shares)
+
+    def testEveryWorkerPrefetchesAtLeastOne(self):
+        pool = self._pool(4, 2)
+        shares = [pool.prefetchShare(str(i)) for i in range(1, 5)]
+        self.assertEquals([1, 1, 1, 1], shares)
+
+    def testMessagesPerWorkerWithoutPrefetch(self):
+        pool = self._pool(2, 0, messagesPerWorker=5)
+        self.assertEquals(5, pool.prefetchShare('2'))
+
+    def testWorkersAreGivenTheirShare(self):
+        pool = self._pool(2, 5)
+        kwargs = pool._workerKwargs('1')
+        self.assertEquals('1', kwargs['worker_id'])
+        self.assertEquals(['--messagesperworker=3'], kwargs['extra_args'])
+
+    def testBatchWorkerKeepsPrefetchShare(self):
+        pool = self._pool(2, 40)
+        share = pool.prefetchShare('1')
+        worker = zeneventd.EventDTwistedWorker(self.dmd, batchSize=10,
+                                               prefetch=share)
+        self.assertEquals(20, worker._consumer.prefetch)
+        # a batch is never split across prefetch windows
+        worker = zeneventd.EventDTwistedWorker(self.dmd, batchSize=10,
+                                               prefetch=4)
+        self.assertEquals(10, worker._consumer.prefetch)
+        worker = zeneventd.EventDTwistedWorker(self.dmd)
+        self.assertEquals(None, worker._consumer.prefetch)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(EventDWorkerPoolTest))
+    return suite
@@ -8,7 +8,10 @@
 ##############################################################################
 
 
-from Products.ZenEvents.SyslogProcessing import SyslogProcessor
+import re
+
+from Products.ZenEvents.SyslogProcessing import SyslogProcessor, \
+    ParserPrefilter, requiredLiterals
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
 
 class SyslogProcessingTest(BaseTestCase):
@@ -114,6 +117,28 @@ class SyslogProcessingTest(BaseTestCase):
         self.assertEquals(evt.get('component'), '10/100/1000/e1a')
         self.assertEquals(evt.get('summary'), 'Client 10.0.0.101 (xid 4251521131) is trying to access an unexported mount (fileid 64, snapid 0, generation 6111516 and flags 0x0 on volume 0xc97d89a [No volume name available])')
 
+    def testRequiredLiterals(self):
+        compiled = re.compile(r"^Process (?P<id>\d+), Nbr (?P<nbr>\S+) on (x|y)")
+        self.assertEquals(('Process ', (', Nbr ', ' on ')),
+                          requiredLiterals(compiled))
+        compiled = re.compile(r"(?P<component>\S+)\[(?P<pid>\d+)\]:\s*")
+        self.assertEquals(('', (']:', '[')), requiredLiterals(compiled))
+        compiled = re.compile(r"^mark", re.IGNORECASE)
+        self.assertEquals(('', ()), requiredLiterals(compiled))
+
+    def testPrefilterKeepsFirstMatch(self):
+        parsers = [(re.compile(r"^date=.+ log_id=(?P<eventClassKey>\d+)"), True),
+                   (re.compile(r"(?P<component>\S+)\[(?P<pid>\d+)\]:"), True),
+                   (re.compile(r"(?P<component>\S+): (?P<summary>.*)"), False)]
+        prefilter = ParserPrefilter(parsers)
+        for msg in ("date=x log_id=1 a: b", "proc[12]: a: b", "proc: msg",
+                    "nothing to see here", "log_id=1 date=x"):
+            candidates = list(prefilter.candidates(msg))
+            expected = [p for p in parsers if p[0].search(msg)]
+            self.assertEquals(expected, [p for p in candidates
+                                         if p[0].search(msg)])
+        self.assertEquals([], list(prefilter.candidates("no match")))
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
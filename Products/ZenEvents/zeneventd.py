@@ -20,6 +20,7 @@ monkey_patch_rotatingfilehandler()
 from twisted.internet import reactor
 from twisted.internet import defer
 
+import json
 import time
 from datetime import datetime, timedelta
 
@@ -37,6 +38,7 @@ from Products.ZenUtils.daemonconfig import IDaemonConfig
 from Products.ZenUtils.Utils import zenPath
 from zenoss.protocols.interfaces import IAMQPConnectionInfo, IQueueSchema
 from zenoss.protocols.protobufs.zep_pb2 import ZepRawEvent, Event, STATUS_DROPPED
+from zenoss.protocols.protobufs.model_pb2 import DEVICE
 from zenoss.protocols.jsonformat import from_dict, to_dict
 from zenoss.protocols import hydrateQueueMessage
 from Products.ZenMessaging.queuemessaging.QueueConsumer import QueueConsumer
@@ -44,7 +46,9 @@ from Products.ZenEvents.events2.processing import (Manager, EventPluginPipe, Che
     AddDeviceContextAndTagsPipe, TransformAndReidentPipe, TransformPipe, UpdateDeviceContextAndTagsPipe,
     AssignDefaultEventClassAndTagPipe, FingerprintPipe, SerializeContextPipe, ClearClassRefreshPipe,
     EventContext, DropEvent, ProcessingException, CheckHeartBeatPipe)
+from Products.ZenEvents.events2.proxy import EventProxy
 from Products.ZenEvents.interfaces import IPreEventPlugin, IPostEventPlugin
+from Products.ZenEvents.codecache import getCompiledCodeCache
 from Products.ZenEvents.daemonlifecycle import DaemonCreatedEvent, SigTermEvent, SigUsr1Event
 from Products.ZenEvents.daemonlifecycle import DaemonStartRunEvent, BuildOptionsEvent
 
@@ -53,12 +57,61 @@ log = logging.getLogger("zen.eventd")
 EXCHANGE_ZEP_ZEN_EVENTS = '$ZepZenEvents'
 QUEUE_RAW_ZEN_EVENTS = '$RawZenEvents'
 
+class EventProcessorStats(object):
+    """
+    Counters kept by an EventPipelineProcessor.
+    """
+
+    FIELDS = ('processed', 'dropped', 'failed', 'processingTime')
+
+    def __init__(self):
+        self.processed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.processingTime = 0.0
+
+    def asDict(self):
+        return dict((field, getattr(self, field)) for field in self.FIELDS)
+
+
+def workerStatsPath(workerid):
+    return zenPath('var', 'zeneventd', 'workerstats', 'worker-%s.json' % workerid)
+
+
+def reportWorkerStats(processor, workerid=None):
+    """
+    Log the counters of processor and of the compiled code cache.  Workers
+    started by a zeneventd supervisor also write them to a file the
+    supervisor reads to log totals for the whole pool.
+    """
+    stats = {
+        'pid': os.getpid(),
+        'events': processor.stats.asDict() if processor else {},
+        'codeCache': getCompiledCodeCache().stats(),
+    }
+    log.info("Event processing: %s", stats['events'])
+    getCompiledCodeCache().logStats()
+    if workerid is None:
+        return
+    path = workerStatsPath(workerid)
+    try:
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        tmppath = '%s.%s' % (path, os.getpid())
+        with open(tmppath, 'w') as f:
+            json.dump(stats, f)
+        os.rename(tmppath, path)
+    except (IOError, OSError) as e:
+        log.warn("Unable to write worker statistics to %s: %s", path, e)
+
+
 class EventPipelineProcessor(object):
 
     SYNC_EVERY_EVENT = False
 
     def __init__(self, dmd):
         self.dmd = dmd
+        self.stats = EventProcessorStats()
         self._manager = Manager(self.dmd)
         self._pipes = (
             EventPluginPipe(self._manager, IPreEventPlugin, 'PreEventPluginPipe'),
@@ -86,12 +139,7 @@ class EventPipelineProcessor(object):
             self.nextSync = datetime.now()
             self.syncInterval = timedelta(0,0,500000)
 
-    def processMessage(self, message):
-        """
-        Handles a queue message, can call "acknowledge" on the Queue Consumer
-        class when it is done with the message
-        """
-
+    def _syncIfNeeded(self):
         if self.SYNC_EVERY_EVENT:
             doSync = True
         else:
@@ -103,6 +151,64 @@ class EventPipelineProcessor(object):
         if doSync:
             self.dmd._p_jar.sync()
 
+    def processMessage(self, message):
+        """
+        Handles a queue message, can call "acknowledge" on the Queue Consumer
+        class when it is done with the message
+        """
+        self._syncIfNeeded()
+        return self._processMessage(message)
+
+    def processMessages(self, messages):
+        """
+        Handles a batch of queue messages.  Device identifiers for the whole
+        batch are resolved up front, one search per distinct device id and
+        IP address, before each event runs through the pipes.
+
+        Returns a list with one entry per message, in order: the processed
+        ZepRawEvent, or the DropEvent raised for a dropped event.
+        """
+        self._syncIfNeeded()
+        results = []
+        with self._manager.batch():
+            try:
+                self._manager.prefetchDeviceUuids(
+                    self._deviceIdentifiers(messages))
+            except Exception:
+                # each event will be identified on its own instead
+                log.exception("Unable to identify devices for event batch")
+            for message in messages:
+                try:
+                    results.append(self._processMessage(message))
+                except DropEvent as e:
+                    results.append(e)
+        return results
+
+    def _deviceIdentifiers(self, messages):
+        """
+        Returns the (identifier, ipAddress) pairs of the events whose device
+        uuid still has to be looked up.
+        """
+        for message in messages:
+            actor = message.actor
+            if (actor.HasField('element_type_id')
+                    and actor.element_type_id == DEVICE
+                    and actor.HasField('element_identifier')
+                    and not actor.HasField('element_uuid')):
+                yield actor.element_identifier, EventProxy(message).ipAddress
+
+    def _processMessage(self, message):
+        start = time.time()
+        try:
+            return self._runPipes(message)
+        except DropEvent:
+            self.stats.dropped += 1
+            raise
+        finally:
+            self.stats.processed += 1
+            self.stats.processingTime += time.time() - start
+
+    def _runPipes(self, message):
         try:
             retry = True
             processed = False
@@ -139,6 +245,7 @@ class EventPipelineProcessor(object):
             # we want these to propagate out
             raise
         except Exception as e:
+            self.stats.failed += 1
             log.info("Failed to process event, forward original raw event: %s", to_dict(zepevent.event))
             # Pipes and plugins may raise ProcessingException's for their own reasons - only log unexpected
             # exceptions of other type (will insert stack trace in log)
@@ -186,45 +293,107 @@ class BaseQueueConsumerTask(object):
 
 class TwistedQueueConsumerTask(BaseQueueConsumerTask):
 
-    def __init__(self, processor):
+    def __init__(self, processor, batchSize=1, batchTimeout=0.1):
         BaseQueueConsumerTask.__init__(self, processor)
         self.queue = self._queueSchema.getQueue(QUEUE_RAW_ZEN_EVENTS)
+        self._batchSize = batchSize
+        self._batchTimeout = batchTimeout
+        self._batch = []
+        self._flushCall = None
 
-    @defer.inlineCallbacks
     def processMessage(self, message):
         try:
             hydrated = hydrateQueueMessage(message, self._queueSchema)
         except Exception as e:
             log.error("Failed to hydrate raw event: %s", e)
+            return self.queueConsumer.acknowledge(message)
+        if self._batchSize <= 1:
+            return self._processHydrated(message, hydrated)
+        self._batch.append((message, hydrated))
+        if len(self._batch) >= self._batchSize:
+            return self.flush()
+        if self._flushCall is None:
+            self._flushCall = reactor.callLater(self._batchTimeout, self.flush)
+        return defer.succeed(None)
+
+    @defer.inlineCallbacks
+    def _processHydrated(self, message, hydrated):
+        try:
+            zepRawEvent = self.processor.processMessage(hydrated)
+            yield self._publish(zepRawEvent)
             yield self.queueConsumer.acknowledge(message)
-        else:
-            try:
-                zepRawEvent = self.processor.processMessage(hydrated)
-                if log.isEnabledFor(logging.DEBUG):
-                    log.debug("Publishing event: %s", to_dict(zepRawEvent))
-                yield self.queueConsumer.publishMessage(EXCHANGE_ZEP_ZEN_EVENTS,
-                    self._routing_key(zepRawEvent), zepRawEvent, declareExchange=False)
-                yield self.queueConsumer.acknowledge(message)
-            except DropEvent as e:
+        except DropEvent as e:
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('%s - %s' % (e.message, to_dict(e.event)))
+            yield self.queueConsumer.acknowledge(message)
+        except ProcessingException as e:
+            log.error('%s - %s' % (e.message, to_dict(e.event)))
+            log.exception(e)
+            yield self.queueConsumer.reject(message)
+        except Exception as e:
+            log.exception(e)
+            yield self.queueConsumer.reject(message)
+
+    @defer.inlineCallbacks
+    def flush(self):
+        """
+        Process the messages collected so far as one batch, then
+        acknowledge them together.
+        """
+        if self._flushCall is not None:
+            if self._flushCall.active():
+                self._flushCall.cancel()
+            self._flushCall = None
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        try:
+            results = self.processor.processMessages(
+                [hydrated for message, hydrated in batch])
+        except Exception as e:
+            log.exception(e)
+            yield defer.DeferredList([self.queueConsumer.reject(message)
+                                      for message, hydrated in batch])
+            return
+
+        acks = []
+        for (message, hydrated), result in zip(batch, results):
+            if isinstance(result, DropEvent):
                 if log.isEnabledFor(logging.DEBUG):
-                    log.debug('%s - %s' % (e.message, to_dict(e.event)))
-                yield self.queueConsumer.acknowledge(message)
-            except ProcessingException as e:
-                log.error('%s - %s' % (e.message, to_dict(e.event)))
-                log.exception(e)
-                yield self.queueConsumer.reject(message)
+                    log.debug('%s - %s' % (result.message, to_dict(result.event)))
+                acks.append(message)
+                continue
+            try:
+                yield self._publish(result)
+                acks.append(message)
             except Exception as e:
                 log.exception(e)
                 yield self.queueConsumer.reject(message)
+        yield defer.DeferredList([self.queueConsumer.acknowledge(message)
+                                  for message in acks])
+
+    def _publish(self, zepRawEvent):
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("Publishing event: %s", to_dict(zepRawEvent))
+        return self.queueConsumer.publishMessage(EXCHANGE_ZEP_ZEN_EVENTS,
+            self._routing_key(zepRawEvent), zepRawEvent, declareExchange=False)
 
 
 class EventDTwistedWorker(object):
-    def __init__(self, dmd):
+    def __init__(self, dmd, batchSize=1, batchTimeout=0.1, prefetch=1):
         super(EventDTwistedWorker, self).__init__()
         self._amqpConnectionInfo = getUtility(IAMQPConnectionInfo)
         self._queueSchema = getUtility(IQueueSchema)
-        self._consumer_task = TwistedQueueConsumerTask(EventPipelineProcessor(dmd))
+        self.processor = EventPipelineProcessor(dmd)
+        self._consumer_task = TwistedQueueConsumerTask(
+            self.processor, batchSize, batchTimeout)
         self._consumer = QueueConsumer(self._consumer_task, dmd)
+        # the whole batch has to be unacknowledged at once, so never
+        # prefetch fewer messages than a batch holds
+        prefetch = max(batchSize, prefetch)
+        if prefetch > 1:
+            self._consumer.setPrefetch(prefetch)
 
     def run(self):
         reactor.callWhenRunning(self._start)
@@ -236,6 +405,8 @@ class EventDTwistedWorker(object):
 
     @defer.inlineCallbacks
     def _shutdown(self):
+        if self._consumer_task:
+            yield self._consumer_task.flush()
         if self._consumer:
             yield self._consumer.shutdown()
 
@@ -256,6 +427,8 @@ class ZenEventD(ZCmdBase):
                                                      self.options.maintenancecycle *3)
         self._maintenanceCycle = MaintenanceCycle(self.options.maintenancecycle,
                                   self._heartbeatSender)
+        # processor of the in-process twisted worker, if one is running
+        self._processor = None
         objectEventNotify(DaemonCreatedEvent(self))
         config = ZenEventDConfig(self.options)
         provideUtility(config, IDaemonConfig, 'zeneventd_config')
@@ -276,6 +449,10 @@ class ZenEventD(ZCmdBase):
         log.debug('sighandler_USR1 called %s' % signum)
         objectEventNotify(SigUsr1Event(self, signum))
 
+    def _sigUSR1_called(self, signum, frame):
+        if not (self.options.daemon or self.options.cycle):
+            reportWorkerStats(self._processor, self.options.workerid)
+
     def buildOptions(self):
         super(ZenEventD, self).buildOptions()
         maintenanceBuildOptions(self.parser)
@@ -292,6 +469,13 @@ class ZenEventD(ZCmdBase):
                     help='Sets the number of pickle files in var/zeneventd/failed_transformed_events.')
         self.parser.add_option('--pickledir', dest='pickledir', default=zenPath('var/zeneventd/failed_transformed_events'),
                     type="string", help='Sets the path to save pickle files.')
+        self.parser.add_option('--eventbatchsize', dest='eventBatchSize', default=1, type="int",
+                    help='Sets the number of queued events processed and acknowledged together, with device '
+                    'identification done once per batch. Default is 1 (no batching).')
+        self.parser.add_option('--eventbatchtimeout', dest='eventBatchTimeout', default=0.1, type="float",
+                    help='Sets the maximum number of seconds to wait for a batch to fill up. Default is 0.1.')
+        self.parser.add_option('--workerid', dest='workerid', type='int', default=None,
+                    help='ID of the worker instance; set by the zeneventd supervisor.')
         objectEventNotify(BuildOptionsEvent(self))
 
 
@@ -8,14 +8,75 @@
 ##############################################################################
 
 
+import json
+import logging
 import pkg_resources
 from zenoss.protocols.eventlet.amqp import register_eventlet
 from twisted.internet import reactor
 from zope.component import adapter, getGlobalSiteManager
-from Products.ZenEvents.zeneventd import ZenEventD
+from Products.ZenEvents.zeneventd import ZenEventD, EventDTwistedWorker
+from Products.ZenEvents.zeneventd import workerStatsPath
 from Products.ZenEvents.daemonlifecycle import DaemonCreatedEvent, DaemonStartRunEvent
 from Products.ZenEvents.daemonlifecycle import SigTermEvent, SigUsr1Event, BuildOptionsEvent
-from Products.ZenCollector.utils.workers import ProcessWorkers, workersBuildOptions, exec_worker
+from Products.ZenCollector.utils.workers import ProcessWorkers, workersBuildOptions
+
+log = logging.getLogger("zen.eventd")
+
+# seconds the workers are given to write their statistics after SIGUSR1
+WORKER_STATS_DELAY = 2
+
+
+class EventDWorkerPool(ProcessWorkers):
+    """
+    Supervises the zeneventd worker processes. Each worker is a separate
+    zeneventd process with its own ZODB connection and queue consumer; dead
+    workers are restarted with the same worker id.
+    """
+
+    def __init__(self, options):
+        super(EventDWorkerPool, self).__init__(options.workers, None, "Event worker")
+        self._messagesPerWorker = options.messagesPerWorker
+        self._prefetch = options.prefetch
+
+    def prefetchShare(self, worker_id):
+        """
+        Returns the number of messages worker_id prefetches. A --prefetch
+        total is spread as evenly as possible across the workers, otherwise
+        every worker uses --messagesperworker.
+        """
+        if self._prefetch <= 0:
+            return self._messagesPerWorker
+        share, remainder = divmod(self._prefetch, self._maxWorkers)
+        if int(worker_id) <= remainder:
+            share += 1
+        return max(1, share)
+
+    def _workerKwargs(self, worker_id):
+        return {
+            "worker_id": worker_id,
+            "extra_args": ['--messagesperworker=%d' % self.prefetchShare(worker_id)],
+        }
+
+    def logCombinedStats(self):
+        """
+        Log the statistics written by each worker and their totals.
+        """
+        totals = {}
+        for worker_id in sorted(self._workers):
+            path = workerStatsPath(worker_id)
+            try:
+                with open(path) as f:
+                    stats = json.load(f)
+            except (IOError, ValueError) as e:
+                log.info("No statistics from worker %s: %s", worker_id, e)
+                continue
+            log.info("Worker %s (pid %s): %s", worker_id, stats.get('pid'), stats)
+            for group in ('events', 'codeCache'):
+                total = totals.setdefault(group, {})
+                for name, value in stats.get(group, {}).iteritems():
+                    total[name] = total.get(name, 0) + value
+        log.info("All %d workers: %s", len(self._workers), totals)
+
 
 @adapter(ZenEventD, SigTermEvent)
 def onSigTerm(daemon, event):
@@ -26,10 +87,14 @@ def onSigTerm(daemon, event):
 def onSigUsr1(daemon, event):
     if daemon.options.daemon:
         daemon._workers.sendSignal(event.signum)
+        reactor.callLater(WORKER_STATS_DELAY, daemon._workers.logCombinedStats)
 
 @adapter(ZenEventD, BuildOptionsEvent)
 def onBuildOptions(daemon, event):
     workersBuildOptions(daemon.parser, default=1)
+    daemon.parser.add_option('--prefetch', dest='prefetch', default=0, type="int",
+                help='Total number of messages prefetched from the queue by all workers, spread evenly '
+                'across them. Default is 0, meaning each worker uses --messagesperworker.')
 
 @adapter(ZenEventD, DaemonCreatedEvent)
 def onDaemonCreated(daemon, event):
@@ -38,7 +103,7 @@ def onDaemonCreated(daemon, event):
     """
     register_eventlet()
     if daemon.options.daemon or daemon.options.cycle:
-        daemon._workers = ProcessWorkers(daemon.options.workers, exec_worker, "Event worker")
+        daemon._workers = EventDWorkerPool(daemon.options)
 
 @adapter(ZenEventD, DaemonStartRunEvent)
 def onDaemonStartRun(daemon, event):
@@ -53,6 +118,14 @@ def onDaemonStartRun(daemon, event):
         daemon.closeAll()
         daemon._workers.startWorkers()
         reactor.run()
+    elif daemon.options.eventBatchSize > 1:
+        # batches are collected and acknowledged by the twisted consumer
+        worker = EventDTwistedWorker(daemon.dmd,
+                                     daemon.options.eventBatchSize,
+                                     daemon.options.eventBatchTimeout,
+                                     daemon.options.messagesPerWorker)
+        daemon._processor = worker.processor
+        worker.run()
     else:
         worker = EventDEventletWorker()
         worker.run()
@@ -16,6 +16,7 @@ import time
 from amqplib.client_0_8.exceptions import AMQPConnectionException
 from zope.component import getUtility
 from Products.ZenEvents.zeneventd import BaseQueueConsumerTask, EventPipelineProcessor
+from Products.ZenEvents.zeneventd import reportWorkerStats
 from Products.ZenEvents.zeneventd import QUEUE_RAW_ZEN_EVENTS
 from Products.ZenMessaging.queuemessaging.eventlet import BasePubSubMessageTask
 from Products.ZenUtils.ZCmdBase import ZCmdBase
@@ -53,13 +54,15 @@ class EventDEventletWorker(ZCmdBase):
         super(EventDEventletWorker, self).__init__()
         self._amqpConnectionInfo = getUtility(IAMQPConnectionInfo)
         self._queueSchema = getUtility(IQueueSchema)
+        self._processor = None
 
     def run(self):
         self._shutdown = False
         signal.signal(signal.SIGTERM, self._sigterm)
         mypid = str(os.getpid())
         log.info("in worker, current pid: %s" % mypid)
-        task = EventletQueueConsumerTask(EventPipelineProcessor(self.dmd))
+        self._processor = EventPipelineProcessor(self.dmd)
+        task = EventletQueueConsumerTask(self._processor)
         self._listen(task)
 
     def shutdown(self):
@@ -72,6 +75,10 @@ class EventDEventletWorker(ZCmdBase):
         super(EventDEventletWorker, self).buildOptions()
         # don't comment out the workers option in zeneventd.conf (ZEN-2769)
         workersBuildOptions(self.parser)
+        self.parser.add_option('--prefetch', dest='prefetch', default=0, type="int",
+                    help='Total number of messages prefetched by all workers; set per worker by the supervisor.')
+        self.parser.add_option('--workerid', dest='workerid', type='int', default=None,
+                    help='ID of the worker instance; set by the zeneventd supervisor.')
         self.parser.add_option('--messagesperworker', dest='messagesPerWorker', default=1,
                     type="int",
                     help='Sets the number of messages each worker gets from the queue at any given time. Default is 1. '
@@ -81,6 +88,15 @@ class EventDEventletWorker(ZCmdBase):
                     help='Sets the number of pickle files in var/zeneventd/failed_transformed_events.')
         self.parser.add_option('--pickledir', dest='pickledir', default=zenPath('var/zeneventd/failed_transformed_events'),
                     type="string", help='Sets the path to save pickle files.')
+        # batching is done by the twisted worker; accept the options here so
+        # they can be left in zeneventd.conf
+        self.parser.add_option('--eventbatchsize', dest='eventBatchSize', default=1, type="int",
+                    help='Sets the number of queued events processed and acknowledged together. Default is 1.')
+        self.parser.add_option('--eventbatchtimeout', dest='eventBatchTimeout', default=0.1, type="float",
+                    help='Sets the maximum number of seconds to wait for a batch to fill up. Default is 0.1.')
+
+    def _sigUSR1_called(self, signum, frame):
+        reportWorkerStats(self._processor, self.options.workerid)
 
     def _sigterm(self, signum=None, frame=None):
         log.debug("worker sigterm...")
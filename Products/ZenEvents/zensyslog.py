@@ -41,7 +41,7 @@ from Products.ZenUtils.observable import ObservableMixin
 from Products.ZenEvents.SyslogProcessing import SyslogProcessor
 
 from Products.ZenUtils.Utils import zenPath
-from Products.ZenUtils.IpUtil import asyncNameLookup
+from Products.ZenUtils.NameLookupCache import NameLookupCache
 
 from Products.ZenEvents.EventServer import Stats
 from Products.ZenUtils.Utils import unused
@@ -121,6 +121,21 @@ class SyslogPreferences(object):
                            action='store_true', default=False,
                            help="Don't convert the remote device's IP address to a hostname."
                            )
+        parser.add_option('--dnscachesize', dest='dnsCacheSize',
+                           default=10000, type='int',
+                           help='Maximum number of resolved addresses to keep.'
+                           ' Default is %default'
+                           )
+        parser.add_option('--dnscachettl', dest='dnsCacheTtl',
+                           default=3600, type='int',
+                           help='Seconds to keep the hostname of an address.'
+                           ' 0 disables the cache. Default is %default'
+                           )
+        parser.add_option('--dnscachenegativettl', dest='dnsCacheNegativeTtl',
+                           default=300, type='int',
+                           help='Seconds to remember addresses that could not'
+                           ' be resolved. Default is %default'
+                           )
 
     def postStartup(self):
         daemon = zope.component.getUtility(ICollector)
@@ -161,6 +176,9 @@ class SyslogTask(BaseTask, DatagramProtocol):
         self.options = self._daemon.options
 
         self.stats = Stats()
+        self.nameCache = NameLookupCache(self.options.dnsCacheSize,
+                                         self.options.dnsCacheTtl,
+                                         self.options.dnsCacheNegativeTtl)
 
         if not self.options.useFileDescriptor\
              and self.options.syslogport < 1024:
@@ -284,7 +302,7 @@ class SyslogTask(BaseTask, DatagramProtocol):
         if self.options.noreverseLookup:
             d = defer.succeed(ipaddr)
         else:
-            d = asyncNameLookup(ipaddr)
+            d = self.nameCache.lookup(ipaddr)
         d.addBoth(self.gotHostname, (msg, ipaddr, time.time()))
 
     def gotHostname(self, response, data):
@@ -317,6 +335,8 @@ class SyslogTask(BaseTask, DatagramProtocol):
 %.5f average seconds per event
 Maximum processing time for one event was %.5f""" % (
                        (totalTime / totalEvents), maxTime)
+        if not self.options.noreverseLookup:
+            display += "\n" + self.nameCache.stats()
         return display
 
     def cleanup(self):
@@ -16,6 +16,7 @@ Base for daemons that connect to zenhub
 
 import cPickle as pickle
 import collections
+import struct
 import sys
 import time
 import traceback
@@ -365,6 +366,259 @@ class DeDupingEventQueue(BaseEventQueue):
         return self.queue.itervalues()
 
 
+class DiskEventQueue(BaseEventQueue):
+    """
+    Event queue implementation backed by append-only segment files, so that
+    queued events survive a restart and only about one segment of events is
+    held in memory. This queue does not perform de-duplication of events.
+
+    Every queued event has a sequence number. Segment files are named after
+    the sequence number of their first event, and the sequence number of
+    the oldest queued event (the head) is saved to a cursor file by commit().
+    Segments are deleted once all of their events have been consumed.
+    Events consumed after the last commit are queued again after a restart.
+    """
+
+    SEGMENT_SUFFIX = '.seg'
+    CURSOR_FILE = 'cursor'
+    DEFAULT_SEGMENT_SIZE = 1000
+
+    _header = struct.Struct('>I')
+
+    def __init__(self, maxlen, path, segment_size=DEFAULT_SEGMENT_SIZE):
+        super(DiskEventQueue, self).__init__(maxlen)
+        self.path = path
+        self.segment_size = segment_size
+        # [start sequence number, number of events] for each segment file
+        self._segments = []
+        self._head = 0
+        self._committed = None
+        self._writer = None
+        # events of the most recently read segment: (start, [events])
+        self._cache = None
+        self._load()
+
+    def _segmentPath(self, start):
+        return os.path.join(self.path, '%d%s' % (start, self.SEGMENT_SUFFIX))
+
+    def _cursorPath(self):
+        return os.path.join(self.path, self.CURSOR_FILE)
+
+    def _scanSegment(self, start):
+        """
+        Counts the events in a segment file, truncating a partially written
+        last record.
+        """
+        filename = self._segmentPath(start)
+        count = 0
+        valid = 0
+        with open(filename, 'rb') as f:
+            while True:
+                header = f.read(self._header.size)
+                if len(header) < self._header.size:
+                    break
+                size, = self._header.unpack(header)
+                if len(f.read(size)) < size:
+                    break
+                count += 1
+                valid = f.tell()
+        if valid != os.path.getsize(filename):
+            with open(filename, 'r+b') as f:
+                f.truncate(valid)
+        return count
+
+    def _load(self):
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        starts = []
+        for filename in os.listdir(self.path):
+            if filename.endswith(self.SEGMENT_SUFFIX):
+                try:
+                    starts.append(int(filename[:-len(self.SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        for start in sorted(starts):
+            count = self._scanSegment(start)
+            if count:
+                self._segments.append([start, count])
+            else:
+                os.remove(self._segmentPath(start))
+        self._head = self._segments[0][0] if self._segments else 0
+        try:
+            with open(self._cursorPath()) as f:
+                self._head = max(self._head, int(f.read().strip()))
+        except (IOError, ValueError):
+            pass
+        self._head = min(self._head, self._tail)
+        self._committed = self._head
+        self._dropConsumedSegments()
+
+    @property
+    def _tail(self):
+        if not self._segments:
+            return self._head
+        start, count = self._segments[-1]
+        return start + count
+
+    @property
+    def head(self):
+        """
+        The sequence number of the oldest queued event.
+        """
+        return self._head
+
+    def _readSegment(self, start):
+        if self._cache is not None and self._cache[0] == start:
+            return self._cache[1]
+        if self._writer is not None:
+            self._writer.flush()
+        events = []
+        with open(self._segmentPath(start), 'rb') as f:
+            while True:
+                header = f.read(self._header.size)
+                if len(header) < self._header.size:
+                    break
+                size, = self._header.unpack(header)
+                events.append(pickle.loads(f.read(size)))
+        self._cache = (start, events)
+        return events
+
+    def _get(self, seq):
+        for start, count in self._segments:
+            if start <= seq < start + count:
+                return self._readSegment(start)[seq - start]
+        raise IndexError(seq)
+
+    def _closeWriter(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _write(self, event):
+        if not self._segments or self._segments[-1][1] >= self.segment_size:
+            self._closeWriter()
+            self._segments.append([self._tail, 0])
+        segment = self._segments[-1]
+        if self._writer is None:
+            self._writer = open(self._segmentPath(segment[0]), 'ab')
+        data = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+        self._writer.write(self._header.pack(len(data)) + data)
+        self._writer.flush()
+        segment[1] += 1
+        if self._cache is not None and self._cache[0] == segment[0]:
+            self._cache[1].append(event)
+        if segment[1] >= self.segment_size:
+            self._closeWriter()
+
+    def _dropConsumedSegments(self):
+        while self._segments:
+            start, count = self._segments[0]
+            if start + count > self._head:
+                break
+            if len(self._segments) == 1:
+                self._closeWriter()
+            self._segments.pop(0)
+            if self._cache is not None and self._cache[0] == start:
+                self._cache = None
+            try:
+                os.remove(self._segmentPath(start))
+            except OSError:
+                pass
+
+    def append(self, event):
+        # Make sure every processed event specifies the time it was queued.
+        if not 'rcvtime' in event:
+            event['rcvtime'] = time.time()
+
+        discarded = None
+        if len(self) >= self.maxlen:
+            discarded = self.popleft()
+        self._write(event)
+        return discarded
+
+    def popleft(self):
+        if not len(self):
+            raise IndexError()
+        event = self._get(self._head)
+        self._head += 1
+        return event
+
+    def peek(self, count):
+        """
+        Returns up to count of the oldest events without removing them.
+        """
+        end = min(self._head + count, self._tail)
+        return [self._get(seq) for seq in xrange(self._head, end)]
+
+    def consumeTo(self, seq):
+        """
+        Removes the events with a sequence number lower than seq, if they
+        have not been removed already.
+        """
+        self._head = max(self._head, min(seq, self._tail))
+
+    def discardOlderThan(self, cutoff):
+        """
+        Removes and returns the events queued before the cutoff time.
+        """
+        discarded = []
+        while len(self) and self._get(self._head).get('rcvtime', cutoff) < cutoff:
+            discarded.append(self.popleft())
+        return discarded
+
+    def extendleft(self, events):
+        if not events:
+            return events
+        available = self.maxlen - len(self)
+        if available <= 0:
+            return events
+        to_discard = max(0, len(events) - available)
+        # Segments are append-only: write the new events followed by the
+        # rest of the head segment to a new segment placed before the head.
+        remaining = []
+        if self._segments:
+            start, count = self._segments[0]
+            remaining = self._readSegment(start)[self._head - start:]
+            self._segments.pop(0)
+            if not self._segments:
+                self._closeWriter()
+            self._cache = None
+            old = self._segmentPath(start)
+        else:
+            old = None
+        self._head -= len(events) - to_discard
+        new_events = list(events[to_discard:]) + remaining
+        with open(self._segmentPath(self._head), 'wb') as f:
+            for event in new_events:
+                data = pickle.dumps(event, pickle.HIGHEST_PROTOCOL)
+                f.write(self._header.pack(len(data)) + data)
+        self._segments.insert(0, [self._head, len(new_events)])
+        if old is not None and old != self._segmentPath(self._head):
+            os.remove(old)
+        self.commit()
+        return events[:to_discard]
+
+    def commit(self):
+        """
+        Saves the head position and deletes fully consumed segments.
+        """
+        self._dropConsumedSegments()
+        if self._head != self._committed:
+            atomicWrite(self._cursorPath(), str(self._head))
+            self._committed = self._head
+
+    def close(self):
+        self.commit()
+        self._closeWriter()
+
+    def __len__(self):
+        return self._tail - self._head
+
+    def __iter__(self):
+        for seq in xrange(self._head, self._tail):
+            yield self._get(seq)
+
+
 class EventQueueManager(object):
 
     CLEAR_FINGERPRINT_FIELDS = ('device','component','eventKey','eventClass')
@@ -376,7 +630,12 @@ class EventQueueManager(object):
         self.discarded_events = 0
         # TODO: Do we want to limit the size of the clear event dictionary?
         self.clear_events_count = {}
-        self._initQueues()
+        self.queue_path = getattr(options, 'eventqueuepath', None)
+        self.queue_maxage = getattr(options, 'eventqueuemaxage', 0)
+        if self.queue_path:
+            self._initDiskQueues()
+        else:
+            self._initQueues()
 
     def _initQueues(self):
         maxlen = self.options.maxqueuelen
@@ -386,6 +645,17 @@ class EventQueueManager(object):
         self.perf_event_queue = queue_type(maxlen)
         self.heartbeat_event_queue = collections.deque(maxlen=1)
 
+    def _initDiskQueues(self):
+        maxlen = self.options.maxqueuelen
+        self.event_queue = DiskEventQueue(
+            maxlen, os.path.join(self.queue_path, 'events'))
+        self.perf_event_queue = DiskEventQueue(
+            maxlen, os.path.join(self.queue_path, 'perf'))
+        self.heartbeat_event_queue = collections.deque(maxlen=1)
+        self.log.info("Loaded %d events and %d performance events from %s",
+                      len(self.event_queue), len(self.perf_event_queue),
+                      self.queue_path)
+
     def _transformEvent(self, event):
         for transformer in self.transformers:
             result = transformer.transform(event)
@@ -470,8 +740,58 @@ class EventQueueManager(object):
     def addHeartbeatEvent(self, heartbeat_event):
         self.heartbeat_event_queue.append(heartbeat_event)
 
-    @defer.inlineCallbacks
+    def _discardExpiredEvents(self):
+        cutoff = time.time() - self.queue_maxage
+        for queue in (self.perf_event_queue, self.event_queue):
+            for discarded in queue.discardOlderThan(cutoff):
+                self.log.debug("Discarded event - older than %s seconds: %r",
+                               self.queue_maxage, discarded)
+                self._removeDiscardedEventFromClearState(discarded)
+                self.discarded_events += 1
+
     def sendEvents(self, event_sender_fn):
+        if self.queue_path:
+            return self._sendDiskEvents(event_sender_fn)
+        return self._sendMemoryEvents(event_sender_fn)
+
+    @defer.inlineCallbacks
+    def _sendDiskEvents(self, event_sender_fn):
+        # Events stay on disk until ZenHub accepted them. Only the events
+        # queued when we start are sent, so that events queued while sending
+        # (which is asynchronous) wait for the next call.
+        if self.queue_maxage > 0:
+            self._discardExpiredEvents()
+        queues = (self.perf_event_queue, self.event_queue)
+        ends = [queue.head + len(queue) for queue in queues]
+        try:
+            while True:
+                chunk_remaining = self.options.eventflushchunksize
+                heartbeat_events = []
+                while chunk_remaining and self.heartbeat_event_queue:
+                    heartbeat_events.append(
+                        self.heartbeat_event_queue.popleft())
+                    chunk_remaining -= 1
+                chunk = []
+                for queue, end in zip(queues, ends):
+                    available = max(0, min(chunk_remaining, end - queue.head))
+                    events = queue.peek(available)
+                    chunk.append((queue, queue.head + len(events), events))
+                    chunk_remaining -= len(events)
+                events = list(chain.from_iterable(c[2] for c in chunk))
+                if not heartbeat_events and not events:
+                    break
+                self.log.debug("Sending %d events, %d heartbeats",
+                               len(events), len(heartbeat_events))
+                yield event_sender_fn(heartbeat_events + events)
+                for queue, sent_to, unused in chunk:
+                    queue.consumeTo(sent_to)
+                    queue.commit()
+        finally:
+            for queue in queues:
+                queue.commit()
+
+    @defer.inlineCallbacks
+    def _sendMemoryEvents(self, event_sender_fn):
         # Create new queues - we will flush the current queues and don't want to
         # get in a loop sending events that are queued while we send this batch
         # (the event sending is asynchronous).
@@ -1094,6 +1414,24 @@ class PBDaemon(ZenDaemon, pb.Referenceable):
                                type='int',
                                help='Maximum number of events to queue')
 
+        self.parser.add_option('--eventqueuepath',
+                               dest='eventqueuepath',
+                               default='',
+                               help='Directory in which events waiting to '
+                               'be sent to ZenHub are kept, so that they '
+                               'survive restarts. Events are only kept in '
+                               'memory if not set. Events are not '
+                               'de-duplicated when this is set.')
+
+        self.parser.add_option('--eventqueuemaxage',
+                               dest='eventqueuemaxage',
+                               default=0,
+                               type='int',
+                               help='Discard events kept in --eventqueuepath '
+                               'for more than this many seconds. Default is '
+                               '0 (keep events until maxqueuelen is '
+                               'reached).')
+
         self.parser.add_option('--zenhubpinginterval',
                                dest='zhPingInterval',
                                default=120,
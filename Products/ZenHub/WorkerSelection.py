@@ -28,12 +28,14 @@ class ReservationAwareSelection(InOrderSelection):
     """
     Selection algorithm that returns workers in the
     order in which they are given, and only returns workers
-    above the reserved threshold.
+    above the reserved threshold and below the workers
+    reserved for applyDataMaps at the end of the list.
     """
     implements(IWorkerSelectionAlgorithm)
 
     def getCandidateWorkerIds(self, workers, options):
-        return ifilter(lambda i: i >= options.workersReservedForEvents,
+        end = len(workers) - getattr(options, 'workersReservedForApplyDataMaps', 0)
+        return ifilter(lambda i: options.workersReservedForEvents <= i < end,
                        super(ReservationAwareSelection, self)\
                        .getCandidateWorkerIds(workers, options))
 
@@ -51,6 +53,22 @@ class ReversedReservationAwareSelection(ReservationAwareSelection):
         return reversed(list(selection))
 
 
+class ApplyDataMapsSelection(InOrderSelection):
+    """
+    Selection algorithm that returns workers in the reverse
+    order in which they are given, starting with the workers
+    reserved for applyDataMaps, and only returns workers above
+    the threshold reserved for events.
+    """
+    implements(IWorkerSelectionAlgorithm)
+
+    def getCandidateWorkerIds(self, workers, options):
+        selection = super(ApplyDataMapsSelection, self)\
+                            .getCandidateWorkerIds(workers, options)
+        return reversed([i for i in selection
+                         if i >= options.workersReservedForEvents])
+
+
 class WorkerSelector(object):
     """
     Singleton worker selector that apportions work to zenhub workers based on the
@@ -0,0 +1,87 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """chunking
+
+Helpers for passing pickled arguments and results between zenhub and its
+workers. PB limits the length of sequences it will serialize, so pickles are
+sent as a list of strings of at most CHUNK_SIZE bytes each. Large payloads
+may be compressed; a compressed payload starts with the COMPRESSED marker.
+"""
+
+import zlib
+import cPickle as pickle
+
+CHUNK_SIZE = 102400
+COMPRESSED = 'zlib:'
+
+
+def iterChunks(data, chunkSize=CHUNK_SIZE):
+    """
+    Yield consecutive chunks of data. Every byte is copied only once, unlike
+    repeatedly slicing the head off the remaining string.
+    """
+    view = buffer(data)
+    for offset in xrange(0, len(data), chunkSize):
+        yield view[offset:offset + chunkSize]
+
+
+def _compressChunks(data, chunkSize):
+    compressor = zlib.compressobj(1)
+    pending = []
+    pendingSize = 0
+    for piece in iterChunks(data, chunkSize):
+        out = compressor.compress(piece)
+        if out:
+            pending.append(out)
+            pendingSize += len(out)
+        if pendingSize >= chunkSize:
+            joined = ''.join(pending)
+            for chunk in iterChunks(joined, chunkSize):
+                yield chunk
+            pending, pendingSize = [], 0
+    pending.append(compressor.flush())
+    for chunk in iterChunks(''.join(pending), chunkSize):
+        yield chunk
+
+
+def pickleToChunks(obj, chunkSize=CHUNK_SIZE, compressThreshold=0):
+    """
+    Pickle obj and split the pickle into chunks. If compressThreshold is
+    set and the pickle is at least that many bytes, the chunks hold the
+    zlib compressed pickle, preceded by the COMPRESSED marker.
+    """
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    if compressThreshold and len(data) >= compressThreshold:
+        chunks = [COMPRESSED]
+        chunks.extend(_compressChunks(data, chunkSize))
+        return chunks
+    return list(iterChunks(data, chunkSize))
+
+
+def unpickleChunks(chunks):
+    """
+    Rebuild the object from a list of chunks created by pickleToChunks.
+    The list is emptied as the chunks are consumed, so the chunks can be
+    freed before the object is unpickled.
+    """
+    if chunks and chunks[0] == COMPRESSED:
+        decompressor = zlib.decompressobj()
+        parts = []
+        chunks.reverse()
+        chunks.pop()
+        while chunks:
+            parts.append(decompressor.decompress(chunks.pop()))
+        parts.append(decompressor.flush())
+    else:
+        parts = chunks[:]
+        del chunks[:]
+    data = ''.join(parts)
+    del parts[:]
+    return pickle.loads(data)
@@ -62,6 +62,7 @@ class ModelerService(PerformanceConfig):
                     result.plugins.append(plugin.loader)
                     plugin.copyDataToProxy(dev, result)
             result.temp_device = dev.isTempDevice()
+            result.createdTime = dev.getCreatedTimeString()
         return result
 
     @translateError
@@ -188,6 +189,17 @@ class ModelerService(PerformanceConfig):
 
                 self.post_adm_process(map, device, preadmdata)
 
+        counts = adm.changeCounts
+        if counts:
+            changes = sum(counts[c] for c in
+                          ('added', 'updated', 'recreated', 'removed', 'linked'))
+            log.log(logging.INFO if changes else logging.DEBUG,
+                    "Applied %d maps to %s: %d components added, %d updated, "
+                    "%d recreated, %d removed, %d linked, %d blocked, "
+                    "%d unchanged", len(maps), device.id, counts['added'],
+                    counts['updated'], counts['recreated'], counts['removed'],
+                    counts['linked'], counts['blocked'], counts['unchanged'])
+
         if setLastCollection:
             device.setSnmpLastCollection()
 
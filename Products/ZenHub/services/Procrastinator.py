@@ -16,15 +16,31 @@ log = logging.getLogger('zen.Procrastinator')
 
 
 class Procrastinate(object):
-    "A class to delay executing a change to a device"
+    """
+    A class to delay executing a change to a device.
+
+    Changes are collected until no new change has arrived for
+    _DO_LATER_DELAY seconds, but for no longer than the coalescing window
+    (_WINDOW seconds after the first change), so that a steady stream of
+    changes still gets each device pushed once per window.
+    """
 
     _DO_LATER_DELAY = 5
     _DO_NOW_DELAY = 0.05
+    _WINDOW = 30
+
+    @classmethod
+    def setWindow(cls, seconds):
+        """
+        Set the longest time changes are held back, for all instances.
+        """
+        cls._WINDOW = max(seconds, cls._DO_LATER_DELAY)
 
     def __init__(self, cback):
         self.cback = cback
         self.devices = set()
         self.timer = None
+        self._deadline = None
         self._stopping = False
         self._stopping_deferred = defer.Deferred()
 
@@ -41,10 +57,14 @@ class Procrastinate(object):
 
     def doLater(self, device = None):
         if not self._stopping:
+            now = reactor.seconds()
             if self.timer and not self.timer.called:
                 self.timer.cancel()
+            else:
+                self._deadline = now + Procrastinate._WINDOW
             self.devices.add(device)
-            self.timer = reactor.callLater(Procrastinate._DO_LATER_DELAY, self._doNow)
+            delay = min(Procrastinate._DO_LATER_DELAY, max(0, self._deadline - now))
+            self.timer = reactor.callLater(delay, self._doNow)
 
     def _doNow(self, *unused):
         if self.devices:
@@ -22,6 +22,8 @@ import Globals
 from twisted.spread import pb
 from Products.ZenCollector.services.config import DeviceProxy, CollectorConfigService
 
+validOID = re.compile(r'(?:\.?\d+)+$')
+
 def get_component_manage_ip(component, default=None):
     get_manage_ip = getattr(component, "getManageIp", None)
     if get_manage_ip is None:
@@ -60,6 +62,8 @@ class SnmpPerformanceConfig(CollectorConfigService):
                                 )
         CollectorConfigService.__init__(self, dmd, instance, 
                                         deviceProxyAttributes)
+        # OID name -> numeric OID, for the current device
+        self._resolvedOids = {}
 
     def _filterDevice(self, device):
         include = CollectorConfigService._filterDevice(self, device)
@@ -91,43 +95,65 @@ class SnmpPerformanceConfig(CollectorConfigService):
         return "{0}.{1}".format(oid, index) if index else oid
 
 
-    def _getComponentConfig(self, comp, perfServer, oids):
+    def _buildPlan(self, template, perfServer):
+        """
+        Flatten the enabled SNMP data sources of a template into
+        (ds id, ds path, base OID, datapoints) tuples, where datapoints are
+        (name, rrdtype, create command, rrdmin, rrdmax) tuples.
+        """
+        plan = []
+        for ds in template.getRRDDataSources("SNMP"):
+            if not ds.enabled or not ds.oid:
+                continue
+            datapoints = tuple((dp.name(),
+                                dp.rrdtype,
+                                dp.getRRDCreateCommand(perfServer).strip(),
+                                dp.rrdmin, dp.rrdmax)
+                               for dp in ds.getRRDDataPoints())
+            plan.append((ds.id, ds.getPrimaryUrlPath(), ds.oid.strip("."),
+                         datapoints))
+        return plan
+
+    def _getComponentConfig(self, comp, perfServer, oids, columns=None):
         """
         SNMP components can build up the actual OID based on a base OID and
         the snmpindex of the component.
+
+        If columns is given, the indexed OIDs are also grouped by their base
+        OID, which is the table column that can be walked to collect them.
         """
         if comp.snmpIgnore():
             return None
 
-        validOID = re.compile(r'(?:\.?\d+)+$')
         metadata = comp.getMetricMetadata()
+        build = lambda template: self._buildPlan(template, perfServer)
         for templ in comp.getRRDTemplates():
-            for ds in templ.getRRDDataSources("SNMP"):
-                if not ds.enabled or not ds.oid:
-                    continue
-
-                oid = self._transform_oid(ds.oid.strip("."), comp)
+            plan = self._templatePlan(templ, build, perfServer.id)
+            for dsId, dsPath, baseOid, datapoints in plan:
+                oid = self._transform_oid(baseOid, comp)
                 if not oid:
-                    log.warn("The data source %s OID is blank -- ignoring", ds.id)
+                    log.warn("The data source %s OID is blank -- ignoring", dsId)
                     continue
                 elif not validOID.match(oid):
                     oldOid = oid
-                    oid = self.dmd.Mibs.name2oid(oid)
+                    if oldOid not in self._resolvedOids:
+                        self._resolvedOids[oldOid] = self.dmd.Mibs.name2oid(oldOid)
+                    oid = self._resolvedOids[oldOid]
                     if not oid:
                         msg =  "The OID %s is invalid -- ignoring" % oldOid
                         self.sendEvent(dict(
-                            device=comp.device().id, component=ds.getPrimaryUrlPath(),
+                            device=comp.device().id, component=dsPath,
                             eventClass='/Status/Snmp', severity=Warning, summary=msg,
                         ))
                         continue
+                elif (columns is not None and oid != baseOid
+                      and validOID.match(baseOid)):
+                    columns.setdefault(baseOid, set()).add(oid)
 
-                for dp in ds.getRRDDataPoints():
-                    cname = comp.id
-                    oidData = (cname,
-                                 dp.name(),
-                                 dp.rrdtype,
-                                 dp.getRRDCreateCommand(perfServer).strip(),
-                                 dp.rrdmin, dp.rrdmax, metadata)
+                cname = comp.id
+                for dpName, rrdtype, createCmd, rrdmin, rrdmax in datapoints:
+                    oidData = (cname, dpName, rrdtype, createCmd,
+                               rrdmin, rrdmax, metadata)
 
                     # An OID can appear in multiple data sources/data points
                     oids.setdefault(oid, []).append(oidData)
@@ -154,6 +180,7 @@ class SnmpPerformanceConfig(CollectorConfigService):
         proxy = SnmpDeviceProxy()
         proxy = CollectorConfigService._createDeviceProxy(self, device, proxy)
         proxy.snmpConnInfo = device.getSnmpConnInfo()
+        self._resolvedOids.clear()
         if manage_ip is not None and manage_ip != device.manageIp:
             proxy._config_id = device.id + "_" + manage_ip
             proxy.snmpConnInfo.manageIp = manage_ip
@@ -170,6 +197,9 @@ class SnmpPerformanceConfig(CollectorConfigService):
         # Gather the datapoints to retrieve
         perfServer = device.getPerformanceServer()
         proxy.oids = {}
+        # table column OID -> indexed OIDs of that column, for the
+        # collector's GETBULK table mode
+        proxy.tableColumns = {}
         proxy.thresholds = []
         if not components_only:
             # First for the device....
@@ -178,10 +208,14 @@ class SnmpPerformanceConfig(CollectorConfigService):
                 proxy.thresholds.extend(threshs)
         # And now for its components
         for comp in components:
-            threshs = self._getComponentConfig(comp, perfServer, proxy.oids)
+            threshs = self._getComponentConfig(comp, perfServer, proxy.oids,
+                                               proxy.tableColumns)
             if threshs:
                 proxy.thresholds.extend(threshs)
 
+        for column, columnOids in proxy.tableColumns.items():
+            proxy.tableColumns[column] = sorted(columnOids)
+
         if proxy.oids:
             return proxy
 
@@ -0,0 +1,49 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from Products.ZenHub.chunking import (
+    COMPRESSED, iterChunks, pickleToChunks, unpickleChunks
+)
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+class TestChunking(BaseTestCase):
+
+    def testIterChunks(self):
+        data = 'abcdefghij'
+        self.assertEqual(['abcd', 'efgh', 'ij'], list(iterChunks(data, 4)))
+        self.assertEqual([], list(iterChunks('', 4)))
+
+    def testRoundTrip(self):
+        obj = {'devices': [('dev%d' % i, range(i)) for i in range(200)]}
+        chunks = pickleToChunks(obj, chunkSize=100)
+        self.assertTrue(len(chunks) > 1)
+        self.assertTrue(all(len(c) <= 100 for c in chunks))
+        self.assertNotEqual(COMPRESSED, chunks[0])
+        self.assertEqual(obj, unpickleChunks(chunks))
+        self.assertEqual([], chunks)
+
+    def testCompressedRoundTrip(self):
+        obj = ['x' * 1000] * 100
+        chunks = pickleToChunks(obj, chunkSize=100, compressThreshold=1000)
+        self.assertEqual(COMPRESSED, chunks[0])
+        self.assertTrue(all(len(c) <= 100 for c in chunks))
+        self.assertEqual(obj, unpickleChunks(chunks))
+
+    def testSmallPayloadIsNotCompressed(self):
+        chunks = pickleToChunks('small', compressThreshold=1000)
+        self.assertNotEqual(COMPRESSED, chunks[0])
+        self.assertEqual('small', unpickleChunks(chunks))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestChunking))
+    return suite
@@ -0,0 +1,170 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import collections
+import logging
+
+from Acquisition import aq_base
+from ZODB.POSException import POSKeyError
+from zope.component import getGlobalSiteManager, adapts
+from zope.interface import implements, providedBy
+
+from Products.ZenModel.DeviceClass import DeviceClass
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenHub.zenhub import ZenHub
+from Products.ZenHub.interfaces import IInvalidationOid, \
+    FILTER_INCLUDE, FILTER_EXCLUDE, FILTER_CONTINUE
+from Products.ZenHub.invalidationfilter import BaseOrganizerFilter
+
+
+class MockJar(dict):
+
+    def __init__(self, *args):
+        super(MockJar, self).__init__(*args)
+        self.loads = collections.Counter()
+
+    def __getitem__(self, oid):
+        self.loads[oid] += 1
+        try:
+            return super(MockJar, self).__getitem__(oid)
+        except KeyError:
+            raise POSKeyError(oid)
+
+
+class MockApp(object):
+
+    def __init__(self, jar):
+        self._p_jar = jar
+
+
+class MockDmd(object):
+
+    def __init__(self, jar):
+        self.app = MockApp(jar)
+
+    def getPhysicalRoot(self):
+        return self.app
+
+
+class MockFilter(object):
+
+    def __init__(self, decisions):
+        self.decisions = decisions
+
+    def include(self, obj):
+        return self.decisions.get(obj.id, FILTER_CONTINUE)
+
+
+class CountingOrganizerFilter(BaseOrganizerFilter):
+
+    def __init__(self):
+        super(CountingOrganizerFilter, self).__init__((DeviceClass,))
+        self.checksum_map = {}
+        self.checksums = 0
+
+    def organizerChecksum(self, organizer):
+        self.checksums += 1
+        return 'changed'
+
+
+class MockTransform(object):
+    implements(IInvalidationOid)
+    adapts(DeviceClass)
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def transformOid(self, oid):
+        return 'transformed'
+
+
+class InvalidationFilteringTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(InvalidationFilteringTest, self).afterSetUp()
+        self.hub = ZenHub.__new__(ZenHub)
+        self.hub.log = logging.getLogger('zen.ZenHub')
+        self.hub.invalidationTimings = collections.Counter()
+        self.hub._invalidation_filters = []
+        self.jar = MockJar()
+        self.hub.dmd = MockDmd(self.jar)
+        self.devices = {}
+        for id in ('dev1', 'dev2'):
+            device = self.dmd.Devices.createInstance(id)
+            self.devices[id] = device
+            self.jar[id] = aq_base(device)
+
+    def testDuplicateOidsAreLoadedOnce(self):
+        result = self.hub._filter_oids(['dev1', 'dev2', 'dev1', 'dev2'])
+        self.assertEquals(['dev1', 'dev2'], result)
+        self.assertEquals({'dev1': 1, 'dev2': 1}, dict(self.jar.loads))
+        self.assertEquals(set(['prefetch', 'load', 'filter', 'transform']),
+                          set(self.hub.invalidationTimings))
+
+    def testMissingAndDeletedObjectsPassThrough(self):
+        aq_base(self.devices['dev2']).__primary_parent__ = None
+        self.hub._invalidation_filters = [MockFilter(
+            {'dev1': FILTER_EXCLUDE, 'dev2': FILTER_EXCLUDE})]
+        result = self.hub._filter_oids(['gone', 'dev1', 'dev2'])
+        self.assertEquals(['gone', 'dev2'], result)
+
+    def testFilterDecisions(self):
+        self.hub._invalidation_filters = [
+            MockFilter({'dev1': FILTER_INCLUDE}),
+            MockFilter({'dev1': FILTER_EXCLUDE, 'dev2': FILTER_EXCLUDE}),
+        ]
+        self.assertEquals(['dev1'], self.hub._filter_oids(['dev1', 'dev2']))
+        # objects no filter decides on are included
+        self.hub._invalidation_filters = [MockFilter({})]
+        self.assertEquals(['dev1', 'dev2'],
+                          self.hub._filter_oids(['dev1', 'dev2']))
+
+    def testOrganizerDecisionIsRememberedForTheBatch(self):
+        fltr = CountingOrganizerFilter()
+        self.hub._invalidation_filters = [fltr]
+        organizer = aq_base(self.dmd.Devices.createOrganizer('/Batch'))
+        # a new object for an organizer path seen earlier in the batch
+        self.jar.update(org1=organizer, org2=organizer)
+        result = self.hub._filter_oids(['org1', 'org2', 'dev1'])
+        self.assertEquals(['org1', 'org2', 'dev1'], result)
+        self.assertEquals(1, fltr.checksums)
+        # the next batch asks the filter again
+        self.assertEquals(['dev1'], self.hub._filter_oids(['org1', 'dev1']))
+        self.assertEquals(2, fltr.checksums)
+
+    def testOidTransformFactoriesAreCached(self):
+        gsm = getGlobalSiteManager()
+        gsm.registerSubscriptionAdapter(MockTransform, provided=IInvalidationOid)
+        try:
+            organizer = self.dmd.Devices.createOrganizer('/Transform')
+            other = self.dmd.Devices.createOrganizer('/Other')
+            cache = {}
+            adapters = self.hub._getOidTransforms(organizer, cache)
+            self.assertTrue(any(isinstance(a, MockTransform) for a in adapters))
+            self.assertEquals(
+                sorted(type(a).__name__ for a in adapters),
+                sorted(type(a).__name__
+                       for a in self.hub._getOidTransforms(organizer)))
+            self.assertEquals([providedBy(organizer)], cache.keys())
+            # objects providing the same interfaces use the cached factories
+            cache[providedBy(other)] = []
+            adapters = self.hub._getOidTransforms(other, cache)
+            self.assertFalse(any(isinstance(a, MockTransform) for a in adapters))
+            self.assertEquals(set(['transformed']),
+                              self.hub._transformOid('oid', organizer))
+        finally:
+            gsm.unregisterSubscriptionAdapter(MockTransform,
+                                              provided=IInvalidationOid)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(InvalidationFilteringTest))
+    return suite
@@ -7,7 +7,7 @@
 #
 ##############################################################################
 
-import os, logging
+import os, logging, shutil, tempfile
 
 log = logging.getLogger('zen.testPBDaemon')
 
@@ -25,7 +25,7 @@ from Products.ZenHub.interfaces import (
     ICollectorEventTransformer, TRANSFORM_DROP
 )
 from Products.ZenHub.PBDaemon import (
-    DeDupingEventQueue, DequeEventQueue, EventQueueManager,
+    DeDupingEventQueue, DequeEventQueue, DiskEventQueue, EventQueueManager,
     DefaultFingerprintGenerator, PBDaemon
 )
 
@@ -143,6 +143,61 @@ class TestDequeEventQueue(BaseEventQueueTest):
             **kwargs)
 
 
+class TestDiskEventQueue(BaseEventQueueTest):
+
+    def __init__(self, *args, **kwargs):
+        super(TestDiskEventQueue, self).__init__(DiskEventQueue, 10, *args,
+            **kwargs)
+
+    def afterSetUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.queue_type = self.createQueue
+        super(TestDiskEventQueue, self).afterSetUp()
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(TestDiskEventQueue, self).beforeTearDown()
+
+    def createQueue(self, maxlen, segment_size=3):
+        return DiskEventQueue(maxlen, self.tmpdir, segment_size=segment_size)
+
+    def testSurvivesRestart(self):
+        events = [createTestEvent(device='dev%d' % i) for i in range(7)]
+        for event in events:
+            self.queue.append(event)
+        self.assertEquals(events[0], self.queue.popleft())
+        self.queue.commit()
+        self.queue.popleft()
+        # events consumed without a commit are queued again
+        queue = self.createQueue(10)
+        self.assertEquals(events[1:], list(queue))
+
+    def testConsumedSegmentsAreDeleted(self):
+        for i in range(7):
+            self.queue.append(createTestEvent(device='dev%d' % i))
+        self.assertEquals(3, len(os.listdir(self.tmpdir)))
+        self.queue.consumeTo(self.queue.head + 6)
+        self.queue.commit()
+        # one segment left plus the cursor file
+        self.assertEquals(2, len(os.listdir(self.tmpdir)))
+        self.assertEquals(['dev6'], [e['device'] for e in self.queue])
+
+    def testPeekDoesNotConsume(self):
+        for i in range(5):
+            self.queue.append(createTestEvent(device='dev%d' % i))
+        peeked = self.queue.peek(4)
+        self.assertEquals(['dev0', 'dev1', 'dev2', 'dev3'],
+                          [e['device'] for e in peeked])
+        self.assertEquals(5, len(self.queue))
+
+    def testDiscardOlderThan(self):
+        self.queue.append(createTestEvent(device='old', rcvtime=100))
+        self.queue.append(createTestEvent(device='new', rcvtime=300))
+        discarded = self.queue.discardOlderThan(200)
+        self.assertEquals(['old'], [e['device'] for e in discarded])
+        self.assertEquals(['new'], [e['device'] for e in self.queue])
+
+
 class TestEventQueueManager(BaseTestCase):
 
     def afterSetUp(self):
@@ -314,6 +369,39 @@ class TestEventQueueManager(BaseTestCase):
         self.assertEquals(perf_events[5:], list(eqm.perf_event_queue))
         self.assertEquals(events, list(eqm.event_queue))
 
+    def testDiskQueueRestoreEvents(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            opts = self.createOptions(eventflushchunksize=5)
+            opts.eventqueuepath = tmpdir
+            opts.eventqueuemaxage = 0
+            eqm = EventQueueManager(opts, log)
+            events = []
+            for i in range(10):
+                events.append(createTestEvent(device='dev%d' % i))
+                eqm.addEvent(events[-1])
+
+            sent_event_chunks = []
+            def send_events(events):
+                if len(sent_event_chunks) == 1:
+                    raise Exception('Test Exception')
+                sent_event_chunks.append(events)
+
+            results = []
+            eqm.sendEvents(send_events).addBoth(results.append)
+            self.assertTrue(isinstance(results[0], failure.Failure))
+            self.assertEquals([events[:5]], sent_event_chunks)
+
+            # unsent events are still queued after a restart
+            eqm = EventQueueManager(opts, log)
+            self.assertEquals(events[5:], list(eqm.event_queue))
+            sent_events = []
+            eqm.sendEvents(sent_events.extend)
+            self.assertEquals(events[5:], sent_events)
+            self.assertEquals(0, len(eqm.event_queue))
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
     def testRestoreEventsDiscarded(self):
         opts = self.createOptions(eventflushchunksize=5, maxqueuelen=10)
         eqm = EventQueueManager(opts, log)
@@ -441,6 +529,7 @@ def test_suite():
     suite = TestSuite()
     suite.addTest(makeSuite(TestDeDupingEventQueue))
     suite.addTest(makeSuite(TestDequeEventQueue))
+    suite.addTest(makeSuite(TestDiskEventQueue))
     suite.addTest(makeSuite(TestEventQueueManager))
     suite.addTest(makeSuite(TestDefaultFingerprintGenerator))
     suite.addTest(makeSuite(TestMetricWriter))
@@ -0,0 +1,61 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+from twisted.internet import task
+
+from Products.ZenHub.services import Procrastinator
+from Products.ZenHub.services.Procrastinator import Procrastinate
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+class TestProcrastinate(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestProcrastinate, self).afterSetUp()
+        self.clock = task.Clock()
+        self._reactor = Procrastinator.reactor
+        Procrastinator.reactor = self.clock
+        self._window = Procrastinate._WINDOW
+        Procrastinate.setWindow(20)
+        self.pushed = []
+        self.procrastinator = Procrastinate(self.pushed.append)
+
+    def beforeTearDown(self):
+        Procrastinator.reactor = self._reactor
+        Procrastinate._WINDOW = self._window
+        super(TestProcrastinate, self).beforeTearDown()
+
+    def testChangesAreCoalesced(self):
+        for i in range(100):
+            self.procrastinator.doLater('dev1')
+        self.procrastinator.doLater('dev2')
+        self.clock.advance(Procrastinate._DO_LATER_DELAY)
+        self.clock.advance(Procrastinate._DO_NOW_DELAY)
+        self.assertEqual(['dev1', 'dev2'], sorted(self.pushed))
+
+    def testSteadyChangesArePushedOncePerWindow(self):
+        for i in range(30):
+            self.procrastinator.doLater('dev1')
+            self.clock.advance(1)
+        # changes never stopped for _DO_LATER_DELAY seconds, but the window
+        # ended after 20 seconds
+        self.assertEqual(['dev1'], self.pushed)
+        self.clock.advance(Procrastinate._DO_LATER_DELAY)
+        self.assertEqual(['dev1', 'dev1'], self.pushed)
+
+    def testWindowIsAtLeastTheDelay(self):
+        Procrastinate.setWindow(0)
+        self.assertEqual(Procrastinate._DO_LATER_DELAY, Procrastinate._WINDOW)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestProcrastinate))
+    return suite
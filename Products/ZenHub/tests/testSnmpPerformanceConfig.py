@@ -0,0 +1,123 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import zope.component
+
+from Products.ZenHub.interfaces import IBatchNotifier
+from Products.ZenHub.services.SnmpPerformanceConfig import SnmpPerformanceConfig
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+
+
+class MockNotifier(object):
+
+    def notify_subdevices(self, device_class, service_uid, callback,
+                          device_filter=None):
+        pass
+
+
+class MockComponent(object):
+
+    def __init__(self, id, snmpindex, templates):
+        self.id = id
+        self.snmpindex = snmpindex
+        self.templates = templates
+
+    def snmpIgnore(self):
+        return False
+
+    def getMetricMetadata(self):
+        return {'contextKey': self.id}
+
+    def getRRDTemplates(self):
+        return self.templates
+
+    def getThresholdInstances(self, dsType):
+        return []
+
+
+class SnmpPerformanceConfigTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(SnmpPerformanceConfigTest, self).afterSetUp()
+        zope.component.provideUtility(MockNotifier(), IBatchNotifier)
+        self.service = SnmpPerformanceConfig(self.dmd, 'localhost')
+        self.builds = []
+        buildPlan = self.service._buildPlan
+        def countingBuild(template, perfServer):
+            self.builds.append(template.id)
+            return buildPlan(template, perfServer)
+        self.service._buildPlan = countingBuild
+
+        devices = self.dmd.Devices
+        devices.manage_addRRDTemplate('plantest')
+        self.template = devices.rrdTemplates.plantest
+        ds = self.template.manage_addRRDDataSource('sysUpTime',
+                                                   'BasicDataSource.SNMP')
+        ds.oid = '.1.3.6.1.2.1.1.3.0'
+        self.device = devices.createInstance('plandevice')
+        self.device.bindTemplates(['plantest'])
+
+    def _config(self):
+        oids = {}
+        self.service._createDeviceProxy(self.device)
+        perfServer = self.device.getPerformanceServer()
+        for i in range(3):
+            self.service._getComponentConfig(self.device, perfServer, oids)
+        return oids
+
+    def testPlanIsBuiltOncePerTemplate(self):
+        oids = self._config()
+        self.assertEquals(['plantest'], self.builds)
+        self.assertEquals(['1.3.6.1.2.1.1.3.0'], oids.keys())
+        self.assertEquals(3, len(oids['1.3.6.1.2.1.1.3.0']))
+        self._config()
+        self.assertEquals(['plantest'], self.builds)
+
+    def testPlanIsRebuiltWhenTemplateChanges(self):
+        self._config()
+        self.template.datasources.sysUpTime.manage_addRRDDataPoint('other')
+        oids = self._config()
+        self.assertEquals(['plantest', 'plantest'], self.builds)
+        names = set(data[1] for data in oids['1.3.6.1.2.1.1.3.0'])
+        self.assertEquals(set(['sysUpTime_sysUpTime', 'sysUpTime_other']),
+                          names)
+
+    def testIndexedOidsAreGroupedByColumn(self):
+        devices = self.dmd.Devices
+        devices.manage_addRRDTemplate('columntest')
+        template = devices.rrdTemplates.columntest
+        for name, oid in (('ifInOctets', '.1.3.6.1.2.1.2.2.1.10'),
+                          ('ifOutOctets', '.1.3.6.1.2.1.2.2.1.16')):
+            ds = template.manage_addRRDDataSource(name, 'BasicDataSource.SNMP')
+            ds.oid = oid
+        perfServer = self.device.getPerformanceServer()
+        oids, columns = {}, {}
+        for id, snmpindex in (('eth1', 1), ('eth2', 2), ('scalar', '')):
+            self.service._getComponentConfig(
+                MockComponent(id, snmpindex, [template]), perfServer, oids,
+                columns)
+        self.assertEquals({
+            '1.3.6.1.2.1.2.2.1.10': set(['1.3.6.1.2.1.2.2.1.10.1',
+                                         '1.3.6.1.2.1.2.2.1.10.2']),
+            '1.3.6.1.2.1.2.2.1.16': set(['1.3.6.1.2.1.2.2.1.16.1',
+                                         '1.3.6.1.2.1.2.2.1.16.2']),
+        }, columns)
+        # an oid without an index is collected, but not walked
+        self.assertIn('1.3.6.1.2.1.2.2.1.10', oids)
+        self.assertEquals(6, len(oids))
+
+        proxy = self.service._createDeviceProxy(self.device)
+        self.assertEquals({}, proxy.tableColumns)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(SnmpPerformanceConfigTest))
+    return suite
@@ -0,0 +1,131 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import collections
+import logging
+
+from twisted.internet import defer
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenHub.zenhub import ZenHub, HubWorklistItem, _ZenHubWorklist
+from Products.ZenHub.chunking import pickleToChunks
+
+
+class MockWorker(object):
+    busy = False
+
+    def __init__(self):
+        self.calls = []
+
+    def callRemote(self, name, *args):
+        d = defer.Deferred()
+        self.calls.append((args, d))
+        return d
+
+
+class MockWorkerSelector(object):
+    """
+    Selects idle workers in order, and no worker for methods in refused.
+    """
+
+    def __init__(self, refused=()):
+        self.refused = refused
+
+    def getCandidateWorkerIds(self, methodName, workers):
+        if methodName in self.refused:
+            return []
+        return [i for i, worker in enumerate(workers) if not worker.busy]
+
+
+def makeJob(method, value):
+    return HubWorklistItem(1, 0, defer.Deferred(), 'TestService', 'localhost',
+                           method, (value,), None)
+
+
+class WorkerDispatchTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(WorkerDispatchTest, self).afterSetUp()
+        self.hub = ZenHub.__new__(ZenHub)
+        self.hub.log = logging.getLogger('zen.ZenHub')
+        self.hub.workList = _ZenHubWorklist()
+        self.hub.workers = []
+        self.hub.inFlight = {}
+        self.hub.workTracker = {}
+        self.hub.executionTimer = collections.defaultdict(lambda: [0, 0.0, 0.0, 0])
+        self.hub.counters = collections.Counter()
+        self.hub.shutdown = False
+        self.hub.workerselector = MockWorkerSelector()
+
+    def addWorkers(self, n):
+        workers = [MockWorker() for i in range(n)]
+        self.hub.workers.extend(workers)
+        return workers
+
+    def addJobs(self, method, n):
+        jobs = [makeJob(method, i) for i in range(n)]
+        for job in jobs:
+            self.hub.workList.append(job)
+        return jobs
+
+    def testAllIdleWorkersAreFilledInOnePass(self):
+        workers = self.addWorkers(3)
+        jobs = self.addJobs('getDeviceConfigs', 5)
+        self.hub.giveWorkToWorkers()
+        self.assertTrue(all(worker.busy for worker in workers))
+        self.assertEquals([1, 1, 1], [len(worker.calls) for worker in workers])
+        self.assertEquals(dict(zip(workers, jobs[:3])), self.hub.inFlight)
+        self.assertEquals(2, len(self.hub.workList))
+        self.assertEquals(3, self.hub.counters['workerItems'])
+
+    def testInFlightIsClearedOnSuccess(self):
+        worker, = self.addWorkers(1)
+        first, second = self.addJobs('getDeviceConfigs', 2)
+        results = []
+        first.deferred.addCallback(results.append)
+        self.hub.giveWorkToWorkers()
+        self.assertEquals({worker: first}, self.hub.inFlight)
+
+        worker.calls[0][1].callback(pickleToChunks('done'))
+        self.assertEquals(['done'], results)
+        # the worker was refilled as soon as its job finished
+        self.assertEquals({worker: second}, self.hub.inFlight)
+        worker.calls[1][1].callback(pickleToChunks('done'))
+        self.assertEquals({}, self.hub.inFlight)
+        self.assertFalse(worker.busy)
+        self.assertEquals('Idle', self.hub.workTracker[0].status)
+
+    def testInFlightIsClearedOnError(self):
+        worker, = self.addWorkers(1)
+        job, = self.addJobs('getDeviceConfigs', 1)
+        failures = []
+        job.deferred.addErrback(failures.append)
+        self.hub.giveWorkToWorkers()
+        worker.calls[0][1].errback(Exception('remote error'))
+        self.assertEquals('remote error', failures[0].getErrorMessage())
+        self.assertEquals({}, self.hub.inFlight)
+        self.assertFalse(worker.busy)
+        self.assertEquals(0, len(self.hub.workList))
+
+    def testJobWithoutWorkerIsPutBackAtTheFront(self):
+        worker, = self.addWorkers(1)
+        self.hub.workerselector = MockWorkerSelector(refused=['sendEvents'])
+        events = self.addJobs('sendEvents', 3)
+        other, = self.addJobs('getDeviceConfigs', 1)
+        self.hub.giveWorkToWorkers()
+        self.assertEquals({worker: other}, self.hub.inFlight)
+        self.assertEquals(events, [self.hub.workList.eventworklist.pop()
+                                   for job in events])
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(WorkerDispatchTest))
+    return suite
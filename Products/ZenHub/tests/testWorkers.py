@@ -11,7 +11,8 @@
 from random import choice
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenHub.WorkerSelection import InOrderSelection, \
-    ReservationAwareSelection, ReversedReservationAwareSelection
+    ReservationAwareSelection, ReversedReservationAwareSelection, \
+    ApplyDataMapsSelection
 
 class MockWorker(object):
     busy = False
@@ -73,7 +74,20 @@ class TestWorkers(BaseTestCase):
                 selection = list(selector.getCandidateWorkerIds(workers, options))
                 self.assertValidSelection(workers, selection, options)
                 self.assertEqual(selection, list(reversed(sorted(selection))))
-        
+
+    def testWorkersReservedForApplyDataMaps(self):
+        options = MockOptions()
+        options.workersReservedForEvents = 1
+        options.workersReservedForApplyDataMaps = 2
+        workers = setupNWorkers(5)
+        self.assertEqual([1, 2], list(ReservationAwareSelection()
+                                      .getCandidateWorkerIds(workers, options)))
+        self.assertEqual([4, 3, 2, 1], list(ApplyDataMapsSelection()
+                                            .getCandidateWorkerIds(workers, options)))
+        workers[4].busy = True
+        self.assertEqual([3, 2, 1], list(ApplyDataMapsSelection()
+                                         .getCandidateWorkerIds(workers, options)))
+
 def test_suite():
     from unittest import TestSuite, makeSuite
     suite = TestSuite()
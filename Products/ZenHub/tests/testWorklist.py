@@ -9,11 +9,17 @@
 
 
 import collections
-import heapq
+import time
 from Products.ZenTestCase.BaseTestCase import BaseTestCase
-from Products.ZenHub.zenhub import _ZenHubWorklist
+from Products.ZenHub.zenhub import _ZenHubWorklist, _DeviceSerialQueue
 
-MockHubWorklistItem = collections.namedtuple('MockHubWorklistItem', 'value method')
+class MockHubWorklistItem(collections.namedtuple('MockHubWorklistItem', 'value method priority recvtime')):
+    def __new__(cls, value, method, priority=1, recvtime=0):
+        return super(MockHubWorklistItem, cls).__new__(cls, value, method, priority, recvtime)
+
+class MockKeyedWorklistItem(collections.namedtuple('MockKeyedWorklistItem', 'value key method priority recvtime deferred')):
+    def __new__(cls, value, key, method='applyDataMaps', priority=1, recvtime=0):
+        return super(MockKeyedWorklistItem, cls).__new__(cls, value, key, method, priority, recvtime, object())
 
 class TestWorklist(BaseTestCase):
 
@@ -69,8 +75,8 @@ class TestWorklist(BaseTestCase):
 
         self.assertEqual(worklist.applyworklist, worklist['applyDataMaps'])
 
-    def _popSorted(self, heap):
-        return (heapq.heappop(heap) for i in range(len(heap)))
+    def _popSorted(self, queue):
+        return (queue.pop() for i in range(len(queue)))
 
     def testAppend(self):
         worklist = _ZenHubWorklist()
@@ -91,26 +97,28 @@ class TestWorklist(BaseTestCase):
         popped = []
         for i in range(5):
             popped.append(worklist.pop())
-        for item in popped:
-            worklist.push(item)
+        for item in reversed(popped):
+            worklist.pushleft(item)
         self.assertEqual([i.value for i in self._popSorted(worklist.otherworklist)], range(10))
 
         worklist = _ZenHubWorklist()
+        popped = []
         for i in range(10):
             worklist.push(MockHubWorklistItem(method='sendEvents', value=i))
         for i in range(5):
             popped.append(worklist.pop())
-        for item in popped:
-            worklist.push(item)
+        for item in reversed(popped):
+            worklist.pushleft(item)
         self.assertEqual([i.value for i in self._popSorted(worklist.eventworklist)], range(10))
 
         worklist = _ZenHubWorklist()
+        popped = []
         for i in range(10):
             worklist.push(MockHubWorklistItem(method='applyDataMaps', value=i))
         for i in range(5):
             popped.append(worklist.pop())
-        for item in popped:
-            worklist.push(item)
+        for item in reversed(popped):
+            worklist.pushleft(item)
         self.assertEqual([i.value for i in self._popSorted(worklist.applyworklist)], range(10))
 
     def testPopAll(self):
@@ -167,6 +175,97 @@ class TestWorklist(BaseTestCase):
         self.assertEqual(len(worklist.otherworklist), 0)
         self.assertEqual(len(worklist), 0)
 
+    def testPriority(self):
+        worklist = _ZenHubWorklist()
+        worklist.push(MockHubWorklistItem(method='test', value=0))
+        worklist.push(MockHubWorklistItem(method='test', value=1, priority=0.1))
+        worklist.push(MockHubWorklistItem(method='test', value=2))
+        self.assertEqual([1, 0, 2], [worklist.pop().value for i in range(3)])
+
+    def testWeightedRoundRobin(self):
+        worklist = _ZenHubWorklist()
+        for method in ('sendEvents', 'test', 'applyDataMaps'):
+            for i in range(20):
+                worklist.push(MockHubWorklistItem(method=method, value=i))
+        methods = [worklist.pop().method for i in range(14)]
+        self.assertEqual(8, methods.count('sendEvents'))
+        self.assertEqual(4, methods.count('test'))
+        self.assertEqual(2, methods.count('applyDataMaps'))
+
+    def testEmptyQueuesAreSkipped(self):
+        worklist = _ZenHubWorklist()
+        for i in range(3):
+            worklist.push(MockHubWorklistItem(method='applyDataMaps', value=i))
+        self.assertEqual([0, 1, 2], [worklist.pop().value for i in range(3)])
+        self.assertRaises(IndexError, worklist.pop)
+
+    def testOldestAge(self):
+        worklist = _ZenHubWorklist()
+        self.assertEqual(0, worklist.oldestAge(now=100))
+        worklist.push(MockHubWorklistItem(method='test', value=0, recvtime=90))
+        worklist.push(MockHubWorklistItem(method='test', value=1, priority=0, recvtime=95))
+        worklist.push(MockHubWorklistItem(method='applyDataMaps', value=2, recvtime=60))
+        self.assertEqual(10, worklist.otherworklist.oldestAge(now=100))
+        self.assertEqual(40, worklist.oldestAge(now=100))
+        stats = worklist.stats(now=100)
+        self.assertEqual((2, 10), stats['other'])
+        self.assertEqual((1, 40), stats['applyDataMaps'])
+        self.assertEqual((0, 0), stats['events'])
+
+    def testJobsWithSameKeyAreSerialized(self):
+        queue = _DeviceSerialQueue('applyDataMaps')
+        jobs = [MockKeyedWorklistItem(0, 'dev1'), MockKeyedWorklistItem(1, 'dev1'),
+                MockKeyedWorklistItem(2, 'dev2'), MockKeyedWorklistItem(3, None)]
+        for job in jobs:
+            queue.push(job)
+        self.assertEqual(4, len(queue))
+        self.assertEqual([0, 2, 3], [queue.pop().value for i in range(3)])
+        self.assertFalse(queue)
+        self.assertEqual(1, len(queue))
+        queue.finished(jobs[2])
+        self.assertFalse(queue)
+        queue.finished(jobs[0])
+        self.assertTrue(queue)
+        self.assertEqual(1, queue.pop().value)
+        self.assertEqual(1, queue.activeKeys())
+        queue.finished(jobs[1])
+        self.assertEqual(0, queue.activeKeys())
+        self.assertEqual(0, len(queue))
+
+    def testWorklistIsFalseWhileJobsWait(self):
+        worklist = _ZenHubWorklist()
+        worklist.push(MockKeyedWorklistItem(0, 'dev1'))
+        worklist.push(MockKeyedWorklistItem(1, 'dev1'))
+        job = worklist.pop()
+        self.assertEqual(1, len(worklist))
+        self.assertFalse(worklist)
+        worklist.finished(job)
+        self.assertTrue(worklist)
+
+    def testRetryBackoff(self):
+        queue = _DeviceSerialQueue('applyDataMaps', backoff=2)
+        job = MockKeyedWorklistItem(0, 'dev1')
+        later = MockKeyedWorklistItem(1, 'dev1')
+        other = MockKeyedWorklistItem(2, 'dev2')
+        queue.push(job)
+        queue.push(later)
+        self.assertIs(job, queue.pop())
+        now = time.time() + 1000
+        self.assertEqual(2, queue.retry(job, 2, now=now))
+        queue.push(other)
+        # the other device is not held up, the same device waits
+        self.assertIs(other, queue.pop())
+        self.assertEqual(1, queue.delayed())
+        self.assertFalse(queue)
+        queue._release(now=now + 2)
+        self.assertIs(job, queue.pop())
+        self.assertEqual(4, queue.retry(job, 2, now=now))
+        queue._release(now=now + 4)
+        self.assertIs(job, queue.pop())
+        self.assertIsNone(queue.retry(job, 2, now=now))
+        queue.finished(job)
+        self.assertIs(later, queue.pop())
+
 
 def test_suite():
     from unittest import TestSuite, makeSuite
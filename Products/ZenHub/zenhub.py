@@ -30,9 +30,7 @@ import signal
 import cPickle as pickle
 import os
 import subprocess
-import itertools
-from random import choice
-from zope.component import getAdapters, subscribers
+from zope.component import getAdapters, subscribers, getSiteManager
 
 from twisted.cred import portal, checkers, credentials
 from twisted.spread import pb, banana
@@ -43,7 +41,7 @@ from twisted.web import server, xmlrpc
 from twisted.internet.error import ProcessExitedAlready
 from twisted.internet.defer import inlineCallbacks, returnValue
 from zope.event import notify
-from zope.interface import implements
+from zope.interface import implements, providedBy
 from zope.component import getUtility, getUtilitiesFor, adapts
 from ZODB.POSException import POSKeyError
 
@@ -61,14 +59,17 @@ from Products.ZenHub.interfaces import IInvalidationProcessor, IServiceAddedEven
 from Products.ZenHub.interfaces import IParserReadyForOptionsEvent, IInvalidationFilter
 from Products.ZenHub.interfaces import FILTER_INCLUDE, FILTER_EXCLUDE
 from Products.ZenHub.invalidations import INVALIDATIONS_PAUSED
+from Products.ZenHub.invalidationfilter import BaseOrganizerFilter
 from Products.ZenHub.WorkerSelection import WorkerSelector
+from Products.ZenHub.chunking import pickleToChunks, unpickleChunks
+from Products.ZenHub.services.Procrastinator import Procrastinate
 from zenoss.protocols.protobufs.zep_pb2 import SEVERITY_CRITICAL, SEVERITY_CLEAR
 from Products.ZenUtils.metricwriter import MetricWriter, FilteredMetricWriter, AggregateMetricWriter
 from Products.ZenUtils.metricwriter import ThresholdNotifier
 from Products.ZenUtils.metricwriter import DerivativeTracker
 from Products.ZenHub.metricpublisher.publisher import HttpPostPublisher
 
-from Products.ZenHub.PBDaemon import RemoteBadMonitor
+from Products.ZenHub.PBDaemon import RemoteBadMonitor, RemoteConflictError
 pb.setUnjellyableForClass(RemoteBadMonitor, RemoteBadMonitor)
 
 # Due to the manipulation of sys.path during the loading of plugins,
@@ -89,7 +90,9 @@ from Products.ZenHub import PB_PORT
 from Products.ZenHub import OPTION_STATE
 from Products.ZenHub import CONNECT_TIMEOUT
 
-HubWorklistItem = collections.namedtuple('HubWorklistItem', 'priority recvtime deferred servicename instance method args')
+# key: jobs with the same key are run one at a time (see _DeviceSerialQueue)
+HubWorklistItem = collections.namedtuple('HubWorklistItem', 'priority recvtime deferred servicename instance method args key')
+HubWorklistItem.__new__.__defaults__ = (None,)
 WorkerStats = collections.namedtuple('WorkerStats', 'status description lastupdate previdle')
 LastCallReturnValue = collections.namedtuple('LastCallReturnValue', 'returnvalue')
 
@@ -208,6 +211,7 @@ class HubAvitar(pb.Avatar):
                 self.hub.workers.remove(worker)
 
         worker.notifyOnDisconnect(removeWorker)
+        reactor.callLater(0, self.hub.giveWorkToWorkers)
 
 
 class ServiceAddedEvent(object):
@@ -278,15 +282,11 @@ class WorkerInterceptor(pb.Referenceable):
         # PB has a 640k limit, not bytes but len of sequences. When args are
         # pickled the resulting string may be larger than 640k, split into
         # 100k chunks
-        pickledArgs = pickle.dumps( (args, kw), pickle.HIGHEST_PROTOCOL )
-        chunkedArgs=[]
-        chunkSize = 102400
-        while pickledArgs:
-            chunk = pickledArgs[:chunkSize]
-            chunkedArgs.append(chunk)
-            pickledArgs = pickledArgs[chunkSize:]
-
-        deferred = self.zenhub.deferToWorker(svc, instance, message, chunkedArgs)
+        chunkedArgs = pickleToChunks((args, kw))
+        # applyDataMaps calls for the same device are serialized
+        key = args[0] if message == 'applyDataMaps' and args else None
+
+        deferred = self.zenhub.deferToWorker(svc, instance, message, chunkedArgs, key)
         return broker.serialize(deferred, self.perspective)
 
     def __getattr__(self, attr):
@@ -294,23 +294,222 @@ class WorkerInterceptor(pb.Referenceable):
         return getattr(self.service, attr)
 
 
+class _WorkQueue(object):
+    """
+    FIFO queue of jobs of one method class. Jobs with a lower priority
+    number are popped first; jobs of equal priority are popped in the order
+    they were pushed. The number of distinct priorities is small, so push
+    and pop are constant time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._queues = {}
+        self._priorities = []
+        self._len = 0
+
+    def _queue(self, priority):
+        queue = self._queues.get(priority)
+        if queue is None:
+            queue = self._queues[priority] = collections.deque()
+            self._priorities = sorted(self._queues)
+        return queue
+
+    def __len__(self):
+        return self._len
+
+    def push(self, job):
+        self._queue(job.priority).append(job)
+        self._len += 1
+
+    def pushleft(self, job):
+        """
+        Put a job back at the front of the queue, e.g. when it could not be
+        dispatched.
+        """
+        self._queue(job.priority).appendleft(job)
+        self._len += 1
+
+    def pop(self):
+        for priority in self._priorities:
+            queue = self._queues[priority]
+            if queue:
+                self._len -= 1
+                return queue.popleft()
+        raise IndexError("pop from an empty queue")
+
+    def oldest(self):
+        """
+        Return the receive time of the oldest queued job, or None.
+        """
+        heads = [q[0].recvtime for q in self._queues.itervalues() if q]
+        return min(heads) if heads else None
+
+    def oldestAge(self, now=None):
+        """
+        Return how many seconds the oldest queued job has waited.
+        """
+        oldest = self.oldest()
+        if oldest is None:
+            return 0.0
+        return (now or time.time()) - oldest
+
+    def finished(self, job):
+        """
+        Called when a job popped from this queue is done.
+        """
+        pass
+
+
+class _DeviceSerialQueue(_WorkQueue):
+    """
+    Queue of jobs that must not run at the same time for the same key, the
+    device of an applyDataMaps call. A job waits until the previous job with
+    its key has finished; jobs with different keys run in parallel. Jobs
+    without a key are not serialized.
+
+    A job that failed with a ZODB conflict can be put aside and queued again
+    after an exponential back-off. It keeps its key, so later jobs for the
+    same device stay behind it, while the jobs of other devices go on.
+    """
+
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, name, backoff=1.0):
+        super(_DeviceSerialQueue, self).__init__(name)
+        self.backoff = backoff
+        # keys with a job queued, running or waiting to be retried
+        self._active = set()
+        # key -> jobs queued behind the active job of that key
+        self._waiting = {}
+        self._waitingLen = 0
+        # heap of (time to retry, sequence, job)
+        self._delayed = []
+        self._sequence = 0
+        # job deferred -> failed attempts
+        self._attempts = {}
+
+    def __len__(self):
+        return self._len + self._waitingLen + len(self._delayed)
+
+    def __nonzero__(self):
+        """
+        True if a job can be popped now.
+        """
+        self._release()
+        return self._len > 0
+
+    def _release(self, now=None):
+        now = now or time.time()
+        while self._delayed and self._delayed[0][0] <= now:
+            super(_DeviceSerialQueue, self).push(heapq.heappop(self._delayed)[2])
+
+    def push(self, job):
+        key = getattr(job, 'key', None)
+        if key is None:
+            super(_DeviceSerialQueue, self).push(job)
+        elif key in self._active:
+            self._waiting.setdefault(key, collections.deque()).append(job)
+            self._waitingLen += 1
+        else:
+            self._active.add(key)
+            super(_DeviceSerialQueue, self).push(job)
+
+    def pop(self):
+        self._release()
+        return super(_DeviceSerialQueue, self).pop()
+
+    def finished(self, job):
+        """
+        Let the next job with the same key be popped.
+        """
+        self._attempts.pop(job.deferred, None)
+        key = getattr(job, 'key', None)
+        if key is None:
+            return
+        waiting = self._waiting.get(key)
+        if waiting:
+            self._waitingLen -= 1
+            nextJob = waiting.popleft()
+            if not waiting:
+                del self._waiting[key]
+            super(_DeviceSerialQueue, self).push(nextJob)
+        else:
+            self._active.discard(key)
+
+    def retry(self, job, maxRetries, now=None):
+        """
+        Queue a failed job again after a back-off that doubles with every
+        attempt. Return the back-off in seconds, or None if the job has been
+        retried maxRetries times already.
+        """
+        attempts = self._attempts.get(job.deferred, 0) + 1
+        if attempts > maxRetries:
+            return None
+        self._attempts[job.deferred] = attempts
+        delay = min(self.backoff * 2 ** (attempts - 1), self.MAX_BACKOFF)
+        self._sequence += 1
+        heapq.heappush(self._delayed,
+                       ((now or time.time()) + delay, self._sequence, job))
+        return delay
+
+    def oldest(self):
+        heads = [q[0].recvtime for q in self._waiting.itervalues()]
+        heads.extend(job.recvtime for _, _, job in self._delayed)
+        oldest = super(_DeviceSerialQueue, self).oldest()
+        if oldest is not None:
+            heads.append(oldest)
+        return min(heads) if heads else None
+
+    def activeKeys(self):
+        return len(self._active)
+
+    def delayed(self):
+        return len(self._delayed)
+
+
 class _ZenHubWorklist(object):
+    """
+    Weighted fair queue of hub jobs. Jobs are split into events,
+    applyDataMaps and all other (mostly configuration) calls, and the three
+    queues are served in a fixed weighted round robin:
+        sendEvents : configuration service calls : applyDataMaps = 4 : 2 : 1
+    Empty queues are skipped, so no worker slot is wasted. applyDataMaps
+    calls for the same device are run one at a time (see _DeviceSerialQueue).
+    """
+
+    WEIGHTS = (('events', 4), ('other', 2), ('applyDataMaps', 1))
 
     def __init__(self):
-        self.eventworklist = []
-        self.otherworklist = []
-        self.applyworklist = []
-
-        #priority lists for eventual task selection. All queues are appended in case
-        #any of them are empty.
-        self.eventPriorityList = [self.eventworklist, self.otherworklist, self.applyworklist]
-        self.otherPriorityList = [self.otherworklist, self.applyworklist, self.eventworklist]
-        self.applyPriorityList = [self.applyworklist, self.eventworklist, self.otherworklist]
+        self.eventworklist = _WorkQueue('events')
+        self.otherworklist = _WorkQueue('other')
+        self.applyworklist = _DeviceSerialQueue('applyDataMaps')
+        self.queues = (self.eventworklist, self.otherworklist, self.applyworklist)
+
         self.dispatch = {
             'sendEvents': self.eventworklist,
             'sendEvent': self.eventworklist,
             'applyDataMaps': self.applyworklist
         }
+        self._schedule = self._buildSchedule(self.WEIGHTS)
+        self._next = 0
+
+    def _buildSchedule(self, weights):
+        """
+        Interleave the queues by weight (smooth weighted round robin), e.g.
+        events, other, events, applyDataMaps, events, other, events.
+        """
+        byName = dict((q.name, q) for q in self.queues)
+        total = sum(w for _, w in weights)
+        current = dict((name, 0) for name, _ in weights)
+        schedule = []
+        for i in xrange(total):
+            for name, weight in weights:
+                current[name] += weight
+            name = max(weights, key=lambda nw: current[nw[0]])[0]
+            current[name] -= total
+            schedule.append(byName[name])
+        return schedule
 
     def __getitem__(self, item):
         return self.dispatch.get(item, self.otherworklist)
@@ -318,26 +517,56 @@ class _ZenHubWorklist(object):
     def __len__(self):
         return len(self.eventworklist) + len(self.otherworklist) + len(self.applyworklist)
 
+    def __nonzero__(self):
+        """
+        True if a job can be popped now. Serialized or delayed jobs are
+        counted by len() but cannot be popped yet.
+        """
+        return any(self.queues)
+
     def pop(self):
         """
-        Select a single task to be distributed to a worker. We prioritize tasks as follows:
-            sendEvents > configuration service calls > applyDataMaps
-        To prevent starving any queue in an event storm, we randomize the task selection,
-        preferring tasks according to the above priority.
+        Select a single task to be distributed to a worker, taking the next
+        non-empty queue in the weighted round robin schedule.
         """
-        eventchain = filter(None, self.eventPriorityList)
-        otherchain = filter(None, self.otherPriorityList)
-        applychain = filter(None, self.applyPriorityList)
-        seq = choice([eventchain]*4 +
-                      [otherchain]*2 +
-                      [applychain]
-                                 )
-        return heapq.heappop(seq[0])
+        size = len(self._schedule)
+        for i in xrange(size):
+            queue = self._schedule[self._next]
+            self._next = (self._next + 1) % size
+            if queue:
+                return queue.pop()
+        raise IndexError("pop from an empty worklist")
 
     def push(self, job):
-        heapq.heappush(self[job.method], job)
+        self[job.method].push(job)
     append = push
 
+    def pushleft(self, job):
+        """
+        Return a job that could not be dispatched to the front of its queue.
+        """
+        self[job.method].pushleft(job)
+
+    def finished(self, job):
+        """
+        Tell the queue of a dispatched job that the job is done.
+        """
+        self[job.method].finished(job)
+
+    def oldestAge(self, now=None):
+        """
+        Return how many seconds the oldest queued job of any kind has waited.
+        """
+        now = now or time.time()
+        return max(q.oldestAge(now) for q in self.queues)
+
+    def stats(self, now=None):
+        """
+        Return {queue name: (length, age of oldest job in seconds)}.
+        """
+        now = now or time.time()
+        return dict((q.name, (len(q), q.oldestAge(now))) for q in self.queues)
+
 def publisher(username, password, url):
     return HttpPostPublisher( username, password, url)
   
@@ -407,6 +636,8 @@ class ZenHub(ZCmdBase):
         """
         # list of remote worker references
         self.workers = []
+        # map of remote worker references -> job being executed
+        self.inFlight = {}
         self.workTracker = {}
         # zenhub execution stats: [count, idle_total, running_total, last_called_time]
         self.executionTimer = collections.defaultdict(lambda: [0, 0.0, 0.0, 0])
@@ -417,6 +648,8 @@ class ZenHub(ZCmdBase):
         self.workerprocessmap = {}
         self.shutdown = False
         self.counters = collections.Counter()
+        # cumulative seconds spent in each stage of invalidation filtering
+        self.invalidationTimings = collections.Counter()
         self._invalidations_paused = False
 
         ZCmdBase.__init__(self)
@@ -424,6 +657,8 @@ class ZenHub(ZCmdBase):
         load_config("hub.zcml", Products.ZenHub)
         notify(HubWillBeCreatedEvent(self))
 
+        Procrastinate.setWindow(self.options.invalidation_coalesce_window)
+
         #Worker selection handler
         self.workerselector = WorkerSelector(self.options)
         self.workList.log = self.log
@@ -436,6 +671,13 @@ class ZenHub(ZCmdBase):
             self.options.workersReservedForEvents = maxReservedEventsWorkers
             self.log.info("reduced number of workers reserved for sending events to %d",
                           self.options.workersReservedForEvents)
+        # ... and leave at least one worker for other calls
+        maxReservedADMWorkers = max(0, maxReservedEventsWorkers - self.options.workersReservedForEvents)
+        if self.options.workersReservedForApplyDataMaps > maxReservedADMWorkers:
+            self.options.workersReservedForApplyDataMaps = maxReservedADMWorkers
+            self.log.info("reduced number of workers reserved for applyDataMaps to %d",
+                          self.options.workersReservedForApplyDataMaps)
+        self.workList.applyworklist.backoff = self.options.adm_retry_backoff
 
         self.zem = self.dmd.ZenEventManager
         loadPlugins(self.dmd)
@@ -577,47 +819,123 @@ class ZenHub(ZCmdBase):
         self.log.debug('Registered %s invalidation filters.' %
                        len(self._invalidation_filters))
 
+    def _prefetchOids(self, jar, oids):
+        """
+        Ask the storage to load the state of all oids in one round trip, if
+        the connection supports it.
+        """
+        prefetch = getattr(jar, 'prefetch', None)
+        if prefetch is not None and oids:
+            try:
+                prefetch(oids)
+            except Exception:
+                self.log.debug("Unable to prefetch %d oids", len(oids), exc_info=True)
+
     def _filter_oids(self, oids):
+        """
+        Return the oids that invalidation processing needs to look at, after
+        running the invalidation filters and oid transforms on a batch of
+        invalidated oids.
+        """
+        timings = collections.OrderedDict(
+            (stage, 0.0) for stage in ('prefetch', 'load', 'filter', 'transform'))
         app = self.dmd.getPhysicalRoot()
-        i = 0
+        jar = app._p_jar
+        # the same oid may be invalidated by several transactions in one poll
+        oids = list(collections.OrderedDict.fromkeys(oids))
+
+        start = time.time()
+        self._prefetchOids(jar, oids)
+        timings['prefetch'] = time.time() - start
+
+        result = []
+        objects = []
+        start = time.time()
         for oid in oids:
-            i += 1
             try:
-                obj = app._p_jar[oid]
+                obj = jar[oid]
             except POSKeyError:
                 # State is gone from the database. Send it along.
-                yield oid
+                result.append(oid)
             else:
                 if isinstance(obj, (PrimaryPathObjectManager, DeviceComponent)):
                     try:
                         obj = obj.__of__(self.dmd).primaryAq()
                     except (AttributeError, KeyError):
                         # It's a delete. This should go through.
-                        yield oid
+                        result.append(oid)
                     else:
-                        included = True
-                        for fltr in self._invalidation_filters:
-                            result = fltr.include(obj)
-                            if result in (FILTER_INCLUDE, FILTER_EXCLUDE):
-                                included = (result == FILTER_INCLUDE)
-                                break
-                        if included:
-                            oids = self._transformOid(oid, obj)
-                            if oids:
-                                for oid in oids:
-                                    yield oid
-
-    def _transformOid(self, oid, obj):
-        # First, get any subscription adapters registered as transforms
-        adapters = subscribers((obj,), IInvalidationOid)
+                        objects.append((oid, obj))
+        timings['load'] = time.time() - start
+
+        start = time.time()
+        included = []
+        decisions = {}
+        for oid, obj in objects:
+            for fltr in self._invalidation_filters:
+                decision = self._filterDecision(fltr, obj, decisions)
+                if decision in (FILTER_INCLUDE, FILTER_EXCLUDE):
+                    if decision == FILTER_INCLUDE:
+                        included.append((oid, obj))
+                    break
+            else:
+                included.append((oid, obj))
+        timings['filter'] = time.time() - start
+
+        start = time.time()
+        transforms = {}
+        for oid, obj in included:
+            result.extend(self._transformOid(oid, obj, transforms))
+        timings['transform'] = time.time() - start
+
+        for stage, elapsed in timings.iteritems():
+            self.invalidationTimings[stage] += elapsed
+        self.log.debug("Filtered %d invalidated oids to %d in %.3fs (%s)",
+                       len(oids), len(result), sum(timings.values()),
+                       ', '.join('%s %.3fs' % item for item in timings.iteritems()))
+        return result
+
+    def _filterDecision(self, fltr, obj, decisions):
+        """
+        Return the decision of fltr for obj. The decisions of organizer
+        filters are remembered per organizer path in the decisions dict for
+        the rest of the batch, so each organizer is checksummed once.
+        """
+        if not (isinstance(fltr, BaseOrganizerFilter)
+                and isinstance(obj, fltr._types)):
+            return fltr.include(obj)
+        key = (fltr, obj.getPrimaryId())
+        decision = decisions.get(key)
+        if decision is None:
+            decision = decisions[key] = fltr.include(obj)
+        return decision
+
+    def _getOidTransforms(self, obj, cache=None):
+        """
+        Return the IInvalidationOid adapters for obj. Subscription adapter
+        factories are looked up once per set of provided interfaces when a
+        cache dict is given.
+        """
+        if cache is None:
+            adapters = list(subscribers((obj,), IInvalidationOid))
+        else:
+            spec = providedBy(obj)
+            factories = cache.get(spec)
+            if factories is None:
+                factories = cache[spec] = getSiteManager().adapters.subscriptions(
+                    (spec,), IInvalidationOid)
+            adapters = [a for a in (f(obj) for f in factories) if a is not None]
         # Next check for an old-style (regular adapter) transform
         try:
-            adapters = itertools.chain(adapters, (IInvalidationOid(obj),))
+            adapters.append(IInvalidationOid(obj))
         except TypeError:
             # No old-style adapter is registered
             pass
+        return adapters
+
+    def _transformOid(self, oid, obj, cache=None):
         transformed = set()
-        for adapter in adapters:
+        for adapter in self._getOidTransforms(obj, cache):
             o = adapter.transformOid(oid)
             if isinstance(o, basestring):
                 transformed.add(o)
@@ -742,7 +1060,7 @@ class ZenHub(ZCmdBase):
                 notify(ServiceAddedEvent(name, instance))
                 return svc
 
-    def deferToWorker(self, svcName, instance, method, args):
+    def deferToWorker(self, svcName, instance, method, args, key=None):
         """Take a remote request and queue it for worker processes.
 
         @type svcName: string
@@ -753,6 +1071,8 @@ class ZenHub(ZCmdBase):
         @param method: the name of the method on the hub service to call
         @type args: tuple
         @param args: the remaining arguments to the remote_execute() method in the worker
+        @type key: string
+        @param key: jobs with the same key are not run at the same time
         @return: a Deferred for the eventual results of the method call
         """
         d = defer.Deferred()
@@ -761,7 +1081,7 @@ class ZenHub(ZCmdBase):
 
         self.workList.append(
             HubWorklistItem(priority, time.time(), d, svcName, instance, method,
-                            (svcName, instance, method, args)))
+                            (svcName, instance, method, args), key))
 
         reactor.callLater(0, self.giveWorkToWorkers)
         return d
@@ -793,11 +1113,17 @@ class ZenHub(ZCmdBase):
         finishedWorker.busy = False
         error = None
         if isinstance(result, Exception):
+            if self._retryConflict(job, result):
+                self.updateStatusAtFinish(wId, job, 'conflict, retrying')
+                self.giveWorkToWorkers()
+                returnValue(None)
+            self._jobDone(job)
             job.deferred.errback(result)
         else:
+            self._jobDone(job)
             try:
-                self.log.debug("worker %s result -> %s", wId, result)
-                result = pickle.loads(''.join(result))
+                self.log.debug("worker %s returned %d chunks", wId, len(result))
+                result = unpickleChunks(result)
             except Exception as e:
                 error = e
                 self.log.exception("Error un-pickling result from worker")
@@ -815,12 +1141,40 @@ class ZenHub(ZCmdBase):
             job.deferred.callback(result)
 
         self.updateStatusAtFinish(wId, job, error)
-        reactor.callLater(0, self.giveWorkToWorkers)
+        self.giveWorkToWorkers()
         yield returnValue(result)
 
-    @inlineCallbacks
+    def _jobDone(self, job):
+        self.workList.finished(job)
+        if job.method == 'applyDataMaps':
+            self.counters['applyDataMapsCompleted'] += 1
+
+    def _retryConflict(self, job, error):
+        """
+        Put an applyDataMaps job that failed with a ZODB conflict aside, to
+        be retried after a back-off without holding up the jobs of other
+        devices. Return False if the job should fail instead.
+        """
+        if job.method != 'applyDataMaps' or not isinstance(error, RemoteConflictError):
+            return False
+        self.counters['applyDataMapsConflicts'] += 1
+        delay = self.workList.applyworklist.retry(job, self.options.adm_conflict_retries)
+        if delay is None:
+            self.counters['applyDataMapsRetriesExhausted'] += 1
+            self.log.warning("applyDataMaps for %s failed after %d conflict retries",
+                             job.key, self.options.adm_conflict_retries)
+            return False
+        self.counters['applyDataMapsRetries'] += 1
+        self.log.debug("applyDataMaps for %s conflicted, retrying in %.1fs", job.key, delay)
+        reactor.callLater(delay, self.giveWorkToWorkers)
+        return True
+
     def giveWorkToWorkers(self, requeue=False):
-        """Parcel out a method invocation to an available worker process
+        """Parcel out method invocations to all available worker processes
+
+        Jobs are dispatched without waiting for their results, so every idle
+        worker is given a job in a single pass. A worker is refilled from
+        finished() as soon as its job completes.
         """
         if self.workList:
             self.log.debug("worklist has %d items", len(self.workList))
@@ -831,19 +1185,9 @@ class ZenHub(ZCmdBase):
                 break
 
             job = self.workList.pop()
-            candidateWorkers = list(self.workerselector.getCandidateWorkerIds(job.method, self.workers))
+            candidateWorkers = self.workerselector.getCandidateWorkerIds(job.method, self.workers)
             for i in candidateWorkers:
-                worker = self.workers[i]
-                worker.busy = True
-                self.counters['workerItems'] += 1
-                self.updateStatusAtStart(i, job)
-                try:
-                    result = yield worker.callRemote('execute', *job.args)
-                except Exception as ex:
-                    self.log.warning("Failed to execute job on zenhub worker")
-                    result = ex
-                finally:
-                    yield self.finished(job, result, worker, i)
+                self._dispatchJob(job, self.workers[i], i)
                 break
             else:
                 #could not complete this job, put it back in the queue once
@@ -852,22 +1196,55 @@ class ZenHub(ZCmdBase):
 
         for job in reversed(incompleteJobs):
             #could not complete this job, put it back in the queue
-            self.workList.push(job)
+            self.workList.pushleft(job)
 
         if incompleteJobs:
             self.log.debug("No workers available for %d jobs." % len(incompleteJobs))
-            reactor.callLater(0, self.giveWorkToWorkers)
 
         if requeue and not self.shutdown:
             reactor.callLater(5, self.giveWorkToWorkers, True)
 
+    def _dispatchJob(self, job, worker, wId):
+        """Send a job to a worker without waiting for the result
+        """
+        worker.busy = True
+        self.inFlight[worker] = job
+        self.counters['workerItems'] += 1
+        self.updateStatusAtStart(wId, job)
+
+        def failed(reason):
+            self.log.warning("Failed to execute job on zenhub worker")
+            return reason.value
+
+        def done(result):
+            self.inFlight.pop(worker, None)
+            return self.finished(job, result, worker, wId)
+
+        d = worker.callRemote('execute', *job.args)
+        d.addErrback(failed)
+        d.addCallback(done)
+        d.addErrback(lambda reason: self.log.error(
+            "Error handling result of %s: %s", job.method,
+            reason.getErrorMessage()))
+        return d
+
     def _workerStats(self):
         now = time.time()
         lines = ['Worklist Stats:',
-                 '\tEvents:\t%s' % len(self.workList.eventworklist),
-                 '\tOther:\t%s' % len(self.workList.otherworklist),
-                 '\tApplyDataMaps:\t%s' % len(self.workList.applyworklist),
+                 '\tEvents:\t%s\toldest %.3fs' % (len(self.workList.eventworklist),
+                                                   self.workList.eventworklist.oldestAge(now)),
+                 '\tOther:\t%s\toldest %.3fs' % (len(self.workList.otherworklist),
+                                                  self.workList.otherworklist.oldestAge(now)),
+                 '\tApplyDataMaps:\t%s\toldest %.3fs\tdevices %d\tretrying %d' % (
+                     len(self.workList.applyworklist),
+                     self.workList.applyworklist.oldestAge(now),
+                     self.workList.applyworklist.activeKeys(),
+                     self.workList.applyworklist.delayed()),
                  '\tTotal:\t%s' % len(self.workList),
+                 '\tIn Flight:\t%s' % len(self.inFlight),
+                 '\nInvalidation Timings: %s' % ', '.join(
+                     '%s %.3fs' % (stage, self.invalidationTimings[stage])
+                     for stage in ('prefetch', 'load', 'filter', 'transform')),
                  '\nHub Execution Timings: [method, count, idle_total, running_total, last_called_time]'
                  ]
 
@@ -901,6 +1278,10 @@ class ZenHub(ZCmdBase):
             workerfd.write("logseverity %s\n" % self.options.logseverity)
             workerfd.write("zodb-cachesize %s\n" % self.options.zodb_cachesize)
             workerfd.write("calllimit %s\n" % self.options.worker_call_limit)
+            workerfd.write("compressthreshold %s\n" % self.options.worker_compress_threshold)
+            if self.options.adm_conflict_retries > 0:
+                # zenhub retries conflicting applyDataMaps calls itself
+                workerfd.write("hubretrymethods applyDataMaps\n")
 
     def createWorker(self):
         """Start a worker subprocess
@@ -978,6 +1359,13 @@ class ZenHub(ZCmdBase):
         r.gauge('services', len(self.services))
         r.counter('totalCallTime', totalTime)
         r.gauge('workListLength', len(self.workList))
+        for name, (length, age) in self.workList.stats().iteritems():
+            r.gauge('%sWorkListOldestAge' % name, age)
+        r.gauge('inFlightJobs', len(self.inFlight))
+        r.gauge('applyDataMapsDevices', self.workList.applyworklist.activeKeys())
+        r.gauge('applyDataMapsDelayed', self.workList.applyworklist.delayed())
+        for stage, elapsed in self.invalidationTimings.iteritems():
+            r.counter('%sInvalidationTime' % stage, int(elapsed * 1000))
         for name, value in self.counters.items():
             r.counter(name, value)
 
@@ -1055,9 +1443,30 @@ class ZenHub(ZCmdBase):
         self.parser.add_option('--workers-reserved-for-events', dest='workersReservedForEvents',
             type='int', default=1,
             help="Number of worker instances to reserve for handling events")
+        self.parser.add_option('--workers-reserved-for-adm', dest='workersReservedForApplyDataMaps',
+            type='int', default=1,
+            help="Number of worker instances to reserve for applyDataMaps calls "
+                 "(default: %default)")
+        self.parser.add_option('--adm-conflict-retries', dest='adm_conflict_retries',
+            type='int', default=5,
+            help="Number of times an applyDataMaps call that failed with a ZODB "
+                 "conflict is queued again, with a back-off that doubles each time. "
+                 "0 leaves retrying to the workers (default: %default)")
+        self.parser.add_option('--adm-retry-backoff', dest='adm_retry_backoff',
+            type='float', default=1.0,
+            help="Seconds to wait before the first retry of a conflicting "
+                 "applyDataMaps call (default: %default)")
         self.parser.add_option('--worker-call-limit', dest='worker_call_limit',
             type='int', default=200,
             help="Maximum number of remote calls a worker can run before restarting")
+        self.parser.add_option('--worker-compress-threshold', dest='worker_compress_threshold',
+            type='int', default=0,
+            help="Size in bytes above which workers compress pickled results; "
+                 "0 disables compression (default: %default)")
+        self.parser.add_option('--invalidation-coalesce-window',
+            dest='invalidation_coalesce_window', type='int', default=30,
+            help="Longest time in seconds that invalidations are collected "
+                 "before device configurations are pushed (default: %default)")
         self.parser.add_option('--invalidation-poll-interval', 
             type='int', default=30,
             help="Interval at which to poll invalidations (default: %default)")
@@ -13,6 +13,7 @@ from Products.DataCollector.Plugins import loadPlugins
 from Products.ZenHub import PB_PORT
 from Products.ZenHub.zenhub import LastCallReturnValue
 from Products.ZenHub.PBDaemon import translateError, RemoteConflictError
+from Products.ZenHub.chunking import pickleToChunks, unpickleChunks
 from Products.ZenUtils.Time import isoDateTime
 from Products.ZenUtils.ZCmdBase import ZCmdBase
 from Products.ZenUtils.Utils import unused, zenPath
@@ -27,7 +28,6 @@ from twisted.internet import defer, reactor, error
 from ZODB.POSException import ConflictError
 from collections import defaultdict
 
-import cPickle as pickle
 import time
 import signal
 import os
@@ -185,8 +185,7 @@ class zenhubworker(ZCmdBase, pb.Referenceable):
         service = self._getService(service, instance)
         m = getattr(service, 'remote_' + method)
         # now that the service is loaded, we can unpack the arguments
-        joinedArgs = "".join(args)
-        args, kw = pickle.loads(joinedArgs)
+        args, kw = unpickleChunks(args)
 
         # see if this is our last call
         self.numCalls += 1
@@ -196,15 +195,12 @@ class zenhubworker(ZCmdBase, pb.Referenceable):
             res = m(*args, **kw)
             if lastCall:
                 res = LastCallReturnValue(res)
-            pickled_res = pickle.dumps(res, pickle.HIGHEST_PROTOCOL)
-            chunkedres=[]
-            chunkSize = 102400
-            while pickled_res:
-                chunkedres.append(pickled_res[:chunkSize])
-                pickled_res = pickled_res[chunkSize:]
-            return chunkedres
+            return pickleToChunks(
+                res, compressThreshold=self.options.compressthreshold)
+        # conflicts of some methods are retried by zenhub, with a back-off
+        retries = 0 if method in self.options.hubretrymethods.split(',') else 4
         try:
-            for i in range(4):
+            for i in range(retries):
                 try:
                     yield self.async_syncdb()
                     result = runOnce()
@@ -263,6 +259,18 @@ class zenhubworker(ZCmdBase, pb.Referenceable):
                                type='int',
                                help="Maximum number of remote calls before restarting worker",
                                default=200)
+        self.parser.add_option('--compressthreshold',
+                               dest='compressthreshold',
+                               type='int',
+                               help="Size in bytes above which pickled results are "
+                                    "compressed, 0 disables compression",
+                               default=0)
+        self.parser.add_option('--hubretrymethods',
+                               dest='hubretrymethods',
+                               help="Comma separated methods whose ZODB conflicts are "
+                                    "returned to ZenHub to retry instead of being "
+                                    "retried at once",
+                               default='')
 
 if __name__ == '__main__':
     zhw = zenhubworker()
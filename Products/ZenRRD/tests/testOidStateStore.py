@@ -0,0 +1,62 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import shutil
+import tempfile
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenRRD.zenperfsnmp import OidStateStore
+
+
+class SnmpConnInfo(object):
+    zSnmpVer = 'v2c'
+
+
+class DeviceProxy(object):
+    def __init__(self, oids):
+        self.snmpConnInfo = SnmpConnInfo()
+        self.oids = dict((oid, []) for oid in oids)
+
+
+class TestOidStateStore(BaseTestCase):
+
+    def afterSetUp(self):
+        super(TestOidStateStore, self).afterSetUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = OidStateStore(self.tmpdir)
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(TestOidStateStore, self).beforeTearDown()
+
+    def testSaveAndLoad(self):
+        version = OidStateStore.configVersion(DeviceProxy(['1.1', '1.2', '1.3']))
+        self.store.save('dev1', version, set(['1.1', '1.2']), set(['1.3']))
+        store = OidStateStore(self.tmpdir)
+        self.assertEqual((set(['1.1', '1.2']), set(['1.3'])),
+                         store.load('dev1', version))
+        self.assertIsNone(store.load('dev2', version))
+
+    def testChangedConfigExpiresState(self):
+        device = DeviceProxy(['1.1', '1.2'])
+        version = OidStateStore.configVersion(device)
+        self.store.save('dev1', version, set(['1.1']), set(['1.2']))
+        self.assertEqual(version, OidStateStore.configVersion(DeviceProxy(['1.2', '1.1'])))
+        changed = OidStateStore.configVersion(DeviceProxy(['1.1', '1.2', '1.4']))
+        self.assertNotEqual(version, changed)
+        self.assertIsNone(self.store.load('dev1', changed))
+        device.snmpConnInfo.zSnmpVer = 'v3'
+        self.assertNotEqual(version, OidStateStore.configVersion(device))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(TestOidStateStore))
+    return suite
@@ -0,0 +1,331 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import shutil
+import tempfile
+from datetime import datetime
+
+import zope.component
+from twisted.internet import defer, error
+
+from Products.ZenCollector.interfaces import ICollectorPreferences
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenRRD import zenperfsnmp
+from Products.ZenRRD.zenperfsnmp import SnmpPerformanceCollectionTask, \
+    OidStateStore, COLLECTOR_NAME, BULK_MAX_ROWS_PER_OID
+
+
+class Options(object):
+    triesPerCycle = 2
+    maxTimeouts = 3
+    maxInFlight = 4
+    bulkMinRows = 0
+    monitor = 'testmonitor'
+
+
+class Preferences(object):
+    zope.interface.implements(ICollectorPreferences)
+
+    def __init__(self):
+        self.options = Options()
+
+
+class SnmpProtocol(object):
+
+    def port(self):
+        return None
+
+
+class SnmpConnInfo(object):
+    manageIp = '10.0.0.1'
+    zSnmpVer = 'v2c'
+    zSnmpTimeout = 1
+    zSnmpTries = 1
+
+
+class DeviceProxy(object):
+    id = 'snmpdevice'
+    zMaxOIDPerRequest = 2
+    cycleInterval = 300
+
+    def __init__(self, oids, tableColumns=None):
+        self.snmpConnInfo = SnmpConnInfo()
+        self.oids = dict((oid, [('component', 'metric', 'GAUGE', '', None, None,
+                                 {'contextKey': 'component'})])
+                         for oid in oids)
+        self.tableColumns = tableColumns or {}
+
+
+class DataService(object):
+
+    def __init__(self):
+        self.written = []
+
+    def writeMetricWithMetadata(self, metric, value, rrdType, min=None,
+                                max=None, metadata=None):
+        self.written.append((metadata['contextKey'], value))
+
+
+class EventService(object):
+
+    def sendEvent(self, event, **kwargs):
+        pass
+
+
+class SnmpProxy(object):
+    """
+    Answers GET requests only when answer() is called, so several requests
+    can be in flight.
+    """
+
+    def __init__(self, values, timeouts=()):
+        self.values = values
+        self.timeouts = set(timeouts)
+        self.pending = []
+        self.requests = []
+        self.peak = 0
+
+    def get(self, oids, timeout, retryCount):
+        d = defer.Deferred()
+        self.requests.append(list(oids))
+        self.pending.append((oids, d))
+        self.peak = max(self.peak, len(self.pending))
+        return d
+
+    def answer(self):
+        while self.pending:
+            oids, d = self.pending.pop(0)
+            if self.timeouts.intersection(oids):
+                self.timeouts.difference_update(oids)
+                d.errback(error.TimeoutError())
+            elif all(oid in self.values for oid in oids):
+                d.callback(dict(('.' + oid, self.values[oid]) for oid in oids))
+            else:
+                # agents answer requests with a bad oid with no values
+                d.callback({})
+
+
+class WalkingSnmpProxy(SnmpProxy):
+    """
+    Also answers GETBULK requests from the rows of an agent, which may have
+    rows that are not monitored.
+    """
+
+    def __init__(self, values, rows=None, failure=None):
+        super(WalkingSnmpProxy, self).__init__(values)
+        self.rows = dict(values)
+        self.rows.update(rows or {})
+        self.failure = failure
+        self.walks = []
+
+    def getbulk(self, nonrepeaters, maxRepetitions, oids):
+        self.walks.append(list(oids))
+        if self.failure is not None:
+            return defer.fail(self.failure)
+        ordered = sorted(self.rows, key=zenperfsnmp._oidKey)
+        result = {}
+        for start in oids:
+            after = [oid for oid in ordered
+                     if zenperfsnmp._oidKey(oid) > zenperfsnmp._oidKey(start)]
+            for oid in after[:maxRepetitions]:
+                result['.' + oid] = self.rows[oid]
+        return defer.succeed(result)
+
+
+class SnmpPerformanceCollectionTaskTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(SnmpPerformanceCollectionTaskTest, self).afterSetUp()
+        self.tmpdir = tempfile.mkdtemp()
+        zenperfsnmp._oidStateStores[Options.monitor] = OidStateStore(self.tmpdir)
+        self.preferences = Preferences()
+        zope.component.provideUtility(self.preferences, ICollectorPreferences,
+                                      COLLECTOR_NAME)
+        self._snmpprotocol = zenperfsnmp.snmpprotocol
+        zenperfsnmp.snmpprotocol = SnmpProtocol()
+
+    def beforeTearDown(self):
+        zenperfsnmp.snmpprotocol = self._snmpprotocol
+        zope.component.getGlobalSiteManager().unregisterUtility(
+            self.preferences, ICollectorPreferences, COLLECTOR_NAME)
+        zenperfsnmp._oidStateStores.pop(Options.monitor, None)
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+        super(SnmpPerformanceCollectionTaskTest, self).beforeTearDown()
+
+    def makeTask(self, proxy, oids, **kwargs):
+        task = SnmpPerformanceCollectionTask('snmpdevice', 'snmpdevice', 300,
+                                             DeviceProxy(oids, **kwargs))
+        task._dataService = DataService()
+        task._eventService = EventService()
+        task._snmpProxy = proxy
+        task._doTask_start = datetime.now()
+        return task
+
+    def fetch(self, task, proxy):
+        results = []
+        task._fetchPerf().addBoth(results.append)
+        proxy.answer()
+        self.assertEquals([None], results)
+
+    def testWindowGrowsOnSuccess(self):
+        oids = ['1.%d' % i for i in range(20)]
+        proxy = SnmpProxy(dict((oid, 1) for oid in oids))
+        task = self.makeTask(proxy, oids)
+        self.assertEquals(1.0, task._window)
+        self.fetch(task, proxy)
+        self.assertEquals(set(oids), task._collectedOids)
+        self.assertEquals(10, len(proxy.requests))
+        self.assertTrue(task._window > 2.0)
+        self.assertTrue(1 < proxy.peak <= task._maxInFlight)
+        self.assertEquals(proxy.peak, task._peakInFlight)
+        self.assertEquals(0, task._inFlight)
+
+        task._window = 3.9
+        task._chunkSucceeded()
+        self.assertEquals(4, task._window)
+
+    def testWindowIsHalvedOnTimeout(self):
+        oids = ['1.%d' % i for i in range(8)]
+        proxy = SnmpProxy(dict((oid, 1) for oid in oids), timeouts=['1.0'])
+        task = self.makeTask(proxy, oids)
+        task._window = 4.0
+        results = []
+        task._fetchPerfChunks([['1.0', '1.1'], ['1.2', '1.3']], 2).addBoth(results.append)
+        self.assertEquals(2, len(proxy.pending))
+        proxy.answer()
+        # the timeout halved the window, the success grew it again
+        self.assertEquals([0], results)
+        self.assertEquals(2.5, task._window)
+        self.assertEquals(1, task._timeoutCount)
+
+        task._window = 1.5
+        task._chunkTimedOut()
+        self.assertEquals(1.0, task._window)
+
+    def testConsecutiveTimeoutsAbandonTheRun(self):
+        oids = ['1.%d' % i for i in range(8)]
+        proxy = SnmpProxy({}, timeouts=oids)
+        task = self.makeTask(proxy, oids)
+        task._window = 4.0
+        results = []
+        task._fetchPerf().addBoth(results.append)
+        proxy.answer()
+        self.assertTrue(results[0].check(error.TimeoutError))
+        # no more requests were sent after the third timeout
+        self.assertEquals(4, len(proxy.requests))
+        self.assertEquals(0, task._inFlight)
+
+    def testBadOidIsIsolatedWithConcurrentRequests(self):
+        good = ['1.%d' % i for i in range(7)]
+        proxy = SnmpProxy(dict((oid, 1) for oid in good))
+        task = self.makeTask(proxy, good + ['9.9'])
+        task._window = 4.0
+        self.fetch(task, proxy)
+        self.assertTrue(proxy.peak > 1)
+        self.assertEquals(set(good), task._collectedOids)
+        self.assertEquals(set(good), task._good_oids)
+        self.assertEquals(set(['9.9']), task._bad_oids)
+        self.assertIn(['9.9'], proxy.requests)
+        self.assertEquals(7, len(task._dataService.written))
+
+    def testDisplayStatistics(self):
+        oids = ['1.%d' % i for i in range(8)]
+        proxy = SnmpProxy(dict((oid, 1) for oid in oids), timeouts=['1.0'])
+        task = self.makeTask(proxy, oids)
+        task._window = 4.0
+        self.fetch(task, proxy)
+        stats = task.displayStatistics()
+        self.assertIn("Requests in flight: 0; Window: %.1f of 4; Peak: %d; Timeouts: 1"
+                      % (task._window, task._peakInFlight), stats)
+
+    def makeTableTask(self, proxy, columns):
+        oids = [oid for columnOids in columns.itervalues() for oid in columnOids]
+        task = self.makeTask(proxy, oids, tableColumns=columns)
+        task._bulkMinRows = 2
+        return task
+
+    def testWalkRowsAreMappedToOids(self):
+        columns = {'1.2.10': ['1.2.10.5', '1.2.10.7', '1.2.10.12']}
+        values = {'1.2.10.5': 5, '1.2.10.7': 7, '1.2.10.12': 12}
+        rows = dict(('1.2.10.%d' % i, 0) for i in range(1, 20) if i not in (5, 7, 12))
+        rows['1.2.11.1'] = 0
+        proxy = WalkingSnmpProxy(values, rows)
+        task = self.makeTableTask(proxy, columns)
+        self.fetch(task, proxy)
+        self.assertEquals(set(values), task._collectedOids)
+        self.assertEquals([5, 7, 12], sorted(value for key, value in task._dataService.written))
+        self.assertEquals([], proxy.requests)
+        # the walk starts just below the lowest monitored row and stops
+        # after the highest one
+        self.assertEquals(['.1.2.10.4'], proxy.walks[0])
+        self.assertEquals(['.1.2.10.6'], proxy.walks[1])
+        self.assertEquals(4, len(proxy.walks))
+        self.assertEquals(set(), task._getOnlyColumns)
+        self.assertFalse(task._bulkDisabled)
+
+    def testPrecedingOid(self):
+        self.assertEquals('1.2.10.4', zenperfsnmp._precedingOid('1.2.10.5'))
+        self.assertEquals('1.2.10.5', zenperfsnmp._precedingOid('1.2.10.5.0'))
+
+    def testSparseColumnIsCollectedWithGets(self):
+        columns = {'1.2.10': ['1.2.10.1', '1.2.10.100']}
+        values = {'1.2.10.1': 1, '1.2.10.100': 100}
+        rows = dict(('1.2.10.%d' % i, 0) for i in range(2, 100))
+        proxy = WalkingSnmpProxy(values, rows)
+        task = self.makeTableTask(proxy, columns)
+        self.fetch(task, proxy)
+        # the walk read no more than its row budget
+        self.assertTrue(len(proxy.walks) <= 2 * BULK_MAX_ROWS_PER_OID)
+        self.assertEquals(set(['1.2.10']), task._getOnlyColumns)
+        self.assertEquals(set(values), task._collectedOids)
+        self.assertEquals([['1.2.10.100']], proxy.requests)
+        self.assertEquals([], task._bulkColumns())
+
+    def testMissingColumnIsCollectedWithGets(self):
+        columns = {'1.2.10': ['1.2.10.1', '1.2.10.2'],
+                   '1.2.20': ['1.2.20.1', '1.2.20.2']}
+        values = {'1.2.10.1': 1, '1.2.10.2': 2}
+        proxy = WalkingSnmpProxy(values, {'1.2.30.1': 0})
+        task = self.makeTableTask(proxy, columns)
+        self.fetch(task, proxy)
+        self.assertEquals(set(['1.2.20']), task._getOnlyColumns)
+        # only the oids of the missing column are requested, and isolated
+        self.assertEquals(['1.2.20.1', '1.2.20.2'], proxy.requests[0])
+        self.assertEquals(set(['1.2.20.1', '1.2.20.2']), task._bad_oids)
+        self.assertEquals(set(values), task._collectedOids)
+        self.assertFalse(task._bulkDisabled)
+
+    def testFailedWalkFallsBackToGets(self):
+        columns = {'1.2.10': ['1.2.10.1', '1.2.10.2']}
+        values = {'1.2.10.1': 1, '1.2.10.2': 2}
+        for failure in (Exception('bad response'), error.TimeoutError()):
+            proxy = WalkingSnmpProxy(values, failure=failure)
+            task = self.makeTableTask(proxy, columns)
+            self.fetch(task, proxy)
+            self.assertTrue(task._bulkDisabled)
+            self.assertEquals(set(values), task._collectedOids)
+            self.assertEquals([['1.2.10.1', '1.2.10.2']], proxy.requests)
+            self.assertEquals([], task._bulkColumns())
+
+    def testEmptyWalkDisablesBulk(self):
+        columns = {'1.2.10': ['1.2.10.1', '1.2.10.2']}
+        values = {'1.2.10.1': 1, '1.2.10.2': 2}
+        proxy = WalkingSnmpProxy(values)
+        proxy.rows = {}
+        task = self.makeTableTask(proxy, columns)
+        self.fetch(task, proxy)
+        self.assertTrue(task._bulkDisabled)
+        self.assertEquals(set(values), task._collectedOids)
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(SnmpPerformanceCollectionTaskTest))
+    return suite
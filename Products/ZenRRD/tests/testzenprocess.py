@@ -875,7 +875,77 @@ class TestZenprocess(BaseTestCase):
         
         self.assertEqual(result, expected)
 
-    
+    def testMatchesAreCachedPerPid(self):
+        procDefs = {}
+        self.updateProcDefs(procDefs, 'url_myapp', 'myapp', 'nothing')
+        task = self.makeTask(procDefs)
+        stats = task._deviceStats
+        calls = []
+        pStats = stats._processes['url_myapp']
+        matches = pStats.matches
+        pStats.matches = lambda name: calls.append(name) or matches(name)
+
+        self.assertIs(pStats, stats.match(1, 'myapp -v'))
+        self.assertIs(pStats, stats.match(1, 'myapp -v'))
+        self.assertEqual(1, len(calls))
+        # a pid reused by another process is matched again
+        self.assertIsNone(stats.match(1, 'otherapp'))
+        self.assertEqual(2, len(calls))
+
+        # changed process classes invalidate the cache
+        self.updateProcDefs(procDefs, 'url_myapp', 'other', 'nothing')
+        stats.update(TaskConfig(procDefs=procDefs))
+        self.assertIsNotNone(stats.match(1, 'otherapp'))
+
+    def testIncrementalScan(self):
+        from twisted.internet import defer
+        from Products.ZenRRD.zenprocess import NAMETABLE, PATHTABLE, ARGSTABLE
+        task = self.makeTask({})
+        task._preferences.options.fullScanCycles = 3
+        walked = []
+        fetched = []
+        device = {NAMETABLE: {NAMETABLE + '.1': 'init'},
+                  PATHTABLE: {PATHTABLE + '.1': '/sbin/init'},
+                  ARGSTABLE: {ARGSTABLE + '.1': ''}}
+
+        def getTables(oids):
+            walked.append(oids)
+            return defer.succeed(dict((oid, dict(device[oid])) for oid in oids))
+
+        def get(oids):
+            fetched.append(oids)
+            values = {}
+            for oid in oids:
+                table = oid.rsplit('.', 1)[0]
+                if oid in device[table]:
+                    values[oid] = device[table][oid]
+            return defer.succeed(values)
+
+        task._getTables = getTables
+        task._get = get
+
+        def scan():
+            results = []
+            task._scanProcessTables().addCallback(results.append)
+            return mapResultsToDicts(False, results[0])
+
+        self.assertEqual([(1, '/sbin/init')], scan())
+        self.assertEqual([[NAMETABLE, PATHTABLE, ARGSTABLE]], walked)
+
+        device[NAMETABLE][NAMETABLE + '.2'] = 'myapp'
+        device[PATHTABLE][PATHTABLE + '.2'] = '/usr/bin/myapp'
+        device[ARGSTABLE][ARGSTABLE + '.2'] = '-v'
+        self.assertEqual([(1, '/sbin/init'), (2, '/usr/bin/myapp -v')],
+                         sorted(scan()))
+        self.assertEqual([NAMETABLE], walked[-1])
+        self.assertEqual([[PATHTABLE + '.2'], [ARGSTABLE + '.2']], fetched)
+
+        # unchanged pids are not fetched again
+        scan()
+        self.assertEqual(2, len(fetched))
+        # every third scan walks all tables again
+        scan()
+        self.assertEqual([NAMETABLE, PATHTABLE, ARGSTABLE], walked[-1])
 
 
 
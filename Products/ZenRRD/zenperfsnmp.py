@@ -17,6 +17,7 @@ Gets SNMP performance data and stores it in RRD files.
 
 from datetime import datetime, timedelta
 from collections import deque
+from hashlib import md5
 import random
 import logging
 log = logging.getLogger("zen.zenperfsnmp")
@@ -45,7 +46,8 @@ from Products.ZenEvents import Event
 # We retrieve our configuration data remotely via a Twisted PerspectiveBroker
 # connection. To do so, we need to import the class that will be used by the
 # configuration service to send the data over, i.e. SnmpDeviceProxy.
-from Products.ZenUtils.Utils import unused
+from Products.ZenUtils.Utils import unused, zenPath
+from Products.ZenUtils.FileCache import FileCache
 from Products.ZenHub.services.SnmpPerformanceConfig import SnmpDeviceProxy
 unused(SnmpDeviceProxy)
 from Products.ZenHub.services.PerformanceConfig import SnmpConnInfo
@@ -53,6 +55,26 @@ unused(SnmpConnInfo)
 
 COLLECTOR_NAME = "zenperfsnmp"
 MAX_BACK_OFF_MINUTES = 20
+# a column walk may return this many rows per monitored row before the
+# column is collected with GETs instead
+BULK_MAX_ROWS_PER_OID = 4
+
+
+def _oidKey(oid):
+    return tuple(int(part) for part in oid.strip('.').split('.'))
+
+
+def _precedingOid(oid):
+    """
+    Return an oid that sorts just before oid, so that a GETNEXT or GETBULK
+    starting there returns oid first if the agent has it.
+    """
+    parts = list(_oidKey(oid))
+    if parts[-1] > 0:
+        parts[-1] -= 1
+    else:
+        parts.pop()
+    return '.'.join(str(part) for part in parts)
 
 
 class SnmpPerformanceCollectionPreferences(object):
@@ -100,11 +122,83 @@ class SnmpPerformanceCollectionPreferences(object):
                           type='int',
                           help="How many consecutive time outs per cycle before stopping attempts to collect")
 
+        parser.add_option('--maxinflight',
+                          dest='maxInFlight',
+                          default=4,
+                          type='int',
+                          help="Maximum number of concurrent SNMP GET requests per device. The number "\
+                                "grows towards this limit while a device answers and is halved when it "\
+                                "times out. 1 sends one request at a time (default: %default)")
+
+        parser.add_option('--bulkminrows',
+                          dest='bulkMinRows',
+                          default=0,
+                          type='int',
+                          help="Walk table columns with GETBULK instead of sending a GET for each "\
+                                "component when at least this many rows of a column are monitored. "\
+                                "Not used for SNMP v1 agents. 0 disables table collection (default: %default)")
+
 
     def postStartup(self):
         pass
 
 
+class OidStateStore(object):
+    """
+    Saves which OIDs of a device returned data (good) and which did not
+    (bad), so that a restarted collector does not have to find the bad OIDs
+    again one request at a time. The state of a device is only used while
+    its OID configuration is unchanged.
+    """
+
+    def __init__(self, path):
+        self._cache = FileCache(path)
+
+    @staticmethod
+    def configVersion(device):
+        """
+        Return a fingerprint of the parts of a device config that decide
+        whether an OID is good or bad.
+        """
+        m = md5(device.snmpConnInfo.zSnmpVer or '')
+        for oid in sorted(device.oids):
+            m.update('|' + oid)
+        return m.hexdigest()
+
+    def load(self, deviceId, version):
+        """
+        Return (good oids, bad oids) saved for the device with this config
+        version, or None.
+        """
+        try:
+            state = self._cache.get(deviceId, None)
+        except Exception as e:
+            log.warn("Unable to read OID state of %s: %s", deviceId, e)
+            return None
+        if state is None or state[0] != version:
+            return None
+        return set(state[1]), set(state[2])
+
+    def save(self, deviceId, version, good, bad):
+        try:
+            self._cache[deviceId] = (version, sorted(good), sorted(bad))
+        except Exception as e:
+            log.warn("Unable to save OID state of %s: %s", deviceId, e)
+
+
+_oidStateStores = {}
+
+def getOidStateStore(monitor):
+    """
+    Return the OidStateStore of a collector.
+    """
+    store = _oidStateStores.get(monitor)
+    if store is None:
+        store = _oidStateStores[monitor] = OidStateStore(
+            zenPath('var', COLLECTOR_NAME, monitor, 'oidstate'))
+    return store
+
+
 class CycleExceeded(Exception):
     pass
 
@@ -175,6 +269,18 @@ class SnmpPerformanceCollectionTask(BaseTask):
         self._snmpPort = snmpprotocol.port()
         self.triesPerCycle = max(2, self._preferences.options.triesPerCycle)
         self._maxTimeouts = self._preferences.options.maxTimeouts
+        self._maxInFlight = max(1, getattr(self._preferences.options, 'maxInFlight', 1))
+        # congestion window: the number of requests allowed in flight
+        self._window = 1.0
+        self._inFlight = 0
+        self._peakInFlight = 0
+        self._timeoutCount = 0
+        # table column -> configured oids, collected with GETBULK walks
+        self._tableColumns = getattr(self._device, 'tableColumns', None) or {}
+        self._bulkMinRows = getattr(self._preferences.options, 'bulkMinRows', 0)
+        self._bulkDisabled = self._snmpConnInfo.zSnmpVer == 'v1'
+        # columns whose walks returned too little of what we monitor
+        self._getOnlyColumns = set()
 
         self._lastErrorMsg = ''
         self._cycleExceededCount = 0
@@ -184,6 +290,27 @@ class SnmpPerformanceCollectionTask(BaseTask):
         #whether or not we got a response during a collection interval
         self._responseReceived = False
 
+        self._loadOidState()
+
+    def _loadOidState(self):
+        monitor = getattr(self._preferences.options, 'monitor', None) or 'localhost'
+        self._oidStateStore = getOidStateStore(monitor)
+        self._oidStateVersion = OidStateStore.configVersion(self._device)
+        state = self._oidStateStore.load(self._devId, self._oidStateVersion)
+        if state:
+            good, bad = state
+            self._good_oids = good.intersection(self._oids)
+            self._bad_oids = bad.intersection(self._oids) - self._good_oids
+            log.debug("%s loaded %d good and %d bad oids", self._devId,
+                      len(self._good_oids), len(self._bad_oids))
+        self._savedOidState = (frozenset(self._good_oids), frozenset(self._bad_oids))
+
+    def _saveOidState(self):
+        state = (frozenset(self._good_oids), frozenset(self._bad_oids))
+        if state != self._savedOidState:
+            self._oidStateStore.save(self._devId, self._oidStateVersion, *state)
+            self._savedOidState = state
+
     def _failure(self, reason):
         """
         Twisted errBack to log the exception for a single device.
@@ -240,10 +367,16 @@ class SnmpPerformanceCollectionTask(BaseTask):
         if not self._oids:
             defer.returnValue(None)
 
+        columns = self._bulkColumns()
+        if columns:
+            yield self._fetchPerfTables(columns)
+
         # do known untested and good oids in chunks
         # first run all oids will be unkown since they aren't in the good oid list or the bad oid list
         oids_to_test = list(self._untestedOids())
         oids_to_test.extend(self._good_oids)
+        if self._collectedOids:
+            oids_to_test = [oid for oid in oids_to_test if oid not in self._collectedOids]
         log.debug('%s [%s] collecting %s oids out of %s', self._devId, self._manageIp, len(oids_to_test), len(self._oids))
         chunk_size = self._maxOidsPerRequest
         maxTries = self.triesPerCycle
@@ -255,30 +388,191 @@ class SnmpPerformanceCollectionTask(BaseTask):
                 log.debug("%s [%s] some oids still uncollected after %s tries, trying again with chunk size %s", self._devId,
                           self._manageIp, try_count - 1, chunk_size)
             oid_chunks = self.chunk(oids_to_test, chunk_size)
-            for oid_chunk in oid_chunks:
+            consecutiveTimeouts = yield self._fetchPerfChunks(oid_chunks, chunk_size, consecutiveTimeouts)
+            # can still have untested oids from a chunk that failed to return data, one or more of those may be bad.
+            # run with a smaller chunk size to identify bad oid. Can also have uncollected good oids because of timeouts
+            oids_to_test = list(self._uncollectedOids())
+            chunk_size = 1
+    
+
+
+    def _bulkColumns(self):
+        """
+        Return the table columns to walk with GETBULK this cycle.
+        """
+        if self._bulkDisabled or self._bulkMinRows <= 0:
+            return []
+        return sorted(column for column, oids in self._tableColumns.iteritems()
+                      if len(oids) >= self._bulkMinRows and column not in self._getOnlyColumns)
+
+    @defer.inlineCallbacks
+    def _walkColumns(self, columns):
+        """
+        Walk the monitored rows of table columns with GETBULK requests. Each
+        column is walked from just below its lowest monitored row up to its
+        highest one, reading at most BULK_MAX_ROWS_PER_OID rows for each
+        monitored row.
+
+        @return: column -> {oid: value} of the rows walked
+        """
+        walks = {}
+        for column in columns:
+            keys = sorted(_oidKey(oid) for oid in self._tableColumns[column])
+            first = '.'.join(str(part) for part in keys[0])
+            walks[column] = [_precedingOid(first), keys[-1],
+                             len(keys) * BULK_MAX_ROWS_PER_OID]
+        rows = dict((column, {}) for column in columns)
+        active = list(columns)
+        while active:
+            self._checkTaskTime()
+            result = yield self._snmpProxy.getbulk(
+                0, max(1, self._maxOidsPerRequest / len(active)),
+                ['.' + walks[column][0] for column in active])
+            returned = sorted((_oidKey(oid), oid.strip('.'), value)
+                              for oid, value in (result or {}).iteritems())
+            for column in list(active):
+                start, last, budget = walks[column]
+                prefix, startKey = _oidKey(column), _oidKey(start)
+                walked = [row for row in returned
+                          if row[0][:len(prefix)] == prefix and row[0] > startKey]
+                new = [row for row in walked if row[0] <= last][:budget]
+                for key, oid, value in new:
+                    rows[column][oid] = value
+                budget -= len(new)
+                # stop at the end of the column, past the highest monitored
+                # row or when the column returns too many rows
+                if not new or len(walked) > len(new) or new[-1][0] == last or budget <= 0:
+                    active.remove(column)
+                else:
+                    walks[column] = [new[-1][1], last, budget]
+        defer.returnValue(rows)
+
+    @defer.inlineCallbacks
+    def _fetchPerfTables(self, columns):
+        """
+        Walk table columns with GETBULK and store the values of the
+        configured oids found in them. Oids not found are left for the GET
+        requests that follow. If the agent fails to answer the walks,
+        GETBULK is not used for the device again.
+        """
+        batchSize = max(1, self._maxOidsPerRequest)
+        for i in xrange(0, len(columns), batchSize):
+            self._checkTaskTime()
+            batch = columns[i:i + batchSize]
+            log.debug("Walking %s columns on %s [%s] - %s", len(batch), self._devId, self._manageIp, batch)
+            self.state = SnmpPerformanceCollectionTask.STATE_FETCH_PERF
+            try:
+                rows = yield self._walkColumns(batch)
+            except (StopTask, CycleExceeded):
+                raise
+            except Exception as e:
+                if isinstance(e, (error.TimeoutError, SnmpTimeoutError)):
+                    self._chunkTimedOut()
+                log.info("%s [%s] table walk failed, collecting with GET requests only: %s",
+                         self._devId, self._manageIp, e.__class__.__name__)
+                self._bulkDisabled = True
+                return
+            finally:
+                self.state = TaskStates.STATE_RUNNING
+
+            if not any(rows.itervalues()):
+                log.info("%s [%s] table walk returned no rows, collecting with GET requests only",
+                         self._devId, self._manageIp)
+                self._bulkDisabled = True
+                return
+            self._responseReceived = True
+
+            update = {}
+            for column in batch:
+                values = rows.get(column) or {}
+                configured = self._tableColumns[column]
+                found = 0
+                for oid, value in values.iteritems():
+                    oid = oid.strip('.')
+                    if oid in self._oids:
+                        update[oid] = value
+                        found += 1
+                if not found or len(values) > found * BULK_MAX_ROWS_PER_OID:
+                    log.debug("%s [%s] walk of %s returned %s of %s monitored rows in %s, using GET requests",
+                              self._devId, self._manageIp, column, found, len(configured), len(values))
+                    self._getOnlyColumns.add(column)
+            yield self._storeValues(update)
+
+    def _chunkSucceeded(self):
+        # additive increase: about one more request per window of successes
+        self._window = min(self._maxInFlight, self._window + 1.0 / self._window)
+
+    def _chunkTimedOut(self):
+        # multiplicative decrease
+        self._timeoutCount += 1
+        self._window = max(1.0, self._window / 2)
+
+    @defer.inlineCallbacks
+    def _fetchPerfChunks(self, oid_chunks, chunk_size, consecutiveTimeouts=0):
+        """
+        Fetch the chunks with up to int(self._window) GET requests in flight.
+        Once a chunk fails in a way that ends the collection, no more
+        requests are sent; the error is raised when the requests in flight
+        have finished.
+
+        @return: the number of consecutive timeouts at the end
+        """
+        pending = deque(oid_chunks)
+        completed = []
+        waiter = []
+        abort = None
+
+        def chunkDone(result, oid_chunk):
+            self._inFlight -= 1
+            completed.append((oid_chunk, result))
+            if waiter:
+                waiter.pop().callback(None)
+
+        inFlight = 0
+        while pending or inFlight:
+            while pending and abort is None and inFlight < int(self._window):
                 try:
                     self._checkTaskTime()
-                    log.debug("Fetching OID chunk size %s from %s [%s] - %s", chunk_size, self._devId, self._manageIp, oid_chunk)
-                    yield self._fetchPerfChunk(oid_chunk)
+                except (StopTask, CycleExceeded):
+                    abort = Failure()
+                    break
+                oid_chunk = pending.popleft()
+                log.debug("Fetching OID chunk size %s from %s [%s] - %s", chunk_size, self._devId, self._manageIp, oid_chunk)
+                inFlight += 1
+                self._inFlight += 1
+                self._peakInFlight = max(self._peakInFlight, self._inFlight)
+                self._fetchPerfChunk(oid_chunk).addBoth(chunkDone, oid_chunk)
+            if not inFlight:
+                break
+            if not completed:
+                d = defer.Deferred()
+                waiter.append(d)
+                yield d
+            while completed:
+                oid_chunk, result = completed.pop(0)
+                inFlight -= 1
+                if not isinstance(result, Failure):
                     consecutiveTimeouts = 0
+                    self._chunkSucceeded()
                     log.debug("Finished fetchPerfChunk call %s [%s]", self._devId, self._manageIp)
-                except error.TimeoutError as e:
+                elif result.check(error.TimeoutError):
                     log.debug("timeout for %s [%s] oids - %s", self._devId, self._manageIp, oid_chunk)
+                    self._chunkTimedOut()
                     consecutiveTimeouts += 1
-                    if consecutiveTimeouts >= self._maxTimeouts:
+                    if consecutiveTimeouts >= self._maxTimeouts and abort is None:
                         log.debug("%s consecutive timeouts, abandoning run for %s [%s]", consecutiveTimeouts,
                                   self._devId, self._manageIp)
-                        raise
-                except SnmpTimeoutError as e:
+                        abort = result
+                elif result.check(SnmpTimeoutError):
                     # only seem to get these for V3 and subsequent calls throw credential exceptions, so just bail here
                     log.debug("SnmpTimeoutError for %s [%s] oids - %s", self._devId, self._manageIp, oid_chunk)
-                    raise
-            # can still have untested oids from a chunk that failed to return data, one or more of those may be bad.
-            # run with a smaller chunk size to identify bad oid. Can also have uncollected good oids because of timeouts
-            oids_to_test = list(self._uncollectedOids())
-            chunk_size = 1
-    
-
+                    self._chunkTimedOut()
+                    abort = abort or result
+                else:
+                    abort = abort or result
+        if abort is not None:
+            abort.raiseException()
+        defer.returnValue(consecutiveTimeouts)
 
     @defer.inlineCallbacks
     def _fetchPerfChunk(self, oid_chunk):
@@ -320,38 +614,48 @@ class SnmpPerformanceCollectionTask(BaseTask):
                     log.error("SNMP get did not return result: {0} {1}".format(self.configId, oid))
                     self.remove_from_good_oids([oid])
                     self._addBadOids([oid])
-            self.state=SnmpPerformanceCollectionTask.STATE_STORE_PERF
-            try:
-                for oid, value in update.items():
+            yield self._storeValues(update)
 
-                    if oid not in self._oids:
-                        log.error("SNMP get returned unexpected OID: {0} {1}".format(self.configId, oid))
-                        continue
+    @defer.inlineCallbacks
+    def _storeValues(self, update):
+        """
+        Write the values of the collected oids.
 
-                    # We should always get something useful back
-                    if value == '' or value is None:
-                        if oid not in self._bad_oids:
-                            log.error("SNMP get returned empty value: {0} {1}".format(self.configId, oid))
-                            self._addBadOids([oid])
+        @parameter update: oid -> value, oids without leading or trailing dots
+        @type update: dictionary
+        """
+        self.state=SnmpPerformanceCollectionTask.STATE_STORE_PERF
+        try:
+            for oid, value in update.items():
+
+                if oid not in self._oids:
+                    log.error("SNMP get returned unexpected OID: {0} {1}".format(self.configId, oid))
+                    continue
+
+                # We should always get something useful back
+                if value == '' or value is None:
+                    if oid not in self._bad_oids:
+                        log.error("SNMP get returned empty value: {0} {1}".format(self.configId, oid))
+                        self._addBadOids([oid])
+                    continue
+
+                self._good_oids.add(oid)
+                self._bad_oids.discard(oid)
+                self._collectedOids.add(oid)
+                # An OID's data can be stored multiple times
+                for rrdMeta in self._oids[oid]:
+                    contextId, metric, rrdType, rrdCommand, rrdMin, rrdMax, metadata = rrdMeta
+                    path = metadata.get('contextKey')
+                    try:
+                        # see SnmpPerformanceConfig line _getComponentConfig
+                        yield self._dataService.writeMetricWithMetadata(metric,
+                                value, rrdType, min=rrdMin, max=rrdMax,
+                                metadata=metadata)
+                    except Exception, e:
+                        log.exception("Failed to write to metric service: {0} {1.__class__.__name__} {1}".format(path, e))
                         continue
-
-                    self._good_oids.add(oid)
-                    self._bad_oids.discard(oid)
-                    self._collectedOids.add(oid)
-                    # An OID's data can be stored multiple times
-                    for rrdMeta in self._oids[oid]:
-                        contextId, metric, rrdType, rrdCommand, rrdMin, rrdMax, metadata = rrdMeta
-                        path = metadata.get('contextKey')
-                        try:
-                            # see SnmpPerformanceConfig line _getComponentConfig
-                            yield self._dataService.writeMetricWithMetadata(metric,
-                                    value, rrdType, min=rrdMin, max=rrdMax,
-                                    metadata=metadata)
-                        except Exception, e:
-                            log.exception("Failed to write to metric service: {0} {1.__class__.__name__} {1}".format(path, e))
-                            continue
-            finally:
-                self.state = TaskStates.STATE_RUNNING
+        finally:
+            self.state = TaskStates.STATE_RUNNING
 
     @defer.inlineCallbacks
     def _processBadOids(self, previous_bad_oids):
@@ -499,6 +803,8 @@ class SnmpPerformanceCollectionTask(BaseTask):
             log.warn("Failed to close device %s: error %s" %
                      (self._devId, str(ex)))
 
+        self._saveOidState()
+
         doTask_end = datetime.now()
         duration = doTask_end - self._doTask_start
         if duration > timedelta(seconds=self._device.cycleInterval):
@@ -596,6 +902,13 @@ class SnmpPerformanceCollectionTask(BaseTask):
             self.name, len(self._good_oids), self._good_oids)
         display += "%s Bad OIDs: %d - %s\n" % (
             self.name, len(self._bad_oids), self._bad_oids)
+        display += "%s Requests in flight: %d; Window: %.1f of %d; Peak: %d; Timeouts: %d\n" % (
+            self.name, self._inFlight, self._window, self._maxInFlight,
+            self._peakInFlight, self._timeoutCount)
+        if self._tableColumns:
+            display += "%s Table columns: %d; Walked: %d; GET only: %d%s\n" % (
+                self.name, len(self._tableColumns), len(self._bulkColumns()),
+                len(self._getOnlyColumns), "; GETBULK disabled" if self._bulkDisabled else "")
 
         if self._lastErrorMsg:
             display += "%s\n" % self._lastErrorMsg
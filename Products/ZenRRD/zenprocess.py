@@ -126,6 +126,13 @@ class ZenProcessPreferences(object):
                           default='',
                           help="Directory and filename to use as a template"
                                " to store SNMP results from device.")
+        parser.add_option('--fullscancycles', dest='fullScanCycles',
+                          type='int', default=10,
+                          help="Walk the process path and arguments tables of"
+                               " a device every this many cycles; in between"
+                               " only the name table is walked and paths and"
+                               " arguments are fetched for new pids. 1 walks"
+                               " all tables every cycle. Default is %default.")
 
     def postStartup(self):
         pass
@@ -140,8 +147,28 @@ class DeviceStats:
         self._processes = {}
         for id, process in deviceProxy.processes.iteritems():
             self._processes[id] = ProcessStats(process)
+        # map pid number to its (name, path, args) table values
+        self._pidTables = {}
+        # number of scans since the last full process table walk
+        self.scansSinceFullScan = None
+        # map pid number to (name_with_args, matching ProcessStats or None)
+        self._pidMatches = {}
+        self._matchSignature = self._getMatchSignature()
+
+    def _getMatchSignature(self):
+        return sorted((id, p._config.name, p.includeRegex, p.excludeRegex,
+                       p.replaceRegex, p.replacement)
+                      for id, p in self._processes.iteritems())
 
     def update(self, deviceProxy):
+        self._update(deviceProxy)
+        signature = self._getMatchSignature()
+        if signature != self._matchSignature:
+            # process classes changed, every pid has to be matched again
+            self._pidMatches = {}
+            self._matchSignature = signature
+
+    def _update(self, deviceProxy):
         unused = set(self._processes)
         for id, process in deviceProxy.processes.iteritems():
             unused.discard(id)
@@ -178,6 +205,34 @@ class DeviceStats:
         """
         return self._pidToProcess.itervalues()
 
+    def match(self, pid, name_with_args):
+        """
+        Return the ProcessStats matching a process, or None. The result is
+        remembered per pid until the process name or arguments of the pid or
+        the configured process classes change.
+        """
+        cached = self._pidMatches.get(pid)
+        if cached is not None and cached[0] == name_with_args:
+            return cached[1]
+        match = None
+        for pStats in self._processes.itervalues():
+            if pStats._config.name is not None:
+                if pStats.matches(name_with_args):
+                    log.debug("Found process %s belonging to %s", name_with_args, pStats._config)
+                    match = pStats
+                    break
+        self._pidMatches[pid] = (name_with_args, match)
+        return match
+
+    def forgetPids(self, pids):
+        """
+        Drop cached data of every pid not in pids.
+        """
+        pids = set(pids)
+        for cache in (self._pidMatches, self._pidTables):
+            for pid in [p for p in cache if p not in pids]:
+                del cache[pid]
+
 
 class ProcessStats(OSProcessMatcher):
     def __init__(self, processProxy):
@@ -394,9 +449,8 @@ class ZenProcessTask(ObservableMixin):
         log.debug("Scanning for processes from %s [%s]", self._devId, self._manageIp)
 
         self.state = ZenProcessTask.STATE_SCANNING_PROCS
-        tables = [NAMETABLE, PATHTABLE, ARGSTABLE]
         try:
-            tableResult = yield self._getTables(tables)
+            tableResult = yield self._scanProcessTables()
             summary = 'Process table up for device %s' % self._devId
             self._clearSnmpError("%s - timeout cleared" % summary, 'table_scan_timeout')
             if self.snmpConnInfo.zSnmpVer == 'v3':
@@ -431,6 +485,61 @@ class ZenProcessTask(ObservableMixin):
             msg = '%s; error: %s' % (PROC_SCAN_ERROR % self._devId, e)
             self._sendSnmpError(msg)
 
+    def _isFullScanDue(self):
+        cycles = getattr(self._preferences.options, 'fullScanCycles', 1)
+        scans = self._deviceStats.scansSinceFullScan
+        return cycles <= 1 or scans is None or scans + 1 >= cycles
+
+    @defer.inlineCallbacks
+    def _scanProcessTables(self):
+        """
+        Return the process tables of the device. Every fullScanCycles
+        cycles all three tables are walked. In between only the name table
+        is walked, and the path and arguments are fetched for pids that are
+        new or whose name changed; the values of the other pids are taken
+        from the previous scans.
+        """
+        stats = self._deviceStats
+        if self._isFullScanDue():
+            tableResult = yield self._getTables([NAMETABLE, PATHTABLE, ARGSTABLE])
+            stats.scansSinceFullScan = 0
+            stats._pidTables = {}
+            if tableResult and tableResult.get(NAMETABLE):
+                for pid, name in _pidValues(tableResult[NAMETABLE]).iteritems():
+                    stats._pidTables[pid] = (
+                        name,
+                        tableResult.get(PATHTABLE, {}).get('%s.%d' % (PATHTABLE, pid), ''),
+                        tableResult.get(ARGSTABLE, {}).get('%s.%d' % (ARGSTABLE, pid), ''))
+            defer.returnValue(tableResult)
+
+        nameResult = yield self._getTables([NAMETABLE])
+        stats.scansSinceFullScan += 1
+        names = _pidValues(nameResult.get(NAMETABLE, {})) if nameResult else {}
+        newPids = [pid for pid, name in names.iteritems()
+                   if stats._pidTables.get(pid, (None,))[0] != name]
+        log.debug("%s: %d processes, %d new", self._devId, len(names), len(newPids))
+        if newPids:
+            oids = []
+            for pid in newPids:
+                oids.extend(['%s.%d' % (PATHTABLE, pid), '%s.%d' % (ARGSTABLE, pid)])
+            values = {}
+            for oidChunk in chunk(oids, self._maxOidsPerRequest):
+                result = yield self._get(oidChunk)
+                values.update(result)
+            for pid in newPids:
+                stats._pidTables[pid] = (
+                    names[pid],
+                    values.get('%s.%d' % (PATHTABLE, pid), ''),
+                    values.get('%s.%d' % (ARGSTABLE, pid), ''))
+
+        tableResult = {NAMETABLE: {}, PATHTABLE: {}, ARGSTABLE: {}}
+        for pid in names:
+            name, path, args = stats._pidTables[pid]
+            tableResult[NAMETABLE]['%s.%d' % (NAMETABLE, pid)] = name
+            tableResult[PATHTABLE]['%s.%d' % (PATHTABLE, pid)] = path
+            tableResult[ARGSTABLE]['%s.%d' % (ARGSTABLE, pid)] = args
+        defer.returnValue(tableResult)
+
     def _finished(self):
         """
         Callback activated when the task is complete
@@ -590,12 +699,10 @@ class ZenProcessTask(ObservableMixin):
 
         for pid, name_with_args in procs:
             log.debug("pid: %s --- name_with_args: %s" % (pid, name_with_args))
-            for pStats in self._deviceStats.processStats:
-                if pStats._config.name is not None:
-                    if pStats.matches(name_with_args):
-                        log.debug("Found process %s belonging to %s", name_with_args, pStats._config)
-                        afterPidToProcessStats[pid] = pStats
-                        break
+            pStats = self._deviceStats.match(pid, name_with_args)
+            if pStats is not None:
+                afterPidToProcessStats[pid] = pStats
+        self._deviceStats.forgetPids(pid for pid, unused in procs)
 
         afterPids = set(afterPidToProcessStats)
         afterByConfig = reverseDict(afterPidToProcessStats)
@@ -859,6 +966,13 @@ def mapResultsToDicts(showrawtables, results):
 
     return procs
 
+def _pidValues(table):
+    """
+    Map the pids of an SNMP process table to their values.
+    """
+    return dict((int(oid.rsplit('.', 1)[-1]), value)
+                for oid, value in table.iteritems())
+
 def reverseDict(d):
     """
     Return a dictionary with keys and values swapped:
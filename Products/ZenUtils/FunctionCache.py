@@ -82,8 +82,52 @@ class FunctionCache(object):
                     self._mc.add(hashKey, pickle.dumps(value), *self._add_args)
 
             return value
+        wrapped_f.cache = self
         return wrapped_f
 
+    def _ready(self):
+        if self._mc is None:
+            self._init_cache()
+        return self._mc is not CACHE_NOT_FOUND
+
+    def getMany(self, argsList):
+        """
+        Return a dict of args -> cached value for the argument tuples in
+        argsList that are in the cache, fetching them in one round trip.
+        Cached misses are returned as None.
+        """
+        if not self._ready():
+            return {}
+        keys = dict((_compose_key(self._cache_key, args, {}), args)
+                    for args in argsList)
+        found = {}
+        for hashKey, value in self._mc.get_multi(keys.keys()).iteritems():
+            if not value:
+                continue
+            value = pickle.loads(value)
+            if self._cache_miss_marker is not None \
+                    and value == self._cache_miss_marker:
+                value = None
+            found[keys[hashKey]] = value
+        return found
+
+    def addMany(self, values):
+        """
+        Cache a dict of args -> value in one round trip, as if the wrapped
+        function had been called with each argument tuple.
+        """
+        if not self._ready():
+            return
+        mapping = {}
+        for args, value in values.iteritems():
+            if value is None:
+                if self._cache_miss_marker is None:
+                    continue
+                value = self._cache_miss_marker
+            mapping[_compose_key(self._cache_key, args, {})] = pickle.dumps(value)
+        if mapping:
+            self._mc.set_multi(mapping, *self._add_args)
+
     def getCacheClient(self):
         """
         getCacheClient returns a tuple (cache_client, timeout) for the given
@@ -0,0 +1,293 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """LogFileCache
+
+A pickle cache kept in one append-only file instead of a file per key.
+"""
+
+import os
+import fcntl
+import struct
+import logging
+import threading
+import cPickle as pickle
+from zlib import crc32
+
+log = logging.getLogger("zen.LogFileCache")
+
+_DEFAULT_NOT_SPECIFIED = object()
+
+# magic, generation; the generation changes whenever the file is rewritten
+_FILE_HEADER = struct.Struct('!4s8s')
+_MAGIC = 'ZLFC'
+# crc32 of key and value, key length, value length
+_HEADER = struct.Struct('!iII')
+# value length of a record that deletes its key
+_DELETED = 0xffffffff
+
+
+class LogFileCache(object):
+    """
+    Dictionary-like cache of pickled values, stored as records appended to
+    a single file. Setting or deleting a key appends a record; the file is
+    rewritten without the obsolete records once they take up more space
+    than the live ones.
+
+    An index of key -> record position is kept in memory, so values are
+    only read and unpickled when they are asked for. The file is locked
+    while it is read or written, so several processes can share a cache;
+    each one picks up the records appended by the others. The file starts
+    with a random generation id that a compaction replaces, so the index
+    is rebuilt when another process has rewritten the file.
+    """
+
+    def __init__(self, filename, protocol=-1, compactMinBytes=1 << 20):
+        self.filename = filename
+        dirname = os.path.dirname(filename)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._pickleProtocol = protocol
+        self.compactMinBytes = compactMinBytes
+        self.lock = threading.Lock()
+        # key -> (offset of the value, length of the value)
+        self._index = {}
+        self._end = 0
+        self._garbage = 0
+        self._generation = None
+        self._torn = None
+
+    def _open(self, mode):
+        fd = os.open(self.filename, mode | os.O_CREAT, 0644)
+        return os.fdopen(fd, 'r+b' if mode & os.O_RDWR else 'rb')
+
+    def _scan(self, f, offset):
+        """
+        Read the records from offset to the end of the file into the index.
+        A torn record at the end, left by a writer that died, is ignored
+        and overwritten by the next write.
+        """
+        f.seek(offset)
+        data = f.read()
+        pos = 0
+        while pos + _HEADER.size <= len(data):
+            crc, keyLen, valueLen = _HEADER.unpack_from(data, pos)
+            start = pos + _HEADER.size
+            valueStart = start + keyLen
+            end = valueStart + (0 if valueLen == _DELETED else valueLen)
+            if end > len(data) or crc32(buffer(data, start, end - start)) != crc:
+                if self._torn != offset + pos:
+                    self._torn = offset + pos
+                    log.warn("Ignoring %d bytes at the end of %s",
+                             len(data) - pos, self.filename)
+                break
+            key = data[start:valueStart]
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._garbage += _HEADER.size + len(key) + previous[1]
+            if valueLen == _DELETED:
+                self._garbage += end - pos
+            else:
+                self._index[key] = (offset + valueStart, valueLen)
+            pos = end
+        self._end = offset + pos
+
+    def _fileHeader(self):
+        """
+        Return the header of a new file, with a new generation id.
+        """
+        return _FILE_HEADER.pack(_MAGIC, os.urandom(8))
+
+    def _refresh(self, f):
+        """
+        Bring the index up to date with the file, which may have been
+        appended to or compacted by another process. A file without a valid
+        header has no records, and is rewritten by the next write.
+        """
+        size = os.fstat(f.fileno()).st_size
+        generation = None
+        if size >= _FILE_HEADER.size:
+            f.seek(0)
+            magic, generation = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+            if magic != _MAGIC:
+                generation = None
+        if generation is None or generation != self._generation or size < self._end:
+            self._index.clear()
+            self._garbage = 0
+            self._generation = generation
+            self._end = 0 if generation is None else _FILE_HEADER.size
+        if generation is not None and size > self._end:
+            self._scan(f, self._end)
+
+    def _locked(self, exclusive=False):
+        """
+        Open the file and lock it, reopening it if it was replaced by a
+        compaction before the lock was granted.
+        """
+        while True:
+            f = self._open(os.O_RDWR if exclusive else os.O_RDONLY)
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                current = os.stat(self.filename).st_ino
+            except OSError:
+                current = None
+            if current == os.fstat(f.fileno()).st_ino:
+                self._refresh(f)
+                return f
+            f.close()
+
+    def _key(self, key):
+        return key.encode('utf-8') if isinstance(key, unicode) else key
+
+    def _record(self, key, value=_DEFAULT_NOT_SPECIFIED):
+        key = self._key(key)
+        if value is _DEFAULT_NOT_SPECIFIED:
+            data, valueLen = '', _DELETED
+        else:
+            data = pickle.dumps(value, self._pickleProtocol)
+            valueLen = len(data)
+        body = key + data
+        return _HEADER.pack(crc32(body), len(key), valueLen) + body
+
+    def _append(self, f, records):
+        if self._generation is None:
+            records = [self._fileHeader()] + list(records)
+        # drop a torn record left at the end
+        f.truncate(self._end)
+        f.seek(self._end)
+        f.write(''.join(records))
+        f.flush()
+        self._refresh(f)
+        live = self._end - self._garbage
+        if self._garbage > max(self.compactMinBytes, live):
+            self._compact(f)
+
+    def _compact(self, f):
+        """
+        Rewrite the file with only the live records. The new file replaces
+        the old one atomically.
+        """
+        tempName = self.filename + '.compact'
+        index = {}
+        header = self._fileHeader()
+        offset = len(header)
+        with open(tempName, 'wb') as out:
+            out.write(header)
+            for key, (start, length) in self._index.iteritems():
+                f.seek(start)
+                data = f.read(length)
+                body = key + data
+                out.write(_HEADER.pack(crc32(body), len(key), length) + body)
+                offset += _HEADER.size + len(key)
+                index[key] = (offset, length)
+                offset += length
+            out.flush()
+            os.fsync(out.fileno())
+        os.rename(tempName, self.filename)
+        log.debug("Compacted %s from %d to %d bytes",
+                  self.filename, self._end, offset)
+        self._index = index
+        self._end = offset
+        self._garbage = 0
+        self._generation = _FILE_HEADER.unpack(header)[1]
+
+    def _load(self, f, key):
+        start, length = self._index[key]
+        f.seek(start)
+        return pickle.loads(f.read(length))
+
+    def get(self, key, default=_DEFAULT_NOT_SPECIFIED):
+        key = self._key(key)
+        with self.lock:
+            with self._locked() as f:
+                if key in self._index:
+                    return self._load(f, key)
+        if default is _DEFAULT_NOT_SPECIFIED:
+            raise KeyError('no such key ' + key)
+        return default
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def __setitem__(self, key, value):
+        self.update(((key, value),))
+
+    def update(self, items):
+        """
+        Store many key/value pairs with a single write.
+        """
+        records = [self._record(key, value) for key, value in items]
+        if not records:
+            return
+        with self.lock:
+            with self._locked(exclusive=True) as f:
+                self._append(f, records)
+
+    def __delitem__(self, key):
+        key = self._key(key)
+        with self.lock:
+            with self._locked(exclusive=True) as f:
+                if key not in self._index:
+                    raise KeyError('no such key ' + key)
+                self._append(f, [self._record(key)])
+
+    def clear(self):
+        with self.lock:
+            with self._locked(exclusive=True) as f:
+                if self._index:
+                    self._append(f, [self._record(key) for key in self._index])
+
+    def compact(self):
+        with self.lock:
+            with self._locked(exclusive=True) as f:
+                self._compact(f)
+
+    def keys(self):
+        with self.lock:
+            with self._locked():
+                return self._index.keys()
+
+    def iterkeys(self):
+        return iter(self.keys())
+
+    def items(self):
+        """
+        Return all key/value pairs, reading the file in one go.
+        """
+        with self.lock:
+            with self._locked() as f:
+                index = sorted(self._index.iteritems(), key=lambda i: i[1][0])
+                f.seek(0)
+                data = f.read(self._end)
+        return [(key, pickle.loads(data[start:start + length]))
+                for key, (start, length) in index]
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def values(self):
+        return [value for key, value in self.items()]
+
+    def itervalues(self):
+        return iter(self.values())
+
+    def __contains__(self, key):
+        key = self._key(key)
+        with self.lock:
+            with self._locked():
+                return key in self._index
+
+    def __len__(self):
+        with self.lock:
+            with self._locked():
+                return len(self._index)
+
+    def __bool__(self):
+        return len(self) > 0
+    __nonzero__ = __bool__
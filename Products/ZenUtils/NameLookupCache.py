@@ -0,0 +1,113 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+__doc__ = """NameLookupCache
+
+Cache of reverse DNS lookups for collector daemons that resolve the source
+address of every datagram they receive.
+"""
+
+import time
+import logging
+from collections import OrderedDict
+
+from twisted.internet import defer
+
+from Products.ZenUtils.IpUtil import asyncNameLookup
+
+log = logging.getLogger("zen.NameLookupCache")
+
+
+class NameLookupCache(object):
+    """
+    Bounded cache of address to hostname lookups. Names are kept for ttl
+    seconds and failed lookups for negativeTtl seconds. When the cache is
+    full the least recently used address is dropped. Lookups of an address
+    that is already being resolved wait for that lookup instead of starting
+    another one.
+    """
+
+    def __init__(self, maxEntries=10000, ttl=3600, negativeTtl=300,
+                 lookup=asyncNameLookup, clock=time.time):
+        self.maxEntries = maxEntries
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self._lookup = lookup
+        self._clock = clock
+        # address -> (expires, hostname, exception)
+        self._entries = OrderedDict()
+        # address -> deferreds waiting for the lookup in progress
+        self._inflight = {}
+        self.hits = 0
+        self.negativeHits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, address):
+        """
+        Return a deferred that fires with the hostname of address, or fails
+        if the address could not be resolved.
+        """
+        entry = self._entries.pop(address, None)
+        if entry is not None:
+            expires, hostname, error = entry
+            if expires > self._clock():
+                self._entries[address] = entry
+                if error is not None:
+                    self.negativeHits += 1
+                    return defer.fail(error)
+                self.hits += 1
+                return defer.succeed(hostname)
+        d = defer.Deferred()
+        waiting = self._inflight.get(address)
+        if waiting is not None:
+            self.coalesced += 1
+            waiting.append(d)
+            return d
+        self.misses += 1
+        self._inflight[address] = [d]
+        lookup = defer.maybeDeferred(self._lookup, address)
+        lookup.addCallbacks(self._resolved, self._failed,
+                            callbackArgs=(address,), errbackArgs=(address,))
+        return d
+
+    def _store(self, address, entry):
+        self._entries[address] = entry
+        while len(self._entries) > self.maxEntries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _resolved(self, hostname, address):
+        if self.ttl > 0:
+            self._store(address, (self._clock() + self.ttl, hostname, None))
+        for d in self._inflight.pop(address, ()):
+            d.callback(hostname)
+
+    def _failed(self, reason, address):
+        log.debug("Unable to resolve %s: %s", address,
+                  reason.getErrorMessage())
+        error = reason.value
+        if self.negativeTtl > 0:
+            self._store(address,
+                        (self._clock() + self.negativeTtl, None, error))
+        for d in self._inflight.pop(address, ()):
+            d.errback(error)
+
+    def stats(self):
+        """
+        Return a one line summary of the cache statistics.
+        """
+        return ("Hostname cache: %d entries, %d hits, %d negative hits, "
+                "%d misses, %d lookups coalesced, %d evictions" % (
+                    len(self._entries), self.hits, self.negativeHits,
+                    self.misses, self.coalesced, self.evictions))
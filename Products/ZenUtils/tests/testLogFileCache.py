@@ -0,0 +1,97 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import os
+import shutil
+import tempfile
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenUtils.LogFileCache import LogFileCache
+
+
+class LogFileCacheTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(LogFileCacheTest, self).afterSetUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'cache', 'configs.log')
+
+    def beforeTearDown(self):
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+        super(LogFileCacheTest, self).beforeTearDown()
+
+    def testSetGetDelete(self):
+        cache = LogFileCache(self.filename)
+        cache['a'] = {'oids': [1, 2]}
+        cache['b'] = 'second'
+        cache['a'] = {'oids': [3]}
+        self.assertEquals({'oids': [3]}, cache['a'])
+        self.assertEquals(2, len(cache))
+        del cache['b']
+        self.assertFalse('b' in cache)
+        self.assertRaises(KeyError, cache.__getitem__, 'b')
+        self.assertRaises(KeyError, cache.__delitem__, 'b')
+        self.assertEquals('default', cache.get('b', 'default'))
+        self.assertEquals([('a', {'oids': [3]})], cache.items())
+
+    def testRecordsArePersistedAndShared(self):
+        cache = LogFileCache(self.filename)
+        cache.update(('dev%d' % i, i) for i in range(5))
+        other = LogFileCache(self.filename)
+        self.assertEquals(range(5), sorted(other.values()))
+        other['dev1'] = 'changed'
+        del other['dev2']
+        self.assertEquals('changed', cache['dev1'])
+        self.assertEquals(4, len(cache))
+
+    def testCompaction(self):
+        cache = LogFileCache(self.filename, compactMinBytes=0)
+        for i in range(20):
+            cache['dev'] = 'x' * 100 + str(i)
+        self.assertTrue(os.path.getsize(self.filename) < 300)
+        other = LogFileCache(self.filename)
+        self.assertEquals('x' * 100 + '19', other['dev'])
+        cache.compact()
+        self.assertEquals(['dev'], other.keys())
+
+    def testRepeatedCompactionIsNoticed(self):
+        cache = LogFileCache(self.filename, compactMinBytes=1 << 30)
+        cache.update(('dev%d' % i, 'v' * i) for i in range(10))
+        other = LogFileCache(self.filename)
+        self.assertEquals(10, len(other))
+        # the file may get its old inode back after two compactions
+        for i in range(10):
+            del cache['dev%d' % i]
+        cache.compact()
+        cache.update(('dev%d' % i, 'w' * (10 - i)) for i in range(10))
+        cache.compact()
+        cache['dev10'] = 'new'
+        for i in range(10):
+            self.assertEquals('w' * (10 - i), other['dev%d' % i])
+        self.assertEquals('new', other['dev10'])
+        self.assertEquals(11, len(other))
+
+    def testTornRecordIsIgnored(self):
+        cache = LogFileCache(self.filename)
+        cache['a'] = 1
+        cache['b'] = 2
+        with open(self.filename, 'r+b') as f:
+            f.truncate(os.path.getsize(self.filename) - 1)
+        reopened = LogFileCache(self.filename)
+        self.assertEquals(['a'], reopened.keys())
+        reopened['c'] = 3
+        self.assertEquals([('a', 1), ('c', 3)],
+                          LogFileCache(self.filename).items())
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(LogFileCacheTest))
+    return suite
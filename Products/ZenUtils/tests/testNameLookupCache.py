@@ -0,0 +1,99 @@
+##############################################################################
+#
+# Copyright (C) Zenoss, Inc. 2016, all rights reserved.
+#
+# This content is made available according to terms specified in
+# License.zenoss under the directory where your Zenoss product is installed.
+#
+##############################################################################
+
+import socket
+
+from twisted.internet import defer
+
+from Products.ZenTestCase.BaseTestCase import BaseTestCase
+from Products.ZenUtils.NameLookupCache import NameLookupCache
+
+
+class FakeResolver(object):
+
+    def __init__(self):
+        self.pending = {}
+        self.calls = []
+
+    def __call__(self, address):
+        self.calls.append(address)
+        d = self.pending[address] = defer.Deferred()
+        return d
+
+
+class NameLookupCacheTest(BaseTestCase):
+
+    def afterSetUp(self):
+        super(NameLookupCacheTest, self).afterSetUp()
+        self.now = 1000.0
+        self.resolver = FakeResolver()
+        self.cache = NameLookupCache(maxEntries=2, ttl=60, negativeTtl=10,
+                                     lookup=self.resolver,
+                                     clock=lambda: self.now)
+
+    def _result(self, d):
+        results = []
+        d.addBoth(results.append)
+        return results
+
+    def testHitsAreServedFromTheCache(self):
+        first = self._result(self.cache.lookup('10.0.0.1'))
+        self.resolver.pending['10.0.0.1'].callback('host1')
+        second = self._result(self.cache.lookup('10.0.0.1'))
+        self.assertEquals(['host1'], first)
+        self.assertEquals(['host1'], second)
+        self.assertEquals(['10.0.0.1'], self.resolver.calls)
+        self.assertEquals((1, 1), (self.cache.hits, self.cache.misses))
+
+    def testConcurrentLookupsAreCoalesced(self):
+        results = [self._result(self.cache.lookup('10.0.0.1'))
+                   for i in range(3)]
+        self.resolver.pending['10.0.0.1'].callback('host1')
+        self.assertEquals([['host1']] * 3, results)
+        self.assertEquals(['10.0.0.1'], self.resolver.calls)
+        self.assertEquals(2, self.cache.coalesced)
+
+    def testFailuresAreCachedForNegativeTtl(self):
+        first = self._result(self.cache.lookup('10.0.0.1'))
+        self.resolver.pending['10.0.0.1'].errback(socket.herror('unknown'))
+        second = self._result(self.cache.lookup('10.0.0.1'))
+        self.assertTrue(first[0].check(socket.herror))
+        self.assertTrue(second[0].check(socket.herror))
+        self.assertEquals(1, self.cache.negativeHits)
+        self.now += 11
+        self.cache.lookup('10.0.0.1')
+        self.assertEquals(['10.0.0.1'] * 2, self.resolver.calls)
+
+    def testEntriesExpire(self):
+        self.cache.lookup('10.0.0.1')
+        self.resolver.pending['10.0.0.1'].callback('host1')
+        self.now += 61
+        self.cache.lookup('10.0.0.1')
+        self.assertEquals(['10.0.0.1'] * 2, self.resolver.calls)
+
+    def testLeastRecentlyUsedAddressIsEvicted(self):
+        for address in ('10.0.0.1', '10.0.0.2'):
+            self.cache.lookup(address)
+            self.resolver.pending[address].callback(address)
+        self.cache.lookup('10.0.0.1')
+        self.cache.lookup('10.0.0.3')
+        self.resolver.pending['10.0.0.3'].callback('host3')
+        self.assertEquals(2, len(self.cache))
+        self.assertEquals(1, self.cache.evictions)
+        self.cache.lookup('10.0.0.1')
+        self.assertEquals(3, len(self.resolver.calls))
+        self.cache.lookup('10.0.0.2')
+        self.assertEquals(4, len(self.resolver.calls))
+
+
+def test_suite():
+    from unittest import TestSuite, makeSuite
+    suite = TestSuite()
+    suite.addTest(makeSuite(NameLookupCacheTest))
+    return suite
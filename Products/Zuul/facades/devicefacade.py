@@ -46,12 +46,33 @@ from Products.ZenUtils.Utils import getObjectsFromCatalog
 from Products.ZenEvents.Event import Event
 from Products.ZenUtils.Utils import binPath, zenPath
 from Acquisition import aq_base
+from Products.Zuul.infos import InfoBase
 from Products.Zuul.infos.metricserver import MultiContextMetricServiceGraphDefinition
 
 
 iszprop = re.compile("z[A-Z]").match
 log = logging.getLogger('zen.DeviceFacade')
 
+# component info attributes that are also stored as componentSearch
+# metadata, so components can be sorted and filtered on their brains
+COMPONENT_COLUMNS = {
+    'name': 'titleOrId',
+    'id': 'id',
+    'description': 'description',
+    'meta_type': 'meta_type',
+}
+
+# component info attributes that are never used to filter components
+NON_SEARCHABLE = ('uid', 'uuid', 'events', 'status', 'severity')
+
+
+def _componentSortValue(val):
+    # Pad numeric values with 0's so that sort is
+    # both alphabetically and numerically correct.
+    # eth1/1  will sort on eth0000000001/0000000001
+    # eth1/12 will sort on eth0000000001/0000000012
+    return re.sub("[\d]+", lambda x:str.zfill(x.group(0),10), val)
+
 
 class DeviceCollectorChangeEvent(object):
     implements(IDeviceCollectorChangeEvent)
@@ -137,7 +158,7 @@ class DeviceFacade(TreeFacade):
             keep = False
             for key in keys:
                 # non searchable fields
-                if key in ('uid', 'uuid', 'events', 'status', 'severity'):
+                if key in NON_SEARCHABLE:
                     continue
                 val = getattr(comp, key, None)
                 if not val:
@@ -172,46 +193,103 @@ class DeviceFacade(TreeFacade):
             obj.device()._createComponentSearchPathIndex()
         brains = cat.evalAdvancedQuery(query)
 
-        # unbrain the results
-        comps=map(IInfo, map(unbrain, brains))
-
-
-        # filter the components
-        if name is not None:
-            comps = self._filterComponents(comps, keys, name)
-
-        total = len(comps)
-        hash_ = str(total)
-
-        def componentSortKey(parent):
-            val = getattr(parent, sort)
-            if val:
-                if isinstance(val, list):
-                    val = val[0]
-                if callable(val):
-                    val = val()
-                if IInfo.providedBy(val):
-                    val = val.name
-            # Pad numeric values with 0's so that sort is
-            # both alphabetically and numerically correct.
-            # eth1/1  will sort on eth0000000001/0000000001
-            # eth1/12 will sort on eth0000000001/0000000012
-            return re.sub("[\d]+", lambda x:str.zfill(x.group(0),10), val) 
-
-        # sort the components
-        sortedResults = list(sorted(comps, key=componentSortKey, reverse=reverse))
-
-        # limit the search results to the specified range
-        if limit is None:
-            pagedResult = sortedResults[start:]
+        columns = self._componentColumns(cat, brains, sort, keys, name)
+        if columns is not None:
+            # sort, filter and page the brains; only the components on the
+            # requested page are loaded
+            if name is not None:
+                brains = self._filterComponentBrains(brains, columns, keys, name)
+            total = len(brains)
+            column = columns[sort]
+            brains = sorted(brains, reverse=reverse,
+                    key=lambda b: _componentSortValue(getattr(b, column) or ''))
+            if limit is None:
+                brains = brains[start:]
+            else:
+                brains = brains[start:start + limit]
+            pagedResult = map(IInfo, map(unbrain, brains))
         else:
-            pagedResult = sortedResults[start:start + limit]
+            # unbrain the results
+            comps=map(IInfo, map(unbrain, brains))
+
+            # filter the components
+            if name is not None:
+                comps = self._filterComponents(comps, keys, name)
+
+            total = len(comps)
+
+            def componentSortKey(parent):
+                val = getattr(parent, sort)
+                if val:
+                    if isinstance(val, list):
+                        val = val[0]
+                    if callable(val):
+                        val = val()
+                    if IInfo.providedBy(val):
+                        val = val.name
+                return _componentSortValue(val)
+
+            # sort the components
+            sortedResults = list(sorted(comps, key=componentSortKey, reverse=reverse))
+
+            # limit the search results to the specified range
+            if limit is None:
+                pagedResult = sortedResults[start:]
+            else:
+                pagedResult = sortedResults[start:start + limit]
+        hash_ = str(total)
 
         # fetch any rrd data necessary
         self.bulkLoadMetricData(pagedResult)
 
         return SearchResults(iter(pagedResult), total, hash_, False)
 
+    def _componentColumns(self, cat, brains, sort, keys, name):
+        """
+        Return the componentSearch metadata columns holding the info
+        attributes the components are sorted and filtered on, or None if any
+        of them is not in the catalog. One component of each meta_type is
+        loaded to check that its info does not compute these attributes
+        differently from InfoBase.
+        """
+        attrs = set([sort])
+        if name is not None:
+            attrs.update(key for key in keys if key not in NON_SEARCHABLE)
+        schema = cat.schema()
+        columns = {}
+        for attr in attrs:
+            column = COMPONENT_COLUMNS.get(attr)
+            if column is None or column not in schema:
+                return None
+            columns[attr] = column
+        checked = set()
+        for brain in brains:
+            if brain.meta_type in checked:
+                continue
+            checked.add(brain.meta_type)
+            infoClass = type(IInfo(unbrain(brain)))
+            for attr in attrs:
+                if getattr(infoClass, attr, None) is not getattr(InfoBase, attr):
+                    return None
+        return columns
+
+    def _filterComponentBrains(self, brains, columns, keys, query):
+        """
+        Brain counterpart of _filterComponents: returns the brains where one
+        of the metadata columns for keys contains the query
+        (case-insensitive).
+        """
+        results = []
+        query = query.lower()
+        keys = [columns[key] for key in keys if key not in NON_SEARCHABLE]
+        for brain in brains:
+            for key in keys:
+                val = getattr(brain, key, None)
+                if val and query in str(val).lower():
+                    results.append(brain)
+                    break
+        return results
+
     def getComponents(self, uid=None, types=(), meta_type=(), start=0,
                       limit=None, sort='name', dir='ASC', name=None, keys=()):
         return self._componentSearch(uid, types, meta_type, start, limit,
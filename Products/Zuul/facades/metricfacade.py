@@ -13,6 +13,7 @@ import re
 import os
 import sys
 import itertools
+import threading
 
 from collections import defaultdict
 from datetime import datetime, timedelta
@@ -23,6 +24,7 @@ from Products.ZenUtils.GlobalConfig import getGlobalConfiguration
 from Products.Zuul.interfaces import IAuthorizationTool
 from Products.Zuul.utils import safe_hasattr
 from Products.ZenUtils import metrics
+from Products.ZenUtils import Map
 
 DEFAULT_METRIC_URL = 'http://localhost:8080/'
 Z_AUTH_TOKEN = 'ZAuthToken'
@@ -44,8 +46,13 @@ AGGREGATION_MAPPING = {
     'last': None
 }
 
+# seconds the last value of a metric is reused for; 0 disables the cache
+DEFAULT_LAST_VALUE_TTL = 10
+
 _devname_pattern = re.compile('Devices/([^/]+)')
 
+_MISSING = object()
+
 
 def _isRunningFromUI(context):
     if not safe_hasattr(context, 'REQUEST'):
@@ -162,6 +169,102 @@ class MetricConnection(object):
             log.error('Error connecting with request: %s \n%s', request, e)
 
 
+class LastValueCache(object):
+    """
+    Process-wide cache of the last values of metrics. A thread asking for
+    values that another thread is fetching waits for that fetch instead of
+    sending the same request again.
+    """
+
+    def __init__(self, ttl, timeout=10):
+        self.ttl = ttl
+        self.timeout = timeout
+        self._values = Map.Timed({}, ttl)
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def getValues(self, keys, fetch):
+        """
+        Return a dict of key -> value for keys. fetch is called with the keys
+        that are neither cached nor being fetched, and returns a dict of their
+        values (None for a metric without a value), or None if the request
+        failed. Keys that could not be fetched are left out.
+        """
+        values = {}
+        missing = []
+        pending = set()
+        with self._lock:
+            for key in keys:
+                value = self._values.get(key, _MISSING)
+                if value is not _MISSING:
+                    values[key] = value
+                elif key in self._inflight:
+                    pending.add(self._inflight[key])
+                else:
+                    missing.append(key)
+            done = threading.Event()
+            for key in missing:
+                self._inflight[key] = done
+
+        if missing:
+            fetched = None
+            try:
+                fetched = fetch(missing)
+            finally:
+                with self._lock:
+                    if fetched is not None:
+                        self._values.update(
+                            dict((key, fetched.get(key)) for key in missing))
+                    for key in missing:
+                        self._inflight.pop(key, None)
+                done.set()
+            if fetched is not None:
+                values.update((key, fetched.get(key)) for key in missing)
+
+        if pending:
+            for event in pending:
+                event.wait(self.timeout)
+            with self._lock:
+                for key in keys:
+                    if key not in values:
+                        value = self._values.get(key, _MISSING)
+                        if value is not _MISSING:
+                            values[key] = value
+        return values
+
+
+_lastValueCache = None
+
+
+def getLastValueCache():
+    """
+    Return the process-wide LastValueCache, which keeps values for
+    metric-last-value-ttl seconds (global.conf).
+    """
+    global _lastValueCache
+    if _lastValueCache is None:
+        ttl = float(getGlobalConfiguration().get('metric-last-value-ttl',
+                                                 DEFAULT_LAST_VALUE_TTL))
+        _lastValueCache = LastValueCache(ttl)
+    return _lastValueCache
+
+
+class _DataPointMap(dict):
+    """
+    metric -> first of the (name, datapoint) pairs whose name contains the
+    metric, filled in as metrics are looked up.
+    """
+
+    def __init__(self, names):
+        super(_DataPointMap, self).__init__()
+        self._names = names
+
+    def __missing__(self, metric):
+        dp = next((dp for name, dp in self._names if metric in name), None)
+        self[metric] = dp
+        return dp
+
+
 class MetricFacade(ZuulFacade):
 
     def __init__(self, context):
@@ -192,6 +295,8 @@ class MetricFacade(ZuulFacade):
         self._metrics_connection = MetricConnection(auth_token, credentials,
                                                     global_credentials,
                                                     agent_suffix)
+        # template path -> {metric: first datapoint whose name contains it}
+        self._dataPointMaps = {}
 
     def getLastValue(self, context, metric):
         """
@@ -303,34 +408,32 @@ class MetricFacade(ZuulFacade):
             else:
                 subjects.append(context)
 
-        # build the metrics section of the query
-        datapoints = []
+        dps = []
         metricnames = {}
         for ds in metrics:
             # find the first occurrence of a datapoint on a context.
             # in theory it is possible that a passed in metric exists on one context
             # but not another.
-            for subject in subjects:
-                dp = next(
-                    (
-                        d
-                        for d in subject._getRRDDataPointsGen()
-                        if ds in d.name()
-                    ),
-                    None
-                )
-                if dp is None:
-                    continue
-                else:
-                    # we have found a definition for a datapoint, use it and continue on
-                    metricnames[dp.name()] = ds
-                    for subject in subjects:
-                        datapoints.extend(self._buildMetric(subject, dp, cf, extraRpn, format))
-                    break
+            dp = self._getDataPoint(subjects, ds)
+            if dp is not None:
+                metricnames[dp.name()] = ds
+                dps.append(dp)
         # no valid datapoint names were entered
-        if not datapoints:
+        if not dps:
             return {}
 
+        cache = getLastValueCache()
+        if returnSet == "LAST" and start is None and end is None \
+                and downsample is None and cache.ttl > 0:
+            return self._cachedLastValues(cache, subjects, dps, metricnames,
+                                          format, extraRpn, cf)
+
+        # build the metrics section of the query
+        datapoints = []
+        for dp in dps:
+            for subject in subjects:
+                datapoints.extend(self._buildMetric(subject, dp, cf, extraRpn, format))
+
         start, end = self._defaultStartAndEndTime(start, end, returnSet)
         request = self._buildRequest(subjects, datapoints, start, end, returnSet, downsample)
         # submit it to the client
@@ -357,6 +460,43 @@ class MetricFacade(ZuulFacade):
                 return content
             return content.get('results')
 
+    def _cachedLastValues(self, cache, subjects, dps, metricnames, format,
+                          extraRpn, cf):
+        """
+        Return the last values of the datapoints on the subjects in the form
+        queryServer does, only asking the metric service for the values
+        that are not in the cache.
+        """
+        pairs = {}
+        for dp in dps:
+            for subject in subjects:
+                key = (subject.getResourceKey(), dp.name(), cf, extraRpn, format)
+                pairs[key] = (subject, dp)
+
+        def fetch(keys):
+            datapoints = []
+            for key in keys:
+                subject, dp = pairs[key]
+                datapoints.extend(self._buildMetric(subject, dp, cf, extraRpn, format))
+            start, end = self._defaultStartAndEndTime(None, None, "LAST")
+            request = self._buildRequest(subjects, datapoints, start, end, "LAST", None)
+            content = self._metrics_connection.request(METRIC_URL_PATH, request)
+            if not content or content.get('results') is None:
+                return None
+            values = {}
+            for item in content['results']:
+                key, metric = item['metric'].split('|', 1)
+                if item.get('datapoints'):
+                    values[(key, metric, cf, extraRpn, format)] = \
+                        float(format % item['datapoints'][0]['value'])
+            return values
+
+        results = defaultdict(dict)
+        for key, value in cache.getValues(pairs.keys(), fetch).iteritems():
+            if value is not None:
+                results[key[0]][metricnames[key[1]]] = value
+        return results
+
     def _buildRequest(self, contexts, metrics, start, end, returnSet, downsample):
         request = {
             'returnset': returnSet,
@@ -466,20 +606,30 @@ class MetricFacade(ZuulFacade):
         return content['series']
 
     def _getDataPoint(self, devices, metric):
+        """
+        Return the first datapoint on the templates of devices whose name
+        contains metric, or None.
+        """
         for subject in devices:
-            dp = next(
-                (
-                    d
-                    for d in subject._getRRDDataPointsGen()
-                    if metric in d.name()
-                ),
-                None
-            )
-            if dp is not None:
-                return dp
-
+            for template in subject.getRRDTemplates():
+                dp = self._dataPointMap(template)[metric]
+                if dp is not None:
+                    return dp
         return None
 
+    def _dataPointMap(self, template):
+        """
+        Return a dict that maps a metric to the first datapoint of template
+        whose name contains it. Datapoint names are only read once per
+        template; each metric is looked up once.
+        """
+        path = template.getPrimaryId()
+        dpmap = self._dataPointMaps.get(path)
+        if dpmap is None:
+            names = [(dp.name(), dp) for dp in template.getRRDDataPoints()]
+            dpmap = self._dataPointMaps[path] = _DataPointMap(names)
+        return dpmap
+
     def getMetricsForDevices(self, devices, metrics, start=None,
                              end=None, format="%.2lf", cf="avg",
                              downsample=None, timeout=10, isRate=False):
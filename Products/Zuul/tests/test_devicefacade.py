@@ -169,6 +169,29 @@ class DeviceFacadeTest(ZuulFacadeTestCase):
 
         zope.component.getGlobalSiteManager().unregisterHandler(_indexed)
 
+    def test_getComponentsSortsAndPagesBrains(self):
+        dev = self.dmd.Devices.createInstance('dev')
+        for id in ('eth1/12', 'eth1/2', 'eth0', 'lo'):
+            dev.os.addIpInterface(id, True)
+        uid = dev.getPrimaryId()
+        loaded = []
+        self.facade.bulkLoadMetricData = loaded.extend
+        results = self.facade.getComponents(uid, start=1, limit=2)
+        self.assertEquals(4, results.total)
+        self.assertEquals(['eth1/2', 'eth1/12'], [c.id for c in results])
+        self.assertEquals(2, len(loaded))
+
+        results = self.facade.getComponents(uid, dir='DESC', name='ETH1',
+                                            keys=('name', 'description'))
+        self.assertEquals(2, results.total)
+        self.assertEquals(['eth1/12', 'eth1/2'], [c.id for c in results])
+
+        # without metadata the components are loaded to sort them
+        self.facade._componentColumns = lambda *args: None
+        results = self.facade.getComponents(uid, dir='DESC', name='ETH1',
+                                            keys=('name', 'description'))
+        self.assertEquals(['eth1/12', 'eth1/2'], [c.id for c in results])
+
 def test_suite():
     return unittest.TestSuite((unittest.makeSuite(DeviceFacadeTest),))
 
@@ -14,6 +14,7 @@ from Products.ZenTestCase.BaseTestCase import BaseTestCase
 from Products.ZenModel.ThresholdGraphPoint import ThresholdGraphPoint
 from Products.ZenModel.RRDTemplate import RRDTemplate
 from Products.ZenModel.GraphDefinition import GraphDefinition
+from Products.Zuul.facades import metricfacade
 from zenoss.protocols.services import JsonRestServiceClient
 
 class MockRestServiceClient(JsonRestServiceClient):
@@ -21,6 +22,17 @@ class MockRestServiceClient(JsonRestServiceClient):
     def _executeRequest(self, request):
         return 200, '[2]'
 
+class MockMetricConnection(object):
+
+    def __init__(self):
+        self.requests = []
+
+    def request(self, path, request, timeout=10):
+        self.requests.append(request)
+        return {'results': [
+            {'metric': metric['name'], 'datapoints': [{'value': 42}]}
+            for metric in request['metrics']]}
+
 class MetricFacadeTest(BaseTestCase):
 
     def afterSetUp(self):
@@ -28,6 +40,10 @@ class MetricFacadeTest(BaseTestCase):
         self.facade = Zuul.getFacade('metric', self.dmd)
         self.facade._client = MockRestServiceClient('http://localhost:8888')
 
+    def beforeTearDown(self):
+        metricfacade._lastValueCache = None
+        super(MetricFacadeTest, self).beforeTearDown()
+
     def testTagBuilder(self):
         dev = self.dmd.Devices.createInstance('device1')
         self.assertTrue(dev.getResourceKey())
@@ -52,6 +68,35 @@ class MetricFacadeTest(BaseTestCase):
         request = self.facade._buildRequest([dev], metric, None, None, "LAST", "1m-avg")
         self.assertEquals(request['returnset'], 'LAST')
 
+    def testQueryServerCachesLastValues(self):
+        metricfacade._lastValueCache = metricfacade.LastValueCache(60)
+        connection = self.facade._metrics_connection = MockMetricConnection()
+        dev = self.dmd.Devices.createInstance('device1')
+        templateFac = Zuul.getFacade('template', self.dmd)
+        template = templateFac.addTemplate('test', '/zport/dmd/Devices')._object
+        templateFac.addDataSource(template.getPrimaryId(), 'test', 'SNMP')
+        dev.bindTemplates(['test'])
+        expected = {dev.getResourceKey(): {'test': 42.0}}
+        self.assertEquals(expected, self.facade.getMultiValues([dev], ['test']))
+        self.assertEquals(expected, self.facade.getMultiValues([dev], ['test']))
+        self.assertEquals(1, len(connection.requests))
+        self.facade.getMultiValues([dev], ['test'], start=0)
+        self.assertEquals(2, len(connection.requests))
+
+    def testLastValueCacheOnlyFetchesMissingKeys(self):
+        cache = metricfacade.LastValueCache(60)
+        fetched = []
+        def fetch(keys):
+            fetched.append(sorted(keys))
+            return dict((key, 1.0) for key in keys if key != 'b')
+        self.assertEquals({'a': 1.0, 'b': None}, cache.getValues(['a', 'b'], fetch))
+        self.assertEquals({'a': 1.0, 'b': None, 'c': 1.0},
+                          cache.getValues(['a', 'b', 'c'], fetch))
+        self.assertEquals([['a', 'b'], ['c']], fetched)
+        # failed requests are not cached
+        self.assertEquals({}, cache.getValues(['d'], lambda keys: None))
+        self.assertEquals({'d': 1.0}, cache.getValues(['d'], fetch))
+
     def testMetricServiceGraphDefinitionProjections(self):
         device = self.dmd.Devices.createInstance('test')
         template = RRDTemplate('test')